@@ -1,5 +1,6 @@
 """Authentication module for MCP Server"""
 
+import hmac
 import logging
 from typing import Dict
 from starlette.requests import Request
@@ -7,8 +8,25 @@ from config import settings
 
 logger = logging.getLogger(__name__)
 
+# Expected token encoded once at import; compared with hmac.compare_digest
+_EXPECTED_TOKEN = settings.MCP_AUTH_TOKEN.encode("utf-8") if settings.MCP_AUTH_TOKEN else None
 
-def authenticate_request(request: Request) -> Dict[str, any]:
+# Constant auth results (read-only, shared across requests)
+_DEV_MODE_RESULT = {"authenticated": True, "reason": "dev_mode"}
+_VALID_TOKEN_RESULT = {"authenticated": True, "reason": "valid_token"}
+_NO_TOKEN_RESULT = {"authenticated": False, "reason": "No authentication token provided"}
+_INVALID_TOKEN_RESULT = {"authenticated": False, "reason": "Invalid authentication token"}
+
+_BEARER = b"Bearer "
+_BEARER_LEN = len(_BEARER)
+
+
+def _authenticate_dev(request: Request) -> Dict[str, any]:
+    """Development mode: no MCP_AUTH_TOKEN configured, allow all requests"""
+    return _DEV_MODE_RESULT
+
+
+def _authenticate_prod(request: Request) -> Dict[str, any]:
     """
     Authenticate incoming MCP request using token-based auth
     
@@ -18,37 +36,40 @@ def authenticate_request(request: Request) -> Dict[str, any]:
     Returns:
         Dict with 'authenticated' (bool) and 'reason' (str) keys
     """
-    # If no token configured, allow all (development mode)
-    if not settings.MCP_AUTH_TOKEN:
-        logger.warning("⚠️  Authentication disabled - no MCP_AUTH_TOKEN set!")
-        return {"authenticated": True, "reason": "dev_mode"}
-    
-    # Check for token in header
-    auth_header = request.headers.get("Authorization")
-    token_header = request.headers.get("X-MCP-Token")
+    # Single pass over the raw header list (ASGI header names are lowercase);
+    # values stay as bytes and are compared against the encoded token
+    auth_header = None
+    token_header = None
+    for key, value in request.headers.raw:
+        if key == b"authorization" and auth_header is None:
+            auth_header = value
+        elif key == b"x-mcp-token" and token_header is None:
+            token_header = value
     
     # Support both Authorization: Bearer <token> and X-MCP-Token: <token>
     token = None
-    if auth_header and auth_header.startswith("Bearer "):
-        token = auth_header.split(" ")[1]
+    if auth_header and auth_header.startswith(_BEARER):
+        token = auth_header[_BEARER_LEN:]
     elif token_header:
         token = token_header
     
     if not token:
-        return {
-            "authenticated": False,
-            "reason": "No authentication token provided"
-        }
+        return _NO_TOKEN_RESULT
     
-    # Validate token
-    if token != settings.MCP_AUTH_TOKEN:
-        logger.warning(f"Invalid token attempt from {request.client.host}")
-        return {
-            "authenticated": False,
-            "reason": "Invalid authentication token"
-        }
+    # Validate token (constant-time comparison)
+    if not hmac.compare_digest(token, _EXPECTED_TOKEN):
+        logger.warning("Invalid token attempt from %s", request.client.host)
+        return _INVALID_TOKEN_RESULT
     
-    return {"authenticated": True, "reason": "valid_token"}
+    return _VALID_TOKEN_RESULT
+
+
+# Auth mode is fixed for the process lifetime, so pick the implementation once
+if _EXPECTED_TOKEN is None:
+    logger.warning("⚠️  Authentication disabled - no MCP_AUTH_TOKEN set!")
+    authenticate_request = _authenticate_dev
+else:
+    authenticate_request = _authenticate_prod
 
 
 def require_auth(func):
@@ -1,7 +1,9 @@
 """Configuration management for Kali MCP Server"""
 
+import ipaddress
 import os
-from typing import Optional
+from typing import Any, Optional
+from pydantic import PrivateAttr
 from pydantic_settings import BaseSettings
 
 
@@ -24,7 +26,26 @@ class Settings(BaseSettings):
     # Tool paths (override if custom installation)
     NMAP_PATH: str = "/usr/bin/nmap"
     UFW_PATH: str = "/usr/sbin/ufw"
+    IPSET_PATH: str = "/usr/sbin/ipset"
+    IPTABLES_PATH: str = "/usr/sbin/iptables"
     SYSTEMCTL_PATH: str = "/usr/bin/systemctl"
+    # Restart services over D-Bus instead of `sudo systemctl`. Off by default:
+    # polkit normally refuses it for the unprivileged service user
+    SYSTEMD_DBUS_RESTART: bool = False
+    
+    # IP blocking (kernel ipset referenced by a single iptables DROP rule)
+    IPSET_NAME: str = "autoshield-blacklist"
+    BLOCK_BATCH_INTERVAL: float = 0.1  # seconds to wait while filling a batch
+    BLOCK_BATCH_SIZE: int = 500
+    BLOCKED_CACHE_TTL: float = 5.0  # seconds before re-reading the ipset
+    PRIV_HELPER_ENABLED: bool = True  # keep one sudo'd priv_helper.py alive for ipset calls
+    # Root-owned install location; sudoers must allow exactly
+    # `<python3> -I -u <PRIV_HELPER_PATH> *`
+    PRIV_HELPER_PATH: str = "/usr/local/libexec/autoshield/priv_helper.py"
+    
+    # Health metrics are reused for this many seconds
+    HEALTH_CACHE_SECONDS: float = 2.0
+    HEALTH_LIVE_CPU_FREQ: bool = False  # re-read the current CPU frequency on every sample
     
     # Log file paths
     AUTH_LOG_PATH: str = "/var/log/auth.log"
@@ -32,6 +53,27 @@ class Settings(BaseSettings):
     # Whitelisted services for restart
     ALLOWED_SERVICES: list[str] = ["ssh", "ufw", "fail2ban"]
     
+    # Pre-parsed forms of the fields above (built once in model_post_init)
+    _allowed_services: frozenset[str] = PrivateAttr(default=frozenset())
+    _allowed_networks: tuple = PrivateAttr(default=())
+    
+    def model_post_init(self, __context: Any) -> None:
+        self._allowed_services = frozenset(self.ALLOWED_SERVICES)
+        self._allowed_networks = tuple(
+            ipaddress.ip_network(r.strip(), strict=False)
+            for r in self.ALLOWED_IP_RANGES.split(',') if r.strip()
+        )
+    
+    @property
+    def allowed_services_set(self) -> frozenset[str]:
+        """ALLOWED_SERVICES as a frozenset for O(1) membership checks"""
+        return self._allowed_services
+    
+    @property
+    def allowed_networks(self) -> tuple:
+        """ALLOWED_IP_RANGES parsed into ipaddress network objects"""
+        return self._allowed_networks
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Privileged helper for the Kali MCP server
+==========================================
+Started once under sudo by FirewallManager and kept alive, so blacklist
+updates do not pay a sudo/PAM round-trip per call.
+
+Protocol: one command per line on stdin, one JSON reply per line on stdout.
+
+    ADD <ip> [<ip> ...]    add IPs to the blacklist ipset
+    DEL <ip> [<ip> ...]    remove IPs from the blacklist ipset
+    SAVE                   dump the blacklist (`ipset save`)
+
+Reply: {"ok": bool, "output": str}
+
+Runs as root: the ipset binary path is fixed here rather than taken from
+the (user-writable) server configuration, and every IP is validated.
+
+Install it root-owned in a root-owned directory outside the app tree
+(see the Dockerfile) and always run it in isolated mode.
+
+Usage: sudo -n python3 -I -u /usr/local/libexec/autoshield/priv_helper.py <ipset-name>
+"""
+
+import json
+import re
+import shutil
+import socket
+import subprocess
+import sys
+
+IPSET = shutil.which("ipset") or "/usr/sbin/ipset"
+_SET_NAME_RE = re.compile(r"[A-Za-z0-9_-]{1,31}")
+
+
+def _valid_ipv4(ip: str) -> bool:
+    if ip.count('.') != 3:
+        return False
+    try:
+        socket.inet_aton(ip)
+    except OSError:
+        return False
+    return True
+
+
+def _reply(ok: bool, output: str):
+    sys.stdout.write(json.dumps({"ok": ok, "output": output}) + "\n")
+    sys.stdout.flush()
+
+
+def _ipset(args: list, payload: str = None):
+    result = subprocess.run(
+        [IPSET, *args],
+        input=payload,
+        capture_output=True,
+        text=True,
+        timeout=10
+    )
+    ok = result.returncode == 0
+    return ok, result.stdout if ok else result.stderr
+
+
+def main():
+    if len(sys.argv) != 2 or not _SET_NAME_RE.fullmatch(sys.argv[1]):
+        sys.exit("usage: priv_helper.py <ipset-name>")
+    set_name = sys.argv[1]
+
+    for line in sys.stdin:
+        parts = line.split()
+        if not parts:
+            continue
+        verb, args = parts[0].upper(), parts[1:]
+
+        try:
+            if verb in ("ADD", "DEL"):
+                if not args or not all(_valid_ipv4(ip) for ip in args):
+                    _reply(False, "Invalid IP address format")
+                    continue
+                payload = "".join(f"{verb.lower()} {set_name} {ip}\n" for ip in args)
+                _reply(*_ipset(["restore", "-exist"], payload))
+            elif verb == "SAVE":
+                _reply(*_ipset(["save", set_name]))
+            else:
+                _reply(False, f"Unknown command: {verb}")
+        except Exception as e:
+            _reply(False, str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -13,9 +13,12 @@ Features:
 """
 
 import asyncio
+import contextvars
+import itertools
+import random
 import subprocess
 import logging
-import json
+import orjson
 import re
 from typing import Any, Dict, List, Optional
 from datetime import datetime
@@ -30,13 +33,20 @@ from starlette.responses import Response
 from sse_starlette.sse import EventSourceResponse
 import uvicorn
 
+try:
+    # libuv spawns children and watches their pipes in C, without the
+    # asyncio child-watcher thread (ships with uvicorn[standard])
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # Import tool modules
 from tools.nmap_tools import NmapScanner
 from tools.firewall_tools import FirewallManager
 from tools.system_tools import SystemMonitor
 from tools.log_tools import LogAnalyzer
 from auth import authenticate_request
-from config import Settings
+from config import settings
 
 # Configure logging
 logging.basicConfig(
@@ -44,183 +54,277 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - [%(correlation_id)s] - %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S'
 )
+
+
+# Correlation ID of the tool call being handled in the current context
+_CORRELATION_ID: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "correlation_id", default="--------"
+)
+
+
+class CorrelationIdFilter(logging.Filter):
+    """Populate record.correlation_id from the current tool-call context"""
+    
+    def filter(self, record):
+        record.correlation_id = _CORRELATION_ID.get()
+        return True
+
+
+# Attach to handlers (not the root logger) so records from child loggers get it too
+for _handler in logging.getLogger().handlers:
+    _handler.addFilter(CorrelationIdFilter())
+
 logger = logging.getLogger("KaliMCPServer")
 
-# Load configuration
-settings = Settings()
+# Correlation ID sequence (random start so IDs differ across restarts)
+_CORRELATION_IDS = itertools.count(random.getrandbits(32))
 
 
 class KaliMCPServer:
     """Enhanced MCP Server for security tools"""
     
+    __slots__ = ("server", "nmap", "firewall", "system", "logs", "_dispatch", "_tools_list")
+    
     def __init__(self):
         self.server = Server("autoshield-kali-security")
         self.nmap = NmapScanner()
         self.firewall = FirewallManager()
         self.system = SystemMonitor()
         self.logs = LogAnalyzer()
+        self._dispatch = self._build_dispatch()
+        self._tools_list = self._build_tools()
         self._setup_handlers()
         logger.info("Kali MCP Server initialized")
     
-    def _setup_handlers(self):
-        """Register all tool handlers"""
-        
-        @self.server.list_tools()
-        async def handle_list_tools() -> list[Tool]:
-            """List all available security tools"""
-            return [
-                Tool(
-                    name="nmap_quick_scan",
-                    description="Fast Nmap scan of top 100 ports (-F flag). Use for quick reconnaissance.",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "target_ip": {
-                                "type": "string",
-                                "description": "Target IP address (e.g., 192.168.1.100)"
-                            }
+    def _build_dispatch(self) -> Dict[str, Any]:
+        """Map tool names to coroutine factories taking the call arguments"""
+        return {
+            "nmap_quick_scan": lambda args: self.nmap.quick_scan(
+                args.get("target_ip"), args.get("verbose", False)
+            ),
+            "nmap_vulnerability_scan": lambda args: self.nmap.vulnerability_scan(
+                args.get("target_ip"), args.get("verbose", False)
+            ),
+            "nmap_scan_many": lambda args: self.nmap.scan_many(
+                args.get("target_ips") or [],
+                args.get("mode", "quick")
+            ),
+            "block_ip_firewall": lambda args: self.firewall.block_ip(
+                args.get("ip_address"),
+                args.get("reason", "Automated block by AutoShield")
+            ),
+            "block_ips_firewall": lambda args: self.firewall.block_ips(
+                args.get("ip_addresses") or [],
+                args.get("reason", "Automated block by AutoShield")
+            ),
+            "unblock_ip_firewall": lambda args: self.firewall.unblock_ip(args.get("ip_address")),
+            "get_failed_logins": lambda args: self.logs.get_failed_logins(
+                args.get("hours", 24), args.get("include_raw_lines", False)
+            ),
+            "get_system_health": lambda args: self.system.get_health(),
+            "restart_service": lambda args: self.system.restart_service(args.get("service_name")),
+        }
+    
+    @staticmethod
+    def _build_tools() -> list[Tool]:
+        """Static tool definitions advertised to MCP clients
+
+        The schemas are fixed literals, so pydantic validation is skipped.
+        """
+        return [
+            Tool.model_construct(
+                name="nmap_quick_scan",
+                description="Fast Nmap scan of top 100 ports (-F flag). Use for quick reconnaissance.",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "target_ip": {
+                            "type": "string",
+                            "description": "Target IP address (e.g., 192.168.1.100)"
                         },
-                        "required": ["target_ip"]
-                    }
-                ),
-                Tool(
-                    name="nmap_vulnerability_scan",
-                    description="Comprehensive Nmap vulnerability scan with service detection and vuln scripts.",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "target_ip": {
-                                "type": "string",
-                                "description": "Target IP address"
-                            }
+                        "verbose": {
+                            "type": "boolean",
+                            "description": "Include the raw nmap XML report (large)"
+                        }
+                    },
+                    "required": ["target_ip"]
+                }
+            ),
+            Tool.model_construct(
+                name="nmap_vulnerability_scan",
+                description="Comprehensive Nmap vulnerability scan with service detection and vuln scripts.",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "target_ip": {
+                            "type": "string",
+                            "description": "Target IP address"
                         },
-                        "required": ["target_ip"]
-                    }
-                ),
-                Tool(
-                    name="block_ip_firewall",
-                    description="Block an IP address using UFW firewall. Prevents all traffic from the specified IP.",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "ip_address": {
-                                "type": "string",
-                                "description": "IP address to block"
-                            },
-                            "reason": {
-                                "type": "string",
-                                "description": "Reason for blocking (for audit trail)"
-                            }
+                        "verbose": {
+                            "type": "boolean",
+                            "description": "Include the raw nmap XML report (large)"
+                        }
+                    },
+                    "required": ["target_ip"]
+                }
+            ),
+            Tool.model_construct(
+                name="nmap_scan_many",
+                description="Scan a list of IP addresses concurrently (bounded by MAX_CONCURRENT_SCANS).",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "target_ips": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "Target IP addresses"
                         },
-                        "required": ["ip_address"]
-                    }
-                ),
-                Tool(
-                    name="unblock_ip_firewall",
-                    description="Remove IP block from UFW firewall.",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "ip_address": {
-                                "type": "string",
-                                "description": "IP address to unblock"
-                            }
+                        "mode": {
+                            "type": "string",
+                            "enum": ["quick", "vulnerability"],
+                            "description": "Scan type to run on each target (default: quick)"
+                        }
+                    },
+                    "required": ["target_ips"]
+                }
+            ),
+            Tool.model_construct(
+                name="block_ip_firewall",
+                description="Block an IP address via the firewall ipset blacklist. Prevents all traffic from the specified IP.",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "ip_address": {
+                            "type": "string",
+                            "description": "IP address to block"
                         },
-                        "required": ["ip_address"]
-                    }
-                ),
-                Tool(
-                    name="get_failed_logins",
-                    description="Parse auth logs to find failed SSH login attempts.",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "hours": {
-                                "type": "integer",
-                                "description": "Number of hours to look back (default: 24)",
-                                "default": 24
-                            }
+                        "reason": {
+                            "type": "string",
+                            "description": "Reason for blocking (for audit trail)"
                         }
-                    }
-                ),
-                Tool(
-                    name="get_system_health",
-                    description="Retrieve system health metrics: CPU, RAM, disk usage, uptime.",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {}
-                    }
-                ),
-                Tool(
-                    name="restart_service",
-                    description="Restart a system service (whitelisted services only: ssh, ufw, fail2ban).",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "service_name": {
-                                "type": "string",
-                                "description": "Service name (ssh, ufw, or fail2ban)"
-                            }
+                    },
+                    "required": ["ip_address"]
+                }
+            ),
+            Tool.model_construct(
+                name="block_ips_firewall",
+                description="Block a list of IP addresses in one batch. Use for bulk blocklists.",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "ip_addresses": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "IP addresses to block"
                         },
-                        "required": ["service_name"]
+                        "reason": {
+                            "type": "string",
+                            "description": "Reason for blocking (for audit trail)"
+                        }
+                    },
+                    "required": ["ip_addresses"]
+                }
+            ),
+            Tool.model_construct(
+                name="unblock_ip_firewall",
+                description="Remove IP block from the firewall blacklist.",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "ip_address": {
+                            "type": "string",
+                            "description": "IP address to unblock"
+                        }
+                    },
+                    "required": ["ip_address"]
+                }
+            ),
+            Tool.model_construct(
+                name="get_failed_logins",
+                description="Parse auth logs to find failed SSH login attempts.",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "hours": {
+                            "type": "integer",
+                            "description": "Number of hours to look back (default: 24)",
+                            "default": 24
+                        },
+                        "include_raw_lines": {
+                            "type": "boolean",
+                            "description": "Attach the original auth.log line to each attempt as raw_line",
+                            "default": False
+                        }
                     }
-                )
-            ]
+                }
+            ),
+            Tool.model_construct(
+                name="get_system_health",
+                description="Retrieve system health metrics: CPU, RAM, disk usage, uptime.",
+                inputSchema={
+                    "type": "object",
+                    "properties": {}
+                }
+            ),
+            Tool.model_construct(
+                name="restart_service",
+                description="Restart a system service (whitelisted services only: ssh, ufw, fail2ban).",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "service_name": {
+                            "type": "string",
+                            "description": "Service name (ssh, ufw, or fail2ban)"
+                        }
+                    },
+                    "required": ["service_name"]
+                }
+            )
+        ]
+    
+    def _setup_handlers(self):
+        """Register all tool handlers"""
+        
+        @self.server.list_tools()
+        async def handle_list_tools() -> list[Tool]:
+            """List all available security tools"""
+            return self._tools_list
         
         @self.server.call_tool()
         async def handle_call_tool(name: str, arguments: dict) -> list[TextContent]:
             """Route tool calls to appropriate handlers"""
             correlation_id = self._generate_correlation_id()
-            logger.info(f"Tool '{name}' called with args: {arguments}", 
-                       extra={'correlation_id': correlation_id})
+            _CORRELATION_ID.set(correlation_id)
+            logger.info("Tool '%s' called with args: %s", name, arguments)
             
             try:
                 # Route to appropriate tool
-                if name == "nmap_quick_scan":
-                    result = await self.nmap.quick_scan(arguments.get("target_ip"))
-                elif name == "nmap_vulnerability_scan":
-                    result = await self.nmap.vulnerability_scan(arguments.get("target_ip"))
-                elif name == "block_ip_firewall":
-                    result = await self.firewall.block_ip(
-                        arguments.get("ip_address"),
-                        arguments.get("reason", "Automated block by AutoShield")
-                    )
-                elif name == "unblock_ip_firewall":
-                    result = await self.firewall.unblock_ip(arguments.get("ip_address"))
-                elif name == "get_failed_logins":
-                    result = await self.logs.get_failed_logins(arguments.get("hours", 24))
-                elif name == "get_system_health":
-                    result = await self.system.get_health()
-                elif name == "restart_service":
-                    result = await self.system.restart_service(arguments.get("service_name"))
+                handler = self._dispatch.get(name)
+                if handler is not None:
+                    result = await handler(arguments)
+                    if isinstance(result, bytes):
+                        result = result.decode()
                 else:
-                    result = json.dumps({
+                    result = orjson.dumps({
                         "error": f"Unknown tool: {name}",
-                        "available_tools": [
-                            "nmap_quick_scan", "nmap_vulnerability_scan",
-                            "block_ip_firewall", "unblock_ip_firewall",
-                            "get_failed_logins", "get_system_health", "restart_service"
-                        ]
-                    })
+                        "available_tools": list(self._dispatch)
+                    }).decode()
                 
-                logger.info(f"Tool '{name}' completed successfully",
-                           extra={'correlation_id': correlation_id})
+                logger.info("Tool '%s' completed successfully", name)
                 return [TextContent(type="text", text=result)]
             
             except Exception as e:
                 error_msg = f"Error executing tool '{name}': {str(e)}"
-                logger.error(error_msg, exc_info=True, 
-                           extra={'correlation_id': correlation_id})
-                return [TextContent(type="text", text=json.dumps({
+                logger.error(error_msg, exc_info=True)
+                return [TextContent(type="text", text=orjson.dumps({
                     "error": error_msg,
                     "correlation_id": correlation_id
-                }))]
+                }).decode())]
     
     @staticmethod
     def _generate_correlation_id() -> str:
         """Generate unique correlation ID for request tracking"""
-        from uuid import uuid4
-        return str(uuid4())[:8]
+        return f"{next(_CORRELATION_IDS) & 0xFFFFFFFF:08x}"
 
 
 # Global server instance
@@ -234,14 +338,14 @@ async def sse_handler(request):
     # Authenticate request
     auth_result = authenticate_request(request)
     if not auth_result["authenticated"]:
-        logger.warning(f"Authentication failed: {auth_result['reason']}")
+        logger.warning("Authentication failed: %s", auth_result['reason'])
         return Response(
-            content=json.dumps({"error": "Unauthorized", "reason": auth_result["reason"]}),
+            content=orjson.dumps({"error": "Unauthorized", "reason": auth_result["reason"]}),
             status_code=401,
             media_type="application/json"
         )
     
-    logger.info(f"Authenticated SSE connection from {request.client.host}")
+    logger.info("Authenticated SSE connection from %s", request.client.host)
     
     async def event_generator():
         """Generate SSE events for MCP communication"""
@@ -254,14 +358,14 @@ async def sse_handler(request):
                     write_stream.write()
                 )
         except Exception as e:
-            logger.error(f"SSE error: {e}", exc_info=True)
-            yield {"event": "error", "data": json.dumps({"error": str(e)})}
+            logger.error("SSE error: %s", e, exc_info=True)
+            yield {"event": "error", "data": orjson.dumps({"error": str(e)}).decode()}
     
     return EventSourceResponse(event_generator())
 
 
 async def health_check(request):
-    """Health check endpoint"""
+    """Health check endpoint (SystemMonitor caches the sample for HEALTH_CACHE_SECONDS)"""
     health_data = await kali_server.system.get_health()
     return Response(
         content=health_data,
@@ -288,7 +392,9 @@ async def lifespan(app: Starlette):
     logger.info("Available Tools:")
     logger.info("  🔍 nmap_quick_scan - Fast port scanning")
     logger.info("  🔬 nmap_vulnerability_scan - Comprehensive vuln scanning")
+    logger.info("  🌐 nmap_scan_many - Concurrent multi-target scanning")
     logger.info("  🚫 block_ip_firewall - Block malicious IPs")
+    logger.info("  🚫 block_ips_firewall - Bulk IP blocking")
     logger.info("  ✅ unblock_ip_firewall - Remove IP blocks")
     logger.info("  📋 get_failed_logins - Parse authentication logs")
     logger.info("  💚 get_system_health - System resource monitoring")
@@ -296,12 +402,14 @@ async def lifespan(app: Starlette):
     logger.info("=" * 80)
     
     # Verify tools are available
-    await kali_server.nmap.verify_installation()
-    await kali_server.firewall.verify_installation()
+    await asyncio.gather(
+        kali_server.nmap.verify_installation(),
+        kali_server.firewall.verify_installation()
+    )
     
     logger.info("✅ All tools verified and ready")
-    logger.info(f"🌐 Listening on {settings.HOST}:{settings.PORT}")
-    logger.info(f"🔐 Authentication: {'Enabled' if settings.MCP_AUTH_TOKEN else 'DISABLED (DEV MODE)'}")
+    logger.info("🌐 Listening on %s:%s", settings.HOST, settings.PORT)
+    logger.info("🔐 Authentication: %s", "Enabled" if settings.MCP_AUTH_TOKEN else "DISABLED (DEV MODE)")
     
     yield
     
@@ -325,10 +433,12 @@ async def main():
 
 
 if __name__ == "__main__":
+    if uvloop is not None:
+        uvloop.install()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("\n👋 Graceful shutdown initiated...")
     except Exception as e:
-        logger.error(f"❌ Fatal error: {e}", exc_info=True)
+        logger.error("❌ Fatal error: %s", e, exc_info=True)
         raise
@@ -11,19 +11,19 @@ Host: 0.0.0.0 (accessible over the network)
 """
 
 import asyncio
-import subprocess
 import psutil
+import socket
 import logging
 from typing import Any
 from mcp.server.models import InitializationOptions
 from mcp.server import NotificationOptions, Server
-from mcp.server.stdio import stdio_server
 from mcp.types import Tool, TextContent
 from starlette.applications import Starlette
 from starlette.routing import Route
 from sse_starlette.sse import EventSourceResponse
 import uvicorn
-import json
+import orjson
+from config import settings
 
 # Configure logging
 logging.basicConfig(
@@ -36,12 +36,17 @@ logger = logging.getLogger("KaliMCPServer")
 # TODO: Replace with a proper authentication mechanism in production
 AUTHORIZED_TOKEN = "secure_token_change_me_in_production"
 
+# Invariant argv prefixes; the target IP is appended per call
+_NMAP_QUICK_ARGV = (settings.NMAP_PATH, "-F")
+_UFW_DENY_ARGV = ("sudo", settings.UFW_PATH, "deny", "from")
+
 
 class KaliMCPServer:
     """MCP Server exposing Kali Linux security tools"""
     
     def __init__(self):
         self.server = Server("kali-security-server")
+        self._scan_semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_SCANS)
         self._setup_handlers()
         logger.info("Kali MCP Server initialized")
     
@@ -94,7 +99,7 @@ class KaliMCPServer:
         @self.server.call_tool()
         async def handle_call_tool(name: str, arguments: dict) -> list[TextContent]:
             """Handle tool execution requests"""
-            logger.info(f"Tool called: {name} with arguments: {arguments}")
+            logger.info("Tool called: %s with arguments: %s", name, arguments)
             
             try:
                 if name == "nmap_quick_scan":
@@ -130,29 +135,38 @@ class KaliMCPServer:
         if not self._is_valid_ip(target_ip):
             return f"Error: Invalid IP address format: {target_ip}"
         
-        logger.info(f"Starting Nmap quick scan on {target_ip}")
+        logger.info("Starting Nmap quick scan on %s", target_ip)
         
         try:
             # Run Nmap with -F flag (fast scan of 100 most common ports)
-            result = subprocess.run(
-                ["nmap", "-F", target_ip],
-                capture_output=True,
-                text=True,
-                timeout=60  # 60 second timeout
-            )
+            async with self._scan_semaphore:
+                process = await asyncio.create_subprocess_exec(
+                    *_NMAP_QUICK_ARGV, target_ip,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                try:
+                    stdout, stderr = await asyncio.wait_for(
+                        process.communicate(),
+                        timeout=60  # 60 second timeout
+                    )
+                except asyncio.TimeoutError:
+                    process.kill()
+                    await process.wait()
+                    raise
             
-            output = result.stdout if result.returncode == 0 else result.stderr
-            logger.info(f"Nmap scan completed for {target_ip}")
+            output = stdout.decode() if process.returncode == 0 else stderr.decode()
+            logger.info("Nmap scan completed for %s", target_ip)
             
             return f"Nmap Quick Scan Results for {target_ip}:\n\n{output}"
         
-        except subprocess.TimeoutExpired:
+        except asyncio.TimeoutError:
             error_msg = f"Nmap scan timed out for {target_ip}"
             logger.error(error_msg)
             return f"Error: {error_msg}"
         
         except FileNotFoundError:
-            error_msg = "Nmap is not installed or not in PATH"
+            error_msg = f"Nmap not found at {settings.NMAP_PATH}"
             logger.error(error_msg)
             return f"Error: {error_msg}"
         
@@ -178,28 +192,36 @@ class KaliMCPServer:
         if not self._is_valid_ip(ip_address):
             return f"Error: Invalid IP address format: {ip_address}"
         
-        logger.warning(f"Blocking IP address {ip_address} with UFW")
+        logger.warning("Blocking IP address %s with UFW", ip_address)
         
         try:
             # Run UFW deny command
-            result = subprocess.run(
-                ["sudo", "ufw", "deny", "from", ip_address],
-                capture_output=True,
-                text=True,
-                timeout=10
+            process = await asyncio.create_subprocess_exec(
+                *_UFW_DENY_ARGV, ip_address,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
             )
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    process.communicate(),
+                    timeout=10
+                )
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise
             
-            if result.returncode == 0:
+            if process.returncode == 0:
                 success_msg = f"Successfully blocked IP {ip_address} using UFW"
                 logger.info(success_msg)
-                return f"{success_msg}\n\nOutput: {result.stdout}"
+                return f"{success_msg}\n\nOutput: {stdout.decode()}"
             else:
                 error_msg = f"Failed to block IP {ip_address}"
-                logger.error(f"{error_msg}: {result.stderr}")
-                return f"Error: {error_msg}\n{result.stderr}"
+                logger.error("%s: %s", error_msg, stderr.decode())
+                return f"Error: {error_msg}\n{stderr.decode()}"
         
         except FileNotFoundError:
-            error_msg = "UFW is not installed or not in PATH"
+            error_msg = f"UFW not found at {settings.UFW_PATH}"
             logger.error(error_msg)
             return f"Error: {error_msg}"
         
@@ -237,14 +259,14 @@ class KaliMCPServer:
                 }
             }
             
-            logger.info(f"System health check: CPU {cpu_percent}%, RAM {memory.percent}%")
+            logger.info("System health check: CPU %s%%, RAM %s%%", cpu_percent, memory.percent)
             
-            return json.dumps(health_data, indent=2)
+            return orjson.dumps(health_data, option=orjson.OPT_INDENT_2).decode()
         
         except Exception as e:
             error_msg = f"Error getting system health: {str(e)}"
             logger.error(error_msg)
-            return json.dumps({"status": "error", "message": error_msg})
+            return orjson.dumps({"status": "error", "message": error_msg}).decode()
     
     def _is_valid_ip(self, ip: str) -> bool:
         """
@@ -256,18 +278,22 @@ class KaliMCPServer:
         Returns:
             True if valid, False otherwise
         """
-        parts = ip.split('.')
-        if len(parts) != 4:
-            return False
-        
+        # inet_pton is strict (no "1.2" shorthand like inet_aton) and runs in C
+        try:
+            socket.inet_pton(socket.AF_INET, ip)
+            return True
+        except (OSError, TypeError, ValueError):
+            pass
         try:
-            return all(0 <= int(part) <= 255 for part in parts)
-        except (ValueError, TypeError):
+            socket.inet_pton(socket.AF_INET6, ip)
+            return True
+        except (OSError, TypeError, ValueError):
             return False
 
 
-# Global MCP server instance
-kali_server = KaliMCPServer()
+# Global MCP server instance, created by main() so importing this module
+# stays free of side effects
+kali_server = None
 
 
 async def sse_handler(request):
@@ -285,7 +311,7 @@ async def sse_handler(request):
     # if token != AUTHORIZED_TOKEN:
     #     return Response("Forbidden", status_code=403)
     
-    logger.info(f"New SSE connection from {request.client.host}")
+    logger.info("New SSE connection from %s", request.client.host)
     
     async def event_generator():
         """Generate SSE events for MCP communication"""
@@ -300,22 +326,27 @@ async def sse_handler(request):
                     write_stream.write()
                 )
         except Exception as e:
-            logger.error(f"SSE error: {e}")
+            logger.error("SSE error: %s", e)
             yield {"event": "error", "data": str(e)}
     
     return EventSourceResponse(event_generator())
 
 
-# Starlette application for SSE transport
-app = Starlette(
-    routes=[
-        Route("/sse", sse_handler, methods=["GET", "POST"])
-    ]
-)
+def create_app() -> Starlette:
+    """Build the Starlette application for SSE transport"""
+    global kali_server
+    if kali_server is None:
+        kali_server = KaliMCPServer()
+    return Starlette(
+        routes=[
+            Route("/sse", sse_handler, methods=["GET", "POST"])
+        ]
+    )
 
 
 async def main():
     """Main entry point"""
+    app = create_app()
     logger.info("=" * 60)
     logger.info("Starting Kali MCP Server - The Enforcer")
     logger.info("=" * 60)
@@ -342,5 +373,5 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         logger.info("\nShutting down Kali MCP Server...")
     except Exception as e:
-        logger.error(f"Fatal error: {e}")
+        logger.error("Fatal error: %s", e)
         raise
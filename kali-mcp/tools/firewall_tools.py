@@ -1,36 +1,58 @@
-"""Firewall management tools (UFW)"""
+"""Firewall management tools (UFW + ipset)"""
 
 import asyncio
-import subprocess
-import json
+import ipaddress
+import orjson
 import logging
+import sys
+import time
 from typing import Optional
-from datetime import datetime
 from config import settings
+from .serialization import dumps, utc_now
+from .ip_utils import valid_ipv4, ipv4_to_int
 
 logger = logging.getLogger(__name__)
 
+_HELPER_READ_LIMIT = 16 * 1024 * 1024  # `SAVE` replies list the whole set on one line
+
+
+class _HelperUnavailable(RuntimeError):
+    """The privileged helper can't be started at all (e.g. sudo refuses it)"""
+
 
 class FirewallManager:
-    """UFW firewall management wrapper"""
+    """
+    Firewall management wrapper
+    
+    Blocks are entries in a kernel ipset that a single iptables DROP rule
+    references, so adding an IP never rewrites or reloads the rule set.
+    UFW is still used for status and rule listing.
+    """
     
     def __init__(self):
         self.ufw_path = settings.UFW_PATH
-        self.blocked_ips = set()  # In-memory cache
+        self.ipset_path = settings.IPSET_PATH
+        self.ipset_name = settings.IPSET_NAME
+        # Snapshot of the kernel blacklist as 32-bit IPv4 ints, refreshed from
+        # `ipset save` after BLOCKED_CACHE_TTL seconds or after our own changes
+        self._blocked_cache: frozenset[int] = frozenset()
+        self._blocked_cache_ts = 0.0
+        # Single-IP blocks are queued and flushed to ipset in batches
+        self._block_queue: Optional[asyncio.Queue] = None
+        self._batch_task: Optional[asyncio.Task] = None
+        # Long-lived root helper (priv_helper.py) for ipset updates
+        self._helper: Optional[asyncio.subprocess.Process] = None
+        self._helper_lock = asyncio.Lock()
+        self._use_helper = settings.PRIV_HELPER_ENABLED
     
     async def verify_installation(self):
         """Verify UFW is installed and accessible"""
         try:
-            result = subprocess.run(
-                ["sudo", self.ufw_path, "status"],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            if result.returncode == 0:
+            ok, output = await self._run(self.ufw_path, "status", timeout=5)
+            if ok:
                 logger.info(f"✅ UFW firewall detected and accessible")
                 # Parse current status
-                if "Status: active" in result.stdout:
+                if "Status: active" in output:
                     logger.info("🔥 UFW is active")
                 else:
                     logger.warning("⚠️  UFW is installed but not active")
@@ -41,22 +63,188 @@ class FirewallManager:
             raise RuntimeError("UFW is not installed")
         except Exception as e:
             logger.error(f"❌ Error verifying UFW: {e}")
+        
+        await self._ensure_blacklist()
     
-    def _validate_ip(self, ip: str) -> bool:
-        """Validate IP address format"""
-        if not ip:
-            return False
-        parts = ip.split('.')
-        if len(parts) != 4:
-            return False
+    async def _run(self, *args: str, stdin: Optional[bytes] = None, timeout: float = 10):
+        """Run a sudo command, returning (success, output)"""
+        process = await asyncio.create_subprocess_exec(
+            "sudo", *args,
+            stdin=asyncio.subprocess.PIPE if stdin is not None else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
         try:
-            return all(0 <= int(part) <= 255 for part in parts)
-        except (ValueError, TypeError):
+            stdout, stderr = await asyncio.wait_for(
+                process.communicate(stdin),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise
+        
+        success = process.returncode == 0
+        return success, stdout.decode() if success else stderr.decode()
+    
+    async def _ensure_blacklist(self):
+        """Create the blacklist ipset and its iptables DROP rule if missing"""
+        rule = ["INPUT", "-m", "set", "--match-set", self.ipset_name, "src", "-j", "DROP"]
+        try:
+            ok, output = await self._run(
+                self.ipset_path, "create", self.ipset_name, "hash:ip",
+                "family", "inet", "hashsize", "4096", "maxelem", "262144", "-exist"
+            )
+            if not ok:
+                logger.error(f"❌ Failed to create ipset {self.ipset_name}: {output}")
+                return
+            
+            ok, _ = await self._run(settings.IPTABLES_PATH, "-C", *rule)
+            if not ok:
+                ok, output = await self._run(settings.IPTABLES_PATH, "-I", *rule)
+                if not ok:
+                    logger.error(f"❌ Failed to install blacklist DROP rule: {output}")
+                    return
+            logger.info(f"✅ ipset blacklist '{self.ipset_name}' ready")
+        except FileNotFoundError:
+            logger.error(f"❌ ipset not found at {self.ipset_path}")
+        except Exception as e:
+            logger.error(f"❌ Error preparing ipset blacklist: {e}")
+    
+    async def _start_helper(self):
+        """Spawn the privileged helper once; later calls reuse its pipes"""
+        try:
+            self._helper = await asyncio.create_subprocess_exec(
+                # -I: isolated mode, so the script's directory, PYTHON* variables
+                # and user site-packages can't inject modules into the root process
+                "sudo", "-n", sys.executable, "-I", "-u", settings.PRIV_HELPER_PATH, self.ipset_name,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+                limit=_HELPER_READ_LIMIT
+            )
+        except OSError as e:
+            raise _HelperUnavailable(f"cannot start privileged helper: {e}") from e
+        logger.info(f"🔐 Privileged firewall helper started (pid {self._helper.pid})")
+    
+    async def _helper_call(self, line: str, timeout: float = 10):
+        """Send one command to the helper and return its (success, output) reply"""
+        async with self._helper_lock:
+            fresh = self._helper is None or self._helper.returncode is not None
+            if fresh:
+                await self._start_helper()
+            helper = self._helper
+            try:
+                helper.stdin.write(line.encode() + b"\n")
+                await helper.stdin.drain()
+                reply = await asyncio.wait_for(helper.stdout.readline(), timeout=timeout)
+                if not reply:
+                    raise ConnectionError("privileged helper exited")
+                reply = orjson.loads(reply)
+            except BaseException as e:
+                # Request/reply framing is unknown now; start over next time
+                if helper.returncode is None:
+                    helper.kill()
+                self._helper = None
+                if fresh and isinstance(e, ConnectionError):
+                    # Gone before its first reply: typically sudo refusing it
+                    raise _HelperUnavailable(f"privileged helper exited on start: {e}") from e
+                raise
+            return reply["ok"], reply["output"]
+    
+    async def _ipset_command(self, verb: str, ips: list[str] = ()):
+        """Run ADD/DEL/SAVE via the helper, falling back to a one-off sudo ipset"""
+        if self._use_helper:
+            try:
+                return await self._helper_call(" ".join([verb, *ips]))
+            except _HelperUnavailable as e:
+                # Won't get better by retrying; don't respawn it per call
+                self._use_helper = False
+                logger.warning(f"⚠️  Privileged helper unavailable, using sudo ipset: {e}")
+            except (OSError, ValueError, KeyError, asyncio.TimeoutError) as e:
+                # Timeout, crash or garbled reply: the helper was dropped and
+                # is respawned on the next call, this one goes through sudo
+                logger.warning(f"⚠️  Privileged helper call failed, using sudo ipset: {e}")
+        
+        if verb == "SAVE":
+            return await self._run(self.ipset_path, "save", self.ipset_name)
+        payload = "".join(f"{verb.lower()} {self.ipset_name} {ip}\n" for ip in ips).encode()
+        return await self._run(self.ipset_path, "restore", "-exist", stdin=payload)
+    
+    async def _refresh_blocked_cache(self):
+        """Reload the blacklist snapshot from the kernel ipset"""
+        ok, output = await self._ipset_command("SAVE")
+        if not ok:
+            logger.warning(f"⚠️  Could not read ipset {self.ipset_name}: {output}")
+            return
+        blocked = set()
+        for line in output.splitlines():
+            # Entries look like: "add autoshield-blacklist 203.0.113.7"
+            parts = line.split()
+            if len(parts) >= 3 and parts[0] == "add" and valid_ipv4(parts[2]):
+                blocked.add(ipv4_to_int(parts[2]))
+        self._blocked_cache = frozenset(blocked)
+        self._blocked_cache_ts = time.monotonic()
+    
+    async def get_blocked_ips(self) -> frozenset[int]:
+        """Current blacklist as 32-bit ints, re-read once the TTL has expired"""
+        if time.monotonic() - self._blocked_cache_ts > settings.BLOCKED_CACHE_TTL:
+            try:
+                await self._refresh_blocked_cache()
+            except Exception as e:
+                logger.error(f"❌ Error reading ipset blacklist: {e}")
+        return self._blocked_cache
+    
+    async def is_blocked(self, ip_address: str) -> bool:
+        """Check whether an IP is in the kernel blacklist"""
+        if not self._validate_ip(ip_address):
             return False
+        return ipv4_to_int(ip_address) in await self.get_blocked_ips()
+    
+    def _enqueue_block(self, ip_address: str) -> asyncio.Future:
+        """Queue an IP for the next batch, starting the batch worker if needed"""
+        if self._batch_task is None or self._batch_task.done():
+            self._block_queue = asyncio.Queue()
+            self._batch_task = asyncio.create_task(self._block_batch_worker())
+        future = asyncio.get_running_loop().create_future()
+        self._block_queue.put_nowait((ip_address, future))
+        return future
+    
+    async def _block_batch_worker(self):
+        """Drain queued blocks every BLOCK_BATCH_INTERVAL or BLOCK_BATCH_SIZE items"""
+        loop = asyncio.get_running_loop()
+        queue = self._block_queue
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + settings.BLOCK_BATCH_INTERVAL
+            while len(batch) < settings.BLOCK_BATCH_SIZE:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                result = await self._ipset_command("ADD", [ip for ip, _ in batch])
+            except Exception as e:
+                result = e
+            
+            for _, future in batch:
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+    
+    def _validate_ip(self, ip: str) -> bool:
+        """Validate IP address format"""
+        return valid_ipv4(ip)
     
     def _is_private_ip(self, ip: str) -> bool:
         """Check if IP is in private ranges (safety check)"""
-        import ipaddress
         try:
             ip_obj = ipaddress.ip_address(ip)
             return ip_obj.is_private
@@ -65,7 +253,10 @@ class FirewallManager:
     
     async def block_ip(self, ip_address: str, reason: str = "Automated block") -> str:
         """
-        Block an IP address using UFW
+        Block an IP address via the ipset blacklist
+        
+        The IP is queued and added together with any other blocks requested
+        in the same batch window.
         
         Args:
             ip_address: IP to block
@@ -75,11 +266,11 @@ class FirewallManager:
             JSON string with operation result
         """
         if not self._validate_ip(ip_address):
-            return json.dumps({
+            return dumps({
                 "success": False,
                 "error": "Invalid IP address format",
                 "ip": ip_address,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             })
         
         # Safety check: warn if blocking private IP
@@ -89,57 +280,112 @@ class FirewallManager:
         logger.info(f"🚫 Blocking IP: {ip_address} - Reason: {reason}")
         
         try:
-            # Run UFW deny command
-            process = await asyncio.create_subprocess_exec(
-                "sudo", self.ufw_path, "deny", "from", ip_address,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await asyncio.wait_for(
-                process.communicate(),
-                timeout=10
-            )
-            
-            success = process.returncode == 0
-            output = stdout.decode() if success else stderr.decode()
+            # No timeout of our own: the helper call and its sudo fallback each
+            # have one, so the batch always settles the future
+            success, output = await asyncio.shield(self._enqueue_block(ip_address))
             
             if success:
-                self.blocked_ips.add(ip_address)
+                self._blocked_cache_ts = 0.0
                 logger.info(f"✅ Successfully blocked {ip_address}")
             else:
                 logger.error(f"❌ Failed to block {ip_address}: {output}")
             
-            return json.dumps({
+            return dumps({
                 "success": success,
                 "action": "block_ip",
                 "ip": ip_address,
                 "reason": reason,
                 "output": output,
-                "timestamp": datetime.utcnow().isoformat()
-            }, indent=2)
+                "timestamp": utc_now()
+            })
         
         except asyncio.TimeoutError:
-            logger.error(f"⏱️  UFW block command timed out for {ip_address}")
-            return json.dumps({
+            logger.error(f"⏱️  ipset block command timed out for {ip_address}")
+            return dumps({
                 "success": False,
                 "error": "Command timed out",
                 "ip": ip_address,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             })
         
         except Exception as e:
             logger.error(f"❌ Error blocking IP {ip_address}: {e}", exc_info=True)
-            return json.dumps({
+            return dumps({
                 "success": False,
                 "error": str(e),
                 "ip": ip_address,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
+            })
+    
+    async def block_ips(self, ip_addresses: list[str], reason: str = "Automated block") -> str:
+        """
+        Block many IP addresses with a single ipset restore
+        
+        Args:
+            ip_addresses: IPs to block
+            reason: Reason for blocking (for audit log)
+            
+        Returns:
+            JSON string with operation result
+        """
+        valid = [ip for ip in ip_addresses if self._validate_ip(ip)]
+        invalid = [ip for ip in ip_addresses if not self._validate_ip(ip)]
+        
+        for ip in valid:
+            if self._is_private_ip(ip):
+                logger.warning(f"⚠️  Blocking private IP: {ip} - Reason: {reason}")
+        
+        logger.info(f"🚫 Blocking {len(valid)} IPs - Reason: {reason}")
+        
+        if not valid:
+            return dumps({
+                "success": False,
+                "error": "No valid IP addresses",
+                "invalid": invalid,
+                "timestamp": utc_now()
+            })
+        
+        try:
+            success, output = await self._ipset_command("ADD", valid)
+            
+            if success:
+                self._blocked_cache_ts = 0.0
+                logger.info(f"✅ Successfully blocked {len(valid)} IPs")
+            else:
+                logger.error(f"❌ Failed to block IP batch: {output}")
+            
+            return dumps({
+                "success": success,
+                "action": "block_ips",
+                "blocked": valid if success else [],
+                "invalid": invalid,
+                "reason": reason,
+                "output": output,
+                "timestamp": utc_now()
+            })
+        
+        except asyncio.TimeoutError:
+            logger.error(f"⏱️  ipset batch block timed out ({len(valid)} IPs)")
+            return dumps({
+                "success": False,
+                "error": "Command timed out",
+                "timestamp": utc_now()
+            })
+        
+        except Exception as e:
+            logger.error(f"❌ Error blocking IP batch: {e}", exc_info=True)
+            return dumps({
+                "success": False,
+                "error": str(e),
+                "timestamp": utc_now()
             })
     
     async def unblock_ip(self, ip_address: str) -> str:
         """
-        Remove IP block from UFW
+        Remove IP from the ipset blacklist
+        
+        IPs that aren't in the set are looked up as `ufw deny` rules instead,
+        which is how blocks were made before the ipset blacklist.
         
         Args:
             ip_address: IP to unblock
@@ -148,61 +394,52 @@ class FirewallManager:
             JSON string with operation result
         """
         if not self._validate_ip(ip_address):
-            return json.dumps({
+            return dumps({
                 "success": False,
                 "error": "Invalid IP address format",
                 "ip": ip_address,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             })
         
         logger.info(f"✅ Unblocking IP: {ip_address}")
         
         try:
-            # Run UFW delete deny command
-            process = await asyncio.create_subprocess_exec(
-                "sudo", self.ufw_path, "delete", "deny", "from", ip_address,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await asyncio.wait_for(
-                process.communicate(),
-                timeout=10
-            )
-            
-            success = process.returncode == 0
-            output = stdout.decode() if success else stderr.decode()
+            self._blocked_cache_ts = 0.0
+            if ipv4_to_int(ip_address) in await self.get_blocked_ips():
+                success, output = await self._ipset_command("DEL", [ip_address])
+            else:
+                success, output = await self._run(self.ufw_path, "delete", "deny", "from", ip_address)
             
             if success:
-                self.blocked_ips.discard(ip_address)
+                self._blocked_cache_ts = 0.0
                 logger.info(f"✅ Successfully unblocked {ip_address}")
             else:
                 logger.warning(f"⚠️  Failed to unblock {ip_address}: {output}")
             
-            return json.dumps({
+            return dumps({
                 "success": success,
                 "action": "unblock_ip",
                 "ip": ip_address,
                 "output": output,
-                "timestamp": datetime.utcnow().isoformat()
-            }, indent=2)
+                "timestamp": utc_now()
+            })
         
         except asyncio.TimeoutError:
-            logger.error(f"⏱️  UFW unblock command timed out for {ip_address}")
-            return json.dumps({
+            logger.error(f"⏱️  Unblock command timed out for {ip_address}")
+            return dumps({
                 "success": False,
                 "error": "Command timed out",
                 "ip": ip_address,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             })
         
         except Exception as e:
             logger.error(f"❌ Error unblocking IP {ip_address}: {e}", exc_info=True)
-            return json.dumps({
+            return dumps({
                 "success": False,
                 "error": str(e),
                 "ip": ip_address,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             })
     
     async def list_rules(self) -> str:
@@ -221,16 +458,16 @@ class FirewallManager:
             
             output = stdout.decode() if process.returncode == 0 else stderr.decode()
             
-            return json.dumps({
+            return dumps({
                 "success": process.returncode == 0,
                 "rules": output,
-                "timestamp": datetime.utcnow().isoformat()
-            }, indent=2)
+                "timestamp": utc_now()
+            })
         
         except Exception as e:
             logger.error(f"❌ Error listing rules: {e}")
-            return json.dumps({
+            return dumps({
                 "success": False,
                 "error": str(e),
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             })
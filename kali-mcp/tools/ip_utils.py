@@ -0,0 +1,32 @@
+"""IP address helpers shared by the tool modules"""
+
+import functools
+import socket
+import struct
+
+
+@functools.lru_cache(maxsize=4096)
+def valid_ipv4(ip: str) -> bool:
+    """
+    Validate a dotted-quad IPv4 address
+    
+    socket.inet_aton also accepts shorthand forms like "1" or "10.1", so the
+    dot count is checked as well. Cached because the same attacker IPs
+    recur across requests and log parses.
+    """
+    if not ip or ip.count('.') != 3:
+        return False
+    try:
+        socket.inet_aton(ip)
+    except (OSError, TypeError, ValueError):
+        return False
+    return True
+
+
+def ipv4_to_int(ip: str) -> int:
+    """Dotted-quad to 32-bit int (cheaper dict/set key than the string)"""
+    return struct.unpack("!I", socket.inet_aton(ip))[0]
+
+
+def int_to_ipv4(ip_int: int) -> str:
+    return socket.inet_ntoa(ip_int.to_bytes(4, "big"))
@@ -1,37 +1,127 @@
 """Authentication log parsing tools"""
 
 import asyncio
-import json
+import bisect
+import functools
 import logging
-import re
-from typing import List, Dict
+import mmap
+import operator
+import os
+import threading
+from collections import defaultdict
+from typing import List, Dict, Optional
 from datetime import datetime, timedelta
 from pathlib import Path
 from config import settings
+from .serialization import dumps, utc_now
+from .ip_utils import valid_ipv4, ipv4_to_int, int_to_ipv4
 
 logger = logging.getLogger(__name__)
 
+_FAILED_NEEDLE = b"Failed password for "
+_ACCEPTED_NEEDLE = b"Accepted "
+_INVALID_USER = b"invalid user "
+_FROM = b" from "
+_MAX_HOURS = 720
+_TIMESTAMP = operator.itemgetter("timestamp")
+
+
+def _iter_matching_lines_reverse(mm, needle: bytes, start: int, end: int):
+    """
+    Yield (line_start, match_pos, line_end) for lines in [start, end)
+    containing needle, newest (end of range) first
+    
+    start and end must sit on line boundaries. Uses mmap.rfind/find
+    (memchr/memmem in C) instead of a per-line regex, so callers can stop
+    as soon as they walk past their time window.
+    """
+    pos = mm.rfind(needle, start, end)
+    while pos != -1:
+        line_start = mm.rfind(b"\n", start, pos) + 1 or start
+        line_end = mm.find(b"\n", pos, end)
+        if line_end == -1:
+            line_end = end
+        yield line_start, pos, line_end
+        pos = mm.rfind(needle, start, line_start)
+
+
+def _complete_lines_end(mm, start: int) -> int:
+    """Offset just past the last newline; a partially written line is left for later"""
+    return mm.rfind(b"\n", start) + 1 or start
+
+
+_MONTHS = {
+    b"Jan": 1, b"Feb": 2, b"Mar": 3, b"Apr": 4, b"May": 5, b"Jun": 6,
+    b"Jul": 7, b"Aug": 8, b"Sep": 9, b"Oct": 10, b"Nov": 11, b"Dec": 12,
+}
+
+
+@functools.lru_cache(maxsize=2048)
+def _parse_ts(buf: bytes, year: int):
+    """
+    Hand-parse a fixed-width 'Mmm dd HH:MM:SS' syslog timestamp
+    
+    Cached because consecutive attack lines mostly share the same second.
+    """
+    if len(buf) != 15 or buf[6] != 0x20 or buf[9] != 0x3A or buf[12] != 0x3A:
+        return None
+    month = _MONTHS.get(buf[0:3])
+    if month is None:
+        return None
+    try:
+        return datetime(year, month, int(buf[4:6]), int(buf[7:9]), int(buf[10:12]), int(buf[13:15]))
+    except ValueError:
+        return None
+
+
+def _parse_syslog_time(line: bytes, now: datetime):
+    """Parse the 15-byte timestamp prefix (auth.log has no year)"""
+    log_time = _parse_ts(line[:15], now.year)
+    # If parsed date is in future, it's from previous year
+    if log_time is not None and log_time > now:
+        log_time = _parse_ts(line[:15], now.year - 1)
+    return log_time
+
+
+def _ipv4_after_from(mm, pos: int, line_end: int):
+    """Return the dotted-quad following ' from ' in [pos, line_end), or None"""
+    start = mm.find(_FROM, pos, line_end)
+    if start == -1:
+        return None
+    start += len(_FROM)
+    end = mm.find(b" ", start, line_end)
+    if end == -1:
+        end = line_end
+    ip = mm[start:end].decode("ascii", errors="ignore")
+    if not ip.replace(".", "").isdigit() or not valid_ipv4(ip):
+        return None
+    return ip
+
 
 class LogAnalyzer:
     """Parse and analyze system authentication logs"""
     
     def __init__(self):
         self.auth_log_path = settings.AUTH_LOG_PATH
+        # Incremental failed-login cache: {"inode", "offset", "floor", "attempts"}
+        self._failed_cursor: Optional[Dict] = None
+        self._cursor_lock = threading.Lock()
     
-    async def get_failed_logins(self, hours: int = 24) -> str:
+    async def get_failed_logins(self, hours: int = 24, include_raw_lines: bool = False) -> str:
         """
         Parse auth logs to find failed SSH login attempts
         
         Args:
             hours: Number of hours to look back (default: 24)
+            include_raw_lines: Attach the original log line to each attempt
             
         Returns:
             JSON string with failed login attempts
         """
-        if hours < 1 or hours > 720:  # Max 30 days
-            return json.dumps({
+        if hours < 1 or hours > _MAX_HOURS:  # Max 30 days
+            return dumps({
                 "error": "Hours parameter must be between 1 and 720",
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             })
         
         logger.info(f"📋 Analyzing failed logins from last {hours} hours")
@@ -41,61 +131,19 @@ class LogAnalyzer:
             log_file = Path(self.auth_log_path)
             if not log_file.exists():
                 logger.warning(f"⚠️  Auth log not found at {self.auth_log_path}")
-                return json.dumps({
+                return dumps({
                     "error": f"Auth log not found: {self.auth_log_path}",
                     "failed_logins": [],
-                    "timestamp": datetime.utcnow().isoformat()
+                    "timestamp": utc_now()
                 })
             
             # Calculate time threshold
             threshold = datetime.now() - timedelta(hours=hours)
             
-            # Parse log file
-            failed_attempts = []
-            
-            with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
-                for line in f:
-                    # Match failed SSH attempts
-                    # Example: "Nov 30 12:34:56 host sshd[1234]: Failed password for invalid user admin from 192.168.1.100 port 22 ssh2"
-                    match = re.search(
-                        r'(\w+\s+\d+\s+\d+:\d+:\d+).*sshd.*Failed password for.*?from\s+(\d+\.\d+\.\d+\.\d+)',
-                        line
-                    )
-                    
-                    if match:
-                        timestamp_str = match.group(1)
-                        ip_address = match.group(2)
-                        
-                        # Parse timestamp (approximate - auth.log doesn't include year)
-                        try:
-                            log_time = datetime.strptime(
-                                f"{datetime.now().year} {timestamp_str}",
-                                "%Y %b %d %H:%M:%S"
-                            )
-                            
-                            # If parsed date is in future, it's from previous year
-                            if log_time > datetime.now():
-                                log_time = log_time.replace(year=datetime.now().year - 1)
-                            
-                            # Check if within time window
-                            if log_time < threshold:
-                                continue
-                        except ValueError:
-                            continue
-                        
-                        # Extract username if available
-                        user_match = re.search(r'Failed password for (?:invalid user )?(\S+)', line)
-                        username = user_match.group(1) if user_match else "unknown"
-                        
-                        failed_attempts.append({
-                            "timestamp": log_time.isoformat(),
-                            "ip": ip_address,
-                            "username": username,
-                            "raw_line": line.strip()
-                        })
-            
-            # Aggregate by IP
-            ip_stats = self._aggregate_by_ip(failed_attempts)
+            # Scan and aggregate off the event loop; large logs take a while
+            failed_attempts, ip_stats = await asyncio.to_thread(
+                self._collect_failed_logins, log_file, threshold, include_raw_lines
+            )
             
             result = {
                 "success": True,
@@ -103,54 +151,199 @@ class LogAnalyzer:
                 "total_failed_attempts": len(failed_attempts),
                 "unique_ips": len(ip_stats),
                 "failed_logins": failed_attempts[-100:],  # Last 100 attempts
-                "top_attackers": sorted(
-                    ip_stats.items(),
-                    key=lambda x: x[1]['count'],
-                    reverse=True
-                )[:20],  # Top 20 attackers
-                "timestamp": datetime.utcnow().isoformat()
+                "top_attackers": [
+                    (int_to_ipv4(ip_int), stats)
+                    for ip_int, stats in sorted(
+                        ip_stats.items(),
+                        key=lambda x: x[1]['count'],
+                        reverse=True
+                    )[:20]  # Top 20 attackers
+                ],
+                "timestamp": utc_now()
             }
             
             logger.info(f"✅ Found {len(failed_attempts)} failed logins from {len(ip_stats)} unique IPs")
-            return json.dumps(result, indent=2)
+            return dumps(result)
         
         except PermissionError:
             logger.error(f"❌ Permission denied reading {self.auth_log_path}")
-            return json.dumps({
+            return dumps({
                 "error": "Permission denied - run with sudo or add user to appropriate group",
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             })
         
         except Exception as e:
             logger.error(f"❌ Error parsing auth logs: {e}", exc_info=True)
-            return json.dumps({
+            return dumps({
                 "error": str(e),
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             })
     
-    def _aggregate_by_ip(self, attempts: List[Dict]) -> Dict[str, Dict]:
-        """Aggregate failed attempts by IP address"""
-        ip_stats = {}
+    def _collect_failed_logins(self, log_file: Path, threshold: datetime, include_raw_lines: bool):
+        """
+        Blocking scan + per-IP aggregation; run via asyncio.to_thread
         
-        for attempt in attempts:
-            ip = attempt['ip']
-            if ip not in ip_stats:
-                ip_stats[ip] = {
-                    'count': 0,
-                    'usernames': set(),
-                    'first_seen': attempt['timestamp'],
-                    'last_seen': attempt['timestamp']
+        Attempts are kept between calls together with an (inode, offset)
+        cursor, so repeated polls only parse bytes appended since the last
+        call. Rotation/truncation, or a window reaching further back than
+        what is cached, triggers a full rescan. Raw lines are not cached.
+        """
+        if include_raw_lines:
+            attempts, _, _ = self._scan_failed_logins(log_file, threshold, True)
+            return attempts, self._aggregate_by_ip(attempts)
+        
+        with self._cursor_lock:
+            cursor = self._failed_cursor
+            attempts = None
+            if cursor is not None and threshold >= cursor["floor"]:
+                new, inode, end = self._scan_failed_logins(
+                    log_file, cursor["floor"], False, start=cursor["offset"]
+                )
+                if inode == cursor["inode"] and end >= cursor["offset"]:
+                    cursor["attempts"].extend(new)
+                    cursor["offset"] = end
+                    attempts = cursor["attempts"]
+            
+            if attempts is None:
+                attempts, inode, end = self._scan_failed_logins(log_file, threshold, False)
+                cursor = self._failed_cursor = {
+                    "inode": inode, "offset": end, "floor": threshold, "attempts": attempts
                 }
             
-            ip_stats[ip]['count'] += 1
-            ip_stats[ip]['usernames'].add(attempt['username'])
-            ip_stats[ip]['last_seen'] = attempt['timestamp']
+            # Bound the cache to the widest window a caller may ask for
+            oldest = datetime.now() - timedelta(hours=_MAX_HOURS)
+            if oldest > cursor["floor"]:
+                cursor["floor"] = oldest
+                del attempts[:bisect.bisect_left(attempts, oldest.isoformat(), key=_TIMESTAMP)]
+            
+            window = attempts[bisect.bisect_left(attempts, threshold.isoformat(), key=_TIMESTAMP):]
+        
+        return window, self._aggregate_by_ip(window)
+    
+    @staticmethod
+    def _scan_failed_logins(log_file: Path, threshold: datetime, include_raw_lines: bool,
+                            start: int = 0):
+        """
+        Collect failed SSH password attempts newer than threshold
+        
+        Only complete lines from byte offset start onwards are scanned.
+        Returns (attempts, inode, end_offset).
+        
+        Example: "Nov 30 12:34:56 host sshd[1234]: Failed password for invalid user admin from 192.168.1.100 port 22 ssh2"
+        """
+        attempts = []
+        now = datetime.now()
+        
+        with open(log_file, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size <= start:
+                return attempts, stat.st_ino, stat.st_size
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                end = _complete_lines_end(mm, start)
+                for line_start, pos, line_end in _iter_matching_lines_reverse(mm, _FAILED_NEEDLE, start, end):
+                    if mm.find(b"sshd", line_start, pos) == -1:
+                        continue
+                    
+                    log_time = _parse_syslog_time(mm[line_start:line_start + 15], now)
+                    if log_time is None:
+                        continue
+                    if log_time < threshold:
+                        break  # everything further back is older still
+                    
+                    # Single forward walk: username follows the needle (optionally
+                    # after "invalid user "), then the IP follows " from "
+                    user_start = pos + len(_FAILED_NEEDLE)
+                    if mm[user_start:user_start + len(_INVALID_USER)] == _INVALID_USER:
+                        user_start += len(_INVALID_USER)
+                    user_end = mm.find(b" ", user_start, line_end)
+                    if user_end == -1:
+                        continue
+                    username = mm[user_start:user_end]
+                    
+                    ip_address = _ipv4_after_from(mm, user_end, line_end)
+                    if ip_address is None:
+                        continue
+                    
+                    attempt = {
+                        "timestamp": log_time.isoformat(),
+                        "ip": ip_address,
+                        "username": username.decode('utf-8', errors='ignore') or "unknown"
+                    }
+                    if include_raw_lines:
+                        attempt["raw_line"] = mm[line_start:line_end].decode('utf-8', errors='ignore').strip()
+                    attempts.append(attempt)
+        
+        attempts.reverse()  # back to chronological order
+        return attempts, stat.st_ino, end
+    
+    @staticmethod
+    def _scan_successful_logins(log_file: Path, threshold: datetime) -> List[Dict]:
+        """
+        Collect accepted SSH logins newer than threshold
+        
+        Example: "Nov 30 12:34:56 host sshd[1234]: Accepted publickey for user from 192.168.1.100 port 22 ssh2"
+        """
+        logins = []
+        now = datetime.now()
+        
+        with open(log_file, 'rb') as f:
+            if f.seek(0, 2) == 0:
+                return logins
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                end = _complete_lines_end(mm, 0)
+                for line_start, pos, line_end in _iter_matching_lines_reverse(mm, _ACCEPTED_NEEDLE, 0, end):
+                    if mm.find(b"sshd", line_start, pos) == -1:
+                        continue
+                    
+                    for_pos = mm.find(b" for ", pos, line_end)
+                    if for_pos == -1:
+                        continue
+                    user_start = for_pos + 5
+                    user_end = mm.find(b" ", user_start, line_end)
+                    if user_end == -1 or mm[user_end:user_end + len(_FROM)] != _FROM:
+                        continue
+                    
+                    log_time = _parse_syslog_time(mm[line_start:line_start + 15], now)
+                    if log_time is None:
+                        continue
+                    if log_time < threshold:
+                        break  # everything further back is older still
+                    
+                    ip_address = _ipv4_after_from(mm, user_end, line_end)
+                    if ip_address is None:
+                        continue
+                    
+                    logins.append({
+                        "timestamp": log_time.isoformat(),
+                        "ip": ip_address,
+                        "username": mm[user_start:user_end].decode('utf-8', errors='ignore')
+                    })
+        
+        logins.reverse()  # back to chronological order
+        return logins
+    
+    def _aggregate_by_ip(self, attempts: List[Dict]) -> Dict[int, Dict]:
+        """Aggregate failed attempts by IP address (keyed by 32-bit int IP)"""
+        ip_stats = defaultdict(lambda: {
+            'count': 0,
+            'usernames': set(),
+            'first_seen': None,
+            'last_seen': None
+        })
+        
+        for attempt in attempts:
+            stats = ip_stats[ipv4_to_int(attempt['ip'])]
+            stats['count'] += 1
+            stats['usernames'].add(attempt['username'])
+            if stats['first_seen'] is None:
+                stats['first_seen'] = attempt['timestamp']
+            stats['last_seen'] = attempt['timestamp']
         
         # Convert sets to lists for JSON serialization
-        for ip, stats in ip_stats.items():
+        for stats in ip_stats.values():
             stats['usernames'] = list(stats['usernames'])
         
-        return ip_stats
+        return dict(ip_stats)
     
     async def get_successful_logins(self, hours: int = 24) -> str:
         """
@@ -167,62 +360,30 @@ class LogAnalyzer:
         try:
             log_file = Path(self.auth_log_path)
             if not log_file.exists():
-                return json.dumps({
+                return dumps({
                     "error": f"Auth log not found: {self.auth_log_path}",
-                    "timestamp": datetime.utcnow().isoformat()
+                    "timestamp": utc_now()
                 })
             
             threshold = datetime.now() - timedelta(hours=hours)
-            successful_logins = []
-            
-            with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
-                for line in f:
-                    # Match successful SSH logins
-                    # Example: "Nov 30 12:34:56 host sshd[1234]: Accepted publickey for user from 192.168.1.100 port 22 ssh2"
-                    match = re.search(
-                        r'(\w+\s+\d+\s+\d+:\d+:\d+).*sshd.*Accepted.*?for\s+(\S+)\s+from\s+(\d+\.\d+\.\d+\.\d+)',
-                        line
-                    )
-                    
-                    if match:
-                        timestamp_str = match.group(1)
-                        username = match.group(2)
-                        ip_address = match.group(3)
-                        
-                        try:
-                            log_time = datetime.strptime(
-                                f"{datetime.now().year} {timestamp_str}",
-                                "%Y %b %d %H:%M:%S"
-                            )
-                            
-                            if log_time > datetime.now():
-                                log_time = log_time.replace(year=datetime.now().year - 1)
-                            
-                            if log_time < threshold:
-                                continue
-                        except ValueError:
-                            continue
-                        
-                        successful_logins.append({
-                            "timestamp": log_time.isoformat(),
-                            "ip": ip_address,
-                            "username": username
-                        })
+            successful_logins = await asyncio.to_thread(
+                self._scan_successful_logins, log_file, threshold
+            )
             
             result = {
                 "success": True,
                 "hours_analyzed": hours,
                 "total_successful_logins": len(successful_logins),
                 "logins": successful_logins[-50:],  # Last 50 logins
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             }
             
             logger.info(f"✅ Found {len(successful_logins)} successful logins")
-            return json.dumps(result, indent=2)
+            return dumps(result)
         
         except Exception as e:
             logger.error(f"❌ Error parsing successful logins: {e}")
-            return json.dumps({
+            return dumps({
                 "error": str(e),
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             })
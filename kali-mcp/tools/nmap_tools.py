@@ -1,16 +1,22 @@
 """Nmap scanning tools"""
 
 import asyncio
-import subprocess
-import json
+import io
 import logging
+import orjson
 import re
+import time
+import xml.etree.ElementTree as ET
 from typing import Optional
-from datetime import datetime
 from config import settings
+from .serialization import dumps, utc_now
+from .ip_utils import valid_ipv4, ipv4_to_int
 
 logger = logging.getLogger(__name__)
 
+# Compiled once; nmap output is ASCII so skip Unicode character classes
+_VERSION_RE = re.compile(r"Nmap version (\S+)", re.ASCII)
+
 
 class NmapScanner:
     """Nmap security scanning wrapper"""
@@ -18,18 +24,25 @@ class NmapScanner:
     def __init__(self):
         self.nmap_path = settings.NMAP_PATH
         self.max_timeout = settings.MAX_SCAN_TIMEOUT
+        # ALLOWED_IP_RANGES as (network_int, mask_int) pairs for integer matching
+        self._allowed = tuple(
+            (int(n.network_address), int(n.netmask))
+            for n in settings.allowed_networks if n.version == 4
+        )
+        # Caps running nmap processes across all callers, scan_many included
+        self._scan_slots = asyncio.Semaphore(settings.MAX_CONCURRENT_SCANS)
     
     async def verify_installation(self):
         """Verify Nmap is installed"""
         try:
-            result = subprocess.run(
-                [self.nmap_path, "--version"],
-                capture_output=True,
-                text=True,
-                timeout=5
+            process = await asyncio.create_subprocess_exec(
+                self.nmap_path, "--version",
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
             )
-            if result.returncode == 0:
-                version_match = re.search(r"Nmap version (\S+)", result.stdout)
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=5)
+            if process.returncode == 0:
+                version_match = _VERSION_RE.search(stdout.decode())
                 version = version_match.group(1) if version_match else "unknown"
                 logger.info(f"✅ Nmap {version} detected at {self.nmap_path}")
             else:
@@ -42,81 +55,70 @@ class NmapScanner:
     
     def _validate_ip(self, ip: str) -> bool:
         """Validate IP address format"""
-        if not ip:
-            return False
-        parts = ip.split('.')
-        if len(parts) != 4:
-            return False
-        try:
-            return all(0 <= int(part) <= 255 for part in parts)
-        except (ValueError, TypeError):
-            return False
+        return valid_ipv4(ip)
     
     def _check_ip_allowed(self, ip: str) -> bool:
         """Check if IP is in allowed ranges"""
-        import ipaddress
-        
         try:
-            ip_obj = ipaddress.ip_address(ip)
-            allowed_ranges = settings.ALLOWED_IP_RANGES.split(',')
-            
-            for range_str in allowed_ranges:
-                network = ipaddress.ip_network(range_str.strip(), strict=False)
-                if ip_obj in network:
-                    return True
-            
-            logger.warning(f"IP {ip} not in allowed ranges: {settings.ALLOWED_IP_RANGES}")
-            return False
-        except Exception as e:
+            ip_int = ipv4_to_int(ip)
+        except OSError as e:
             logger.error(f"Error checking IP range: {e}")
             return False
+        
+        for network, mask in self._allowed:
+            if ip_int & mask == network:
+                return True
+        
+        logger.warning(f"IP {ip} not in allowed ranges: {settings.ALLOWED_IP_RANGES}")
+        return False
     
-    async def quick_scan(self, target_ip: str) -> str:
+    async def quick_scan(self, target_ip: str, verbose: bool = False) -> str:
         """
         Fast Nmap scan of top 100 ports
         
         Args:
             target_ip: Target IP address
+            verbose: Include the raw nmap XML report as raw_output
             
         Returns:
             JSON string with scan results
         """
         if not self._validate_ip(target_ip):
-            return json.dumps({
+            return dumps({
                 "error": "Invalid IP address format",
                 "target": target_ip,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             })
         
         if not self._check_ip_allowed(target_ip):
-            return json.dumps({
+            return dumps({
                 "error": "IP address not in allowed scan ranges",
                 "target": target_ip,
                 "allowed_ranges": settings.ALLOWED_IP_RANGES,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             })
         
         logger.info(f"🔍 Starting quick scan on {target_ip}")
-        start_time = datetime.utcnow()
         
         try:
             # Run Nmap: -F (fast scan), -T4 (aggressive timing)
-            process = await asyncio.create_subprocess_exec(
-                self.nmap_path, "-F", "-T4", "--open", target_ip,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
+            async with self._scan_slots:
+                start_time = time.monotonic()
+                process = await asyncio.create_subprocess_exec(
+                    self.nmap_path, "-F", "-T4", "--open", "-oX", "-", target_ip,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                
+                stdout, stderr = await asyncio.wait_for(
+                    process.communicate(),
+                    timeout=60
+                )
             
-            stdout, stderr = await asyncio.wait_for(
-                process.communicate(),
-                timeout=60
-            )
+            duration = time.monotonic() - start_time
             
-            output = stdout.decode() if process.returncode == 0 else stderr.decode()
-            duration = (datetime.utcnow() - start_time).total_seconds()
-            
-            # Parse results
-            open_ports = self._parse_open_ports(output)
+            # Parse results from the XML report on stdout
+            open_ports = self._parse_report(stdout, want_vulns=False)[0] if process.returncode == 0 else []
             
             result = {
                 "success": process.returncode == 0,
@@ -124,75 +126,81 @@ class NmapScanner:
                 "target": target_ip,
                 "duration_seconds": round(duration, 2),
                 "open_ports": open_ports,
-                "raw_output": output,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             }
+            if process.returncode != 0:
+                result["error"] = stderr.decode(errors="replace")
+            if verbose:
+                result["raw_output"] = stdout.decode(errors="replace")
             
             logger.info(f"✅ Quick scan completed: {target_ip} ({len(open_ports)} ports open)")
-            return json.dumps(result, indent=2)
+            return dumps(result)
         
         except asyncio.TimeoutError:
             logger.error(f"⏱️  Quick scan timed out: {target_ip}")
-            return json.dumps({
+            return dumps({
                 "error": "Scan timed out after 60 seconds",
                 "target": target_ip,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             })
         
         except Exception as e:
             logger.error(f"❌ Quick scan error: {e}", exc_info=True)
-            return json.dumps({
+            return dumps({
                 "error": str(e),
                 "target": target_ip,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             })
     
-    async def vulnerability_scan(self, target_ip: str) -> str:
+    async def vulnerability_scan(self, target_ip: str, verbose: bool = False) -> str:
         """
         Comprehensive vulnerability scan with service detection
         
         Args:
             target_ip: Target IP address
+            verbose: Include the raw nmap XML report as raw_output
             
         Returns:
             JSON string with vulnerability findings
         """
         if not self._validate_ip(target_ip):
-            return json.dumps({
+            return dumps({
                 "error": "Invalid IP address format",
                 "target": target_ip,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             })
         
         if not self._check_ip_allowed(target_ip):
-            return json.dumps({
+            return dumps({
                 "error": "IP address not in allowed scan ranges",
                 "target": target_ip,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             })
         
         logger.info(f"🔬 Starting vulnerability scan on {target_ip}")
-        start_time = datetime.utcnow()
         
         try:
             # Run comprehensive scan: -sV (version detection), --script vuln
-            process = await asyncio.create_subprocess_exec(
-                self.nmap_path, "-sV", "--script", "vuln", "-T4", target_ip,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
+            async with self._scan_slots:
+                start_time = time.monotonic()
+                process = await asyncio.create_subprocess_exec(
+                    self.nmap_path, "-sV", "--script", "vuln", "-T4", "-oX", "-", target_ip,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                
+                stdout, stderr = await asyncio.wait_for(
+                    process.communicate(),
+                    timeout=self.max_timeout
+                )
             
-            stdout, stderr = await asyncio.wait_for(
-                process.communicate(),
-                timeout=self.max_timeout
-            )
+            duration = time.monotonic() - start_time
             
-            output = stdout.decode() if process.returncode == 0 else stderr.decode()
-            duration = (datetime.utcnow() - start_time).total_seconds()
-            
-            # Parse vulnerabilities
-            vulnerabilities = self._parse_vulnerabilities(output)
-            open_ports = self._parse_open_ports(output)
+            # Parse vulnerabilities from the XML report on stdout
+            if process.returncode == 0:
+                open_ports, vulnerabilities = self._parse_report(stdout)
+            else:
+                vulnerabilities, open_ports = [], []
             
             result = {
                 "success": process.returncode == 0,
@@ -202,64 +210,121 @@ class NmapScanner:
                 "open_ports": open_ports,
                 "vulnerabilities_found": len(vulnerabilities),
                 "vulnerabilities": vulnerabilities,
-                "raw_output": output,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             }
+            if process.returncode != 0:
+                result["error"] = stderr.decode(errors="replace")
+            if verbose:
+                result["raw_output"] = stdout.decode(errors="replace")
             
             logger.info(f"✅ Vulnerability scan completed: {target_ip} ({len(vulnerabilities)} vulns found)")
-            return json.dumps(result, indent=2)
+            return dumps(result)
         
         except asyncio.TimeoutError:
             logger.error(f"⏱️  Vulnerability scan timed out: {target_ip}")
-            return json.dumps({
+            return dumps({
                 "error": f"Scan timed out after {self.max_timeout} seconds",
                 "target": target_ip,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             })
         
         except Exception as e:
             logger.error(f"❌ Vulnerability scan error: {e}", exc_info=True)
-            return json.dumps({
+            return dumps({
                 "error": str(e),
                 "target": target_ip,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": utc_now()
             })
     
-    def _parse_open_ports(self, nmap_output: str) -> list[dict]:
-        """Parse open ports from Nmap output"""
-        ports = []
-        for line in nmap_output.split('\n'):
-            # Match lines like: "22/tcp   open  ssh"
-            match = re.match(r'(\d+)/(\w+)\s+open\s+(\S+)', line)
-            if match:
-                ports.append({
-                    "port": int(match.group(1)),
-                    "protocol": match.group(2),
-                    "service": match.group(3)
-                })
-        return ports
+    async def scan_many(self, target_ips: list[str], mode: str = "quick") -> str:
+        """
+        Scan several targets concurrently, at most MAX_CONCURRENT_SCANS at a time
+        
+        Args:
+            target_ips: Target IP addresses (duplicates are scanned once)
+            mode: "quick" or "vulnerability"
+            
+        Returns:
+            JSON string with one result per target
+        """
+        if mode == "quick":
+            scan = self.quick_scan
+        elif mode == "vulnerability":
+            scan = self.vulnerability_scan
+        else:
+            return dumps({
+                "error": "mode must be 'quick' or 'vulnerability'",
+                "timestamp": utc_now()
+            })
+        
+        targets = list(dict.fromkeys(target_ips))
+        logger.info(f"🔍 Starting {mode} scan of {len(targets)} targets")
+        
+        # Each scan waits for one of the scanner's MAX_CONCURRENT_SCANS slots
+        results = [orjson.loads(r) for r in await asyncio.gather(*(scan(ip) for ip in targets))]
+        
+        return dumps({
+            "success": all(r.get("success", False) for r in results),
+            "scan_type": f"{mode}_scan_many",
+            "targets_scanned": len(targets),
+            "results": results,
+            "timestamp": utc_now()
+        })
     
-    def _parse_vulnerabilities(self, nmap_output: str) -> list[dict]:
-        """Parse vulnerability findings from Nmap output"""
-        vulnerabilities = []
+    @staticmethod
+    def _iter_xml(xml_output: bytes):
+        """Stream end-events from an nmap -oX report, tolerating truncation"""
+        try:
+            for _, elem in ET.iterparse(io.BytesIO(xml_output), events=("end",)):
+                yield elem
+        except ET.ParseError as e:
+            logger.warning(f"⚠️  Incomplete nmap XML output: {e}")
+    
+    def _parse_report(self, xml_output: bytes, want_vulns: bool = True) -> tuple[list[dict], list[dict]]:
+        """
+        Parse open ports and vulnerability findings from Nmap XML output
         
-        # Look for vulnerability script output (simplified parsing)
-        in_vuln_section = False
-        current_vuln = None
+        One iterparse pass collects both; vulnerabilities come from NSE
+        <script> results whose output reports VULNERABLE.
+        """
+        ports = []
+        vulnerabilities = []
+        # One C-level scan of the raw report decides whether any <script>
+        # needs inspecting at all; most reports contain no findings
+        check_scripts = want_vulns and xml_output.find(b"VULNERABLE") != -1
         
-        for line in nmap_output.split('\n'):
-            # Detect vulnerability section
-            if 'VULNERABLE' in line:
-                in_vuln_section = True
-                current_vuln = {"description": line.strip(), "details": []}
-            elif in_vuln_section:
-                if line.strip() and line.startswith('|'):
-                    if current_vuln:
-                        current_vuln["details"].append(line.strip())
-                else:
-                    if current_vuln:
-                        vulnerabilities.append(current_vuln)
-                        current_vuln = None
-                    in_vuln_section = False
+        for elem in self._iter_xml(xml_output):
+            # <port protocol="tcp" portid="22"><state state="open"/><service name="ssh"/></port>
+            if elem.tag == "port":
+                port = int(elem.get("portid"))
+                state = elem.find("state")
+                if state is not None and state.get("state") == "open":
+                    service = elem.find("service")
+                    ports.append({
+                        "port": port,
+                        "protocol": elem.get("protocol"),
+                        "service": service.get("name", "unknown") if service is not None else "unknown"
+                    })
+            elif elem.tag == "hostscript":
+                port = None
+            else:
+                continue
+            
+            if not check_scripts:
+                elem.clear()
+                continue
+            
+            for script in elem.iterfind("script"):
+                output = script.get("output", "")
+                if "VULNERABLE" not in output:
+                    continue
+                details = [line.strip() for line in output.splitlines() if line.strip()]
+                vulnerabilities.append({
+                    "script": script.get("id"),
+                    "port": port,
+                    "description": details[0] if details else script.get("id"),
+                    "details": details[1:]
+                })
+            elem.clear()
         
-        return vulnerabilities
+        return ports, vulnerabilities
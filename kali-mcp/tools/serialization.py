@@ -0,0 +1,26 @@
+"""JSON encoding shared by the tool modules"""
+
+import time
+from datetime import datetime
+
+import orjson
+
+# Naive datetimes serialize like isoformat(), with no UTC offset suffix
+_DUMPS_OPTIONS = orjson.OPT_INDENT_2
+
+_NOW_TTL = 0.05  # seconds
+_now_cache = {"t": float("-inf"), "now": None}
+
+
+def dumps(obj) -> str:
+    """Serialize a tool result to indented JSON text (datetimes handled natively)"""
+    return orjson.dumps(obj, option=_DUMPS_OPTIONS).decode()
+
+
+def utc_now() -> datetime:
+    """Response timestamp; re-read from the clock at most every 50 ms"""
+    t = time.monotonic()
+    if t - _now_cache["t"] > _NOW_TTL:
+        _now_cache["now"] = datetime.utcnow()
+        _now_cache["t"] = t
+    return _now_cache["now"]
@@ -1,99 +1,196 @@
 """System monitoring and management tools"""
 
 import asyncio
+import heapq
 import subprocess
-import json
 import logging
+import os
+import orjson
 import psutil
+import time
+from collections import namedtuple
+from operator import itemgetter
 from typing import Optional
-from datetime import datetime, timedelta
+from datetime import datetime
 from config import settings
+from .serialization import dumps
+
+try:
+    from pystemd.systemd1 import Unit as SystemdUnit
+except ImportError:  # pystemd needs libsystemd; fall back to systemctl
+    SystemdUnit = None
 
 logger = logging.getLogger(__name__)
 
+# Last health payload, reused for HEALTH_CACHE_SECONDS
+_last_health = {"ts": float("-inf"), "payload": None}
+
+
+# Same shapes as psutil's sdiskusage / snetio (only the fields we report)
+DiskUsage = namedtuple("DiskUsage", "total used free percent")
+NetIO = namedtuple("NetIO", "bytes_sent bytes_recv packets_sent packets_recv")
+
+# /proc/net/dev is opened once and re-read with pread(); None off Linux
+_netdev = {"fd": None, "tried": False}
+_NETDEV_READ_SIZE = 65536  # one read covers several hundred interfaces
+
+
+def _disk_usage(path: str = '/') -> DiskUsage:
+    """statvfs() straight from os, computed the way psutil.disk_usage does"""
+    st = os.statvfs(path)
+    total = st.f_blocks * st.f_frsize
+    free = st.f_bavail * st.f_frsize
+    used = (st.f_blocks - st.f_bfree) * st.f_frsize
+    usable = used + free
+    percent = round(used / usable * 100, 1) if usable else 0.0
+    return DiskUsage(total, used, free, percent)
+
+
+def _net_io() -> NetIO:
+    """Summed counters for every interface in /proc/net/dev (loopback included, like psutil)"""
+    if not _netdev["tried"]:
+        _netdev["tried"] = True
+        try:
+            _netdev["fd"] = os.open('/proc/net/dev', os.O_RDONLY)
+        except OSError:
+            pass
+    fd = _netdev["fd"]
+    if fd is None:
+        n = psutil.net_io_counters()
+        return NetIO(n.bytes_sent, n.bytes_recv, n.packets_sent, n.packets_recv)
+    
+    sent = recv = psent = precv = 0
+    # Two header lines, then "iface: rx_bytes rx_packets ... (8 rx) tx_bytes tx_packets ..."
+    for line in os.pread(fd, _NETDEV_READ_SIZE, 0).splitlines()[2:]:
+        fields = line.partition(b':')[2].split()
+        recv += int(fields[0])
+        precv += int(fields[1])
+        sent += int(fields[8])
+        psent += int(fields[9])
+    return NetIO(sent, recv, psent, precv)
+
+
+def _safe_loadavg():
+    """Load average (Unix-like systems); zeros where unsupported"""
+    try:
+        return psutil.getloadavg()
+    except AttributeError:
+        return [0, 0, 0]  # Windows doesn't have load average
+
 
 class SystemMonitor:
     """System health monitoring and service management"""
     
+    # Fixed argv prefixes for the systemctl fallback; the service name is appended
+    _RESTART_ARGV = ("sudo", settings.SYSTEMCTL_PATH, "restart")
+    _IS_ACTIVE_ARGV = ("sudo", settings.SYSTEMCTL_PATH, "is-active")
+    
     def __init__(self):
         self.systemctl_path = settings.SYSTEMCTL_PATH
-        self.allowed_services = settings.ALLOWED_SERVICES
+        self.allowed_services = settings.allowed_services_set
+        # Boot time is fixed for the life of the process
+        self._boot_ts = psutil.boot_time()
+        self._boot_iso = datetime.fromtimestamp(self._boot_ts).isoformat()
+        # CPU count never changes; frequency is re-read only if HEALTH_LIVE_CPU_FREQ
+        self._cpu_count = psutil.cpu_count()
+        self._cpu_freq = psutil.cpu_freq()
+        # Prime psutil's CPU counters so non-blocking samples have a baseline
+        psutil.cpu_percent(interval=None)
+        # Health payload skeleton, filled in place on each sample
+        self._health = {
+            "status": None,
+            "timestamp": None,
+            "cpu": {"percent": 0.0, "count": 0, "frequency_mhz": None},
+            "memory": {"total_gb": 0.0, "available_gb": 0.0, "used_gb": 0.0, "percent": 0.0},
+            "swap": {"total_gb": 0.0, "used_gb": 0.0, "percent": 0.0},
+            "disk": {"total_gb": 0.0, "used_gb": 0.0, "free_gb": 0.0, "percent": 0.0},
+            "network": {"bytes_sent_mb": 0.0, "bytes_recv_mb": 0.0, "packets_sent": 0, "packets_recv": 0},
+            "uptime": {"boot_time": self._boot_iso, "uptime_seconds": 0, "uptime_formatted": ""},
+            "load_average": {"1min": 0.0, "5min": 0.0, "15min": 0.0},
+        }
     
-    async def get_health(self) -> str:
+    async def get_health(self) -> bytes:
         """
         Get comprehensive system health metrics
         
+        Results are cached for HEALTH_CACHE_SECONDS so bursts of callers
+        share one sample.
+        
         Returns:
-            JSON string with CPU, RAM, disk, uptime, and network stats
+            UTF-8 JSON bytes with CPU, RAM, disk, uptime, and network stats
         """
+        t = time.monotonic()
+        if t - _last_health["ts"] < settings.HEALTH_CACHE_SECONDS:
+            return _last_health["payload"]
+        
+        now_iso = datetime.utcnow().isoformat()
         try:
-            # CPU metrics
-            cpu_percent = psutil.cpu_percent(interval=1)
-            cpu_count = psutil.cpu_count()
-            cpu_freq = psutil.cpu_freq()
+            # psutil calls are blocking; sample them concurrently off the loop
+            samples = [
+                asyncio.to_thread(psutil.cpu_percent, None),
+                asyncio.to_thread(psutil.virtual_memory),
+                asyncio.to_thread(psutil.swap_memory),
+                asyncio.to_thread(_disk_usage, '/'),
+                asyncio.to_thread(_net_io),
+                asyncio.to_thread(_safe_loadavg),
+            ]
+            if settings.HEALTH_LIVE_CPU_FREQ:
+                samples.append(asyncio.to_thread(psutil.cpu_freq))
+            results = await asyncio.gather(*samples)
+            cpu_percent, memory, swap, disk, net_io, load_avg = results[:6]
+            cpu_freq = results[6] if len(results) > 6 else self._cpu_freq
             
-            # Memory metrics
-            memory = psutil.virtual_memory()
-            swap = psutil.swap_memory()
+            # System uptime
+            uptime_seconds = int(time.time() - self._boot_ts)
+            days, rem = divmod(uptime_seconds, 86400)
+            hours, rem = divmod(rem, 3600)
+            minutes, seconds = divmod(rem, 60)
+            uptime_formatted = f"{hours}:{minutes:02d}:{seconds:02d}"
+            if days:
+                uptime_formatted = f"{days} day{'s' if days != 1 else ''}, {uptime_formatted}"
             
-            # Disk metrics
-            disk = psutil.disk_usage('/')
+            # Filled in place; there is no await between here and dumps(),
+            # so concurrent callers cannot interleave their writes
+            health_data = self._health
+            health_data["status"] = "healthy"
+            health_data["timestamp"] = now_iso
             
-            # Network metrics
-            net_io = psutil.net_io_counters()
+            cpu = health_data["cpu"]
+            cpu["percent"] = cpu_percent
+            cpu["count"] = self._cpu_count
+            cpu["frequency_mhz"] = cpu_freq.current if cpu_freq else None
             
-            # System uptime
-            boot_time = datetime.fromtimestamp(psutil.boot_time())
-            uptime = datetime.now() - boot_time
+            mem = health_data["memory"]
+            mem["total_gb"] = memory.total / (1024**3)
+            mem["available_gb"] = memory.available / (1024**3)
+            mem["used_gb"] = memory.used / (1024**3)
+            mem["percent"] = memory.percent
             
-            # Load average (Unix-like systems)
-            try:
-                load_avg = psutil.getloadavg()
-            except AttributeError:
-                load_avg = [0, 0, 0]  # Windows doesn't have load average
+            sw = health_data["swap"]
+            sw["total_gb"] = swap.total / (1024**3)
+            sw["used_gb"] = swap.used / (1024**3)
+            sw["percent"] = swap.percent
+            
+            dsk = health_data["disk"]
+            dsk["total_gb"] = disk.total / (1024**3)
+            dsk["used_gb"] = disk.used / (1024**3)
+            dsk["free_gb"] = disk.free / (1024**3)
+            dsk["percent"] = disk.percent
+            
+            net = health_data["network"]
+            net["bytes_sent_mb"] = net_io.bytes_sent / (1024**2)
+            net["bytes_recv_mb"] = net_io.bytes_recv / (1024**2)
+            net["packets_sent"] = net_io.packets_sent
+            net["packets_recv"] = net_io.packets_recv
             
-            health_data = {
-                "status": "healthy",
-                "timestamp": datetime.utcnow().isoformat(),
-                "cpu": {
-                    "percent": round(cpu_percent, 2),
-                    "count": cpu_count,
-                    "frequency_mhz": round(cpu_freq.current, 2) if cpu_freq else None
-                },
-                "memory": {
-                    "total_gb": round(memory.total / (1024**3), 2),
-                    "available_gb": round(memory.available / (1024**3), 2),
-                    "used_gb": round(memory.used / (1024**3), 2),
-                    "percent": round(memory.percent, 2)
-                },
-                "swap": {
-                    "total_gb": round(swap.total / (1024**3), 2),
-                    "used_gb": round(swap.used / (1024**3), 2),
-                    "percent": round(swap.percent, 2)
-                },
-                "disk": {
-                    "total_gb": round(disk.total / (1024**3), 2),
-                    "used_gb": round(disk.used / (1024**3), 2),
-                    "free_gb": round(disk.free / (1024**3), 2),
-                    "percent": round(disk.percent, 2)
-                },
-                "network": {
-                    "bytes_sent_mb": round(net_io.bytes_sent / (1024**2), 2),
-                    "bytes_recv_mb": round(net_io.bytes_recv / (1024**2), 2),
-                    "packets_sent": net_io.packets_sent,
-                    "packets_recv": net_io.packets_recv
-                },
-                "uptime": {
-                    "boot_time": boot_time.isoformat(),
-                    "uptime_seconds": int(uptime.total_seconds()),
-                    "uptime_formatted": str(uptime).split('.')[0]
-                },
-                "load_average": {
-                    "1min": round(load_avg[0], 2),
-                    "5min": round(load_avg[1], 2),
-                    "15min": round(load_avg[2], 2)
-                }
-            }
+            up = health_data["uptime"]
+            up["uptime_seconds"] = uptime_seconds
+            up["uptime_formatted"] = uptime_formatted
+            
+            load = health_data["load_average"]
+            load["1min"] = load_avg[0]
+            load["5min"] = load_avg[1]
+            load["15min"] = load_avg[2]
             
             # Determine overall health status
             if cpu_percent > 90 or memory.percent > 90 or disk.percent > 90:
@@ -101,17 +198,20 @@ class SystemMonitor:
             if cpu_percent > 95 or memory.percent > 95 or disk.percent > 95:
                 health_data["status"] = "critical"
             
-            logger.info(f"💚 System health: {health_data['status']} - "
-                       f"CPU {cpu_percent}%, RAM {memory.percent}%, Disk {disk.percent}%")
+            logger.info("💚 System health: %s - CPU %s%%, RAM %s%%, Disk %s%%",
+                        health_data['status'], cpu_percent, memory.percent, disk.percent)
             
-            return json.dumps(health_data, indent=2)
+            payload = orjson.dumps(health_data)
+            _last_health["ts"] = t
+            _last_health["payload"] = payload
+            return payload
         
         except Exception as e:
-            logger.error(f"❌ Error getting system health: {e}", exc_info=True)
-            return json.dumps({
+            logger.error("❌ Error getting system health: %s", e, exc_info=True)
+            return orjson.dumps({
                 "status": "error",
                 "error": str(e),
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": now_iso
             })
     
     async def restart_service(self, service_name: str) -> str:
@@ -126,20 +226,52 @@ class SystemMonitor:
         """
         # Validate service is in whitelist
         if service_name not in self.allowed_services:
-            logger.warning(f"⚠️  Attempt to restart non-whitelisted service: {service_name}")
-            return json.dumps({
+            logger.warning("⚠️  Attempt to restart non-whitelisted service: %s", service_name)
+            return dumps({
                 "success": False,
                 "error": f"Service '{service_name}' is not in allowed services list",
-                "allowed_services": self.allowed_services,
+                "allowed_services": settings.ALLOWED_SERVICES,
                 "timestamp": datetime.utcnow().isoformat()
             })
         
-        logger.info(f"🔄 Restarting service: {service_name}")
+        logger.info("🔄 Restarting service: %s", service_name)
+        
+        if SystemdUnit is not None and settings.SYSTEMD_DBUS_RESTART:
+            try:
+                status = await asyncio.to_thread(self._dbus_restart, service_name)
+            except TimeoutError:
+                logger.error("⏱️  Service restart timed out: %s", service_name)
+                return dumps({
+                    "success": False,
+                    "error": "Restart job did not finish within 30 seconds",
+                    "service": service_name,
+                    "timestamp": datetime.utcnow().isoformat()
+                })
+            except Exception as e:
+                logger.warning("⚠️  D-Bus restart of %s failed, using systemctl: %s", service_name, e)
+            else:
+                if status == "failed":
+                    logger.error("❌ Failed to restart %s: unit is %s", service_name, status)
+                    return dumps({
+                        "success": False,
+                        "error": f"Service is {status} after restart",
+                        "service": service_name,
+                        "status": status,
+                        "timestamp": datetime.utcnow().isoformat()
+                    })
+                logger.info("✅ Service %s restarted successfully", service_name)
+                return dumps({
+                    "success": True,
+                    "action": "restart_service",
+                    "service": service_name,
+                    "status": status,
+                    "timestamp": datetime.utcnow().isoformat()
+                })
         
         try:
             # Restart service
             process = await asyncio.create_subprocess_exec(
-                "sudo", self.systemctl_path, "restart", service_name,
+                *self._RESTART_ARGV, service_name,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE
             )
@@ -155,18 +287,18 @@ class SystemMonitor:
             if success:
                 # Get service status
                 status = await self._get_service_status(service_name)
-                logger.info(f"✅ Service {service_name} restarted successfully")
+                logger.info("✅ Service %s restarted successfully", service_name)
                 
-                return json.dumps({
+                return dumps({
                     "success": True,
                     "action": "restart_service",
                     "service": service_name,
                     "status": status,
                     "timestamp": datetime.utcnow().isoformat()
-                }, indent=2)
+                })
             else:
-                logger.error(f"❌ Failed to restart {service_name}: {output}")
-                return json.dumps({
+                logger.error("❌ Failed to restart %s: %s", service_name, output)
+                return dumps({
                     "success": False,
                     "error": output,
                     "service": service_name,
@@ -174,8 +306,8 @@ class SystemMonitor:
                 })
         
         except asyncio.TimeoutError:
-            logger.error(f"⏱️  Service restart timed out: {service_name}")
-            return json.dumps({
+            logger.error("⏱️  Service restart timed out: %s", service_name)
+            return dumps({
                 "success": False,
                 "error": "Command timed out after 30 seconds",
                 "service": service_name,
@@ -183,19 +315,49 @@ class SystemMonitor:
             })
         
         except Exception as e:
-            logger.error(f"❌ Error restarting service {service_name}: {e}", exc_info=True)
-            return json.dumps({
+            logger.error("❌ Error restarting service %s: %s", service_name, e, exc_info=True)
+            return dumps({
                 "success": False,
                 "error": str(e),
                 "service": service_name,
                 "timestamp": datetime.utcnow().isoformat()
             })
     
+    @staticmethod
+    def _systemd_unit(service_name: str):
+        unit = SystemdUnit(f"{service_name}.service".encode())
+        unit.load()
+        return unit
+    
+    def _dbus_restart(self, service_name: str, timeout: float = 30) -> str:
+        """
+        Restart a unit over the system D-Bus (blocking) and return its ActiveState
+        
+        Restart() only queues a job, so like `systemctl restart` this waits
+        until the unit has no job pending, raising TimeoutError after timeout.
+        """
+        unit = self._systemd_unit(service_name)
+        unit.Unit.Restart(b"replace")
+        deadline = time.monotonic() + timeout
+        # Unit.Job is (job id, job path); id 0 means no job is queued or running
+        while unit.Unit.Job[0] != 0:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"restart of {service_name} still pending")
+            time.sleep(0.1)
+        return unit.Unit.ActiveState.decode()
+    
     async def _get_service_status(self, service_name: str) -> str:
         """Get current status of a service"""
+        if SystemdUnit is not None:
+            try:
+                unit = await asyncio.to_thread(self._systemd_unit, service_name)
+                return unit.Unit.ActiveState.decode()
+            except Exception:
+                pass
+        
         try:
             process = await asyncio.create_subprocess_exec(
-                "sudo", self.systemctl_path, "is-active", service_name,
+                *self._IS_ACTIVE_ARGV, service_name,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE
             )
@@ -220,37 +382,46 @@ class SystemMonitor:
             JSON string with process list
         """
         try:
-            processes = []
-            for proc in psutil.process_iter(['pid', 'name', 'username', 'cpu_percent', 'memory_percent']):
-                try:
-                    pinfo = proc.info
-                    if filter_name and filter_name.lower() not in pinfo['name'].lower():
+            filter_lower = filter_name.lower() if filter_name else None
+            matched = 0
+            
+            def iter_procs():
+                nonlocal matched
+                for proc in psutil.process_iter():
+                    try:
+                        # oneshot() reads /proc/<pid>/stat etc. once for all fields;
+                        # the name filter runs before the costlier lookups
+                        with proc.oneshot():
+                            name = proc.name()
+                            if filter_lower and filter_lower not in name.lower():
+                                continue
+                            pinfo = proc.as_dict(['username', 'cpu_percent', 'memory_percent'], ad_value=None)
+                    except (psutil.NoSuchProcess, psutil.AccessDenied):
                         continue
                     
-                    processes.append({
-                        "pid": pinfo['pid'],
-                        "name": pinfo['name'],
+                    matched += 1
+                    yield {
+                        "pid": proc.pid,
+                        "name": name,
                         "username": pinfo['username'],
-                        "cpu_percent": round(pinfo['cpu_percent'] or 0, 2),
-                        "memory_percent": round(pinfo['memory_percent'] or 0, 2)
-                    })
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    pass
+                        "cpu_percent": pinfo['cpu_percent'] or 0.0,
+                        "memory_percent": pinfo['memory_percent'] or 0.0
+                    }
             
-            # Sort by CPU usage
-            processes.sort(key=lambda x: x['cpu_percent'], reverse=True)
+            # Top 50 by CPU usage; only the bounded heap is ever held in memory
+            top = heapq.nlargest(50, iter_procs(), key=itemgetter('cpu_percent'))
             
-            return json.dumps({
+            return dumps({
                 "success": True,
-                "process_count": len(processes),
-                "processes": processes[:50],  # Limit to top 50
+                "process_count": matched,
+                "processes": top,
                 "filter": filter_name,
                 "timestamp": datetime.utcnow().isoformat()
-            }, indent=2)
+            })
         
         except Exception as e:
-            logger.error(f"❌ Error getting process list: {e}")
-            return json.dumps({
+            logger.error("❌ Error getting process list: %s", e)
+            return dumps({
                 "success": False,
                 "error": str(e),
                 "timestamp": datetime.utcnow().isoformat()
@@ -12,14 +12,18 @@ Endpoints:
 """
 
 import asyncio
+import ipaddress
 import logging
-from typing import Dict, Any, Optional
+import os
+import re
+import time
+from typing import Dict, Any, Optional, Tuple
 from datetime import datetime
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, Field, validator
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field, field_validator
 import httpx
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
@@ -33,6 +37,24 @@ logging.basicConfig(
 logger = logging.getLogger("AIBrain")
 
 
+# Concurrent MCP sessions to the Kali server, and how many may connect at once
+MCP_POOL_SIZE = 4
+MCP_MAX_CONCURRENT_CONNECTS = 2
+
+# uvicorn worker processes; each one opens its own MCP session pool in lifespan
+API_WORKERS = os.cpu_count() or 1
+
+# Kali health is sampled by one background task at this interval
+HEALTH_REFRESH_S = 30.0  # seconds
+
+# Port state in nmap output; matched case-insensitively without lowercasing a copy
+_OPEN_RE = re.compile(r'\bopen\b', re.IGNORECASE)
+
+VALID_EVENT_TYPES = frozenset({
+    "suspicious_login", "confirmed_attack", "port_scan_detected", "brute_force_attempt"
+})
+
+
 # Pydantic models for request/response
 class SecurityEvent(BaseModel):
     """Security event payload from Java backend"""
@@ -42,24 +64,21 @@ class SecurityEvent(BaseModel):
     severity: Optional[str] = Field(default="medium", description="Event severity: low, medium, high, critical")
     metadata: Optional[Dict[str, Any]] = Field(default_factory=dict, description="Additional event metadata")
     
-    @validator('event_type')
-    def validate_event_type(cls, v):
+    @field_validator('event_type')
+    @classmethod
+    def validate_event_type(cls, v: str) -> str:
         """Validate event type"""
-        valid_types = ["suspicious_login", "confirmed_attack", "port_scan_detected", "brute_force_attempt"]
-        if v not in valid_types:
-            logger.warning(f"Unknown event type: {v}")
+        if v not in VALID_EVENT_TYPES:
+            logger.warning("Unknown event type: %s", v)
         return v
     
-    @validator('source_ip')
-    def validate_ip(cls, v):
-        """Basic IP validation"""
-        parts = v.split('.')
-        if len(parts) != 4:
-            raise ValueError('Invalid IP address format')
+    @field_validator('source_ip')
+    @classmethod
+    def validate_ip(cls, v: str) -> str:
+        """IP validation (IPv4 or IPv6)"""
         try:
-            if not all(0 <= int(part) <= 255 for part in parts):
-                raise ValueError('Invalid IP address range')
-        except (ValueError, TypeError):
+            ipaddress.ip_address(v)
+        except ValueError:
             raise ValueError('Invalid IP address')
         return v
 
@@ -76,64 +95,131 @@ class SecurityResponse(BaseModel):
 
 
 class MCPClientManager:
-    """Manages MCP Client connection to Kali server"""
+    """Manages a pool of MCP Client sessions to the Kali server"""
     
-    def __init__(self, kali_server_url: str):
+    def __init__(self, kali_server_url: str, pool_size: int = MCP_POOL_SIZE):
         self.kali_server_url = kali_server_url
-        self.session: Optional[ClientSession] = None
-        self.read_stream = None
-        self.write_stream = None
+        self.pool_size = pool_size
+        # Each slot holds a live ClientSession, or None if it needs (re)connecting
+        self._pool: asyncio.Queue = asyncio.Queue(maxsize=pool_size)
+        # Each open session's owner task and the event that tells it to close
+        self._owners: Dict[ClientSession, Tuple[asyncio.Event, asyncio.Task]] = {}
+        # Bounds concurrent (re)connects so a dead server isn't hammered
+        self._reconnect_sem = asyncio.Semaphore(MCP_MAX_CONCURRENT_CONNECTS)
         self._connected = False
-        logger.info(f"MCP Client Manager initialized for {kali_server_url}")
+        logger.info("MCP Client Manager initialized for %s (pool size %s)", kali_server_url, pool_size)
+    
+    async def _run_session(self, ready: asyncio.Future, stop: asyncio.Event):
+        """
+        Own one SSE-backed session from connect to close
+        
+        sse_client and ClientSession run anyio task groups, whose cancel
+        scopes must be exited by the task that entered them. So this task
+        enters both contexts, hands the session out through ready, and exits
+        them itself once stop is set.
+        """
+        try:
+            async with sse_client(self.kali_server_url) as (read_stream, write_stream):
+                async with ClientSession(read_stream, write_stream) as session:
+                    await session.initialize()
+                    ready.set_result(session)
+                    await stop.wait()
+        except asyncio.CancelledError:
+            ready.cancel()
+            raise
+        except Exception as e:
+            if ready.done():
+                raise
+            ready.set_exception(e)
+    
+    async def _open_session(self) -> ClientSession:
+        """Open and initialize one session in its own owner task"""
+        async with self._reconnect_sem:
+            ready = asyncio.get_running_loop().create_future()
+            stop = asyncio.Event()
+            owner = asyncio.create_task(self._run_session(ready, stop))
+            try:
+                session = await ready
+            except BaseException:
+                owner.cancel()
+                raise
+        self._owners[session] = (stop, owner)
+        return session
+    
+    async def _close_session(self, session: ClientSession):
+        """Tear down one session, ignoring errors from an already dead stream"""
+        entry = self._owners.pop(session, None)
+        if entry is None:
+            return
+        stop, owner = entry
+        stop.set()
+        await asyncio.wait((owner,))
+        if not owner.cancelled() and owner.exception() is not None:
+            logger.debug("Error closing MCP session: %s", owner.exception())
     
     async def connect(self):
-        """Establish connection to Kali MCP server"""
+        """Establish the session pool to the Kali MCP server"""
         if self._connected:
             logger.warning("Already connected to MCP server")
             return
         
-        try:
-            logger.info(f"Connecting to Kali MCP Server at {self.kali_server_url}")
-            
-            # Create SSE client connection
-            self.read_stream, self.write_stream = sse_client(self.kali_server_url)
-            
-            # Initialize client session
-            self.session = ClientSession(self.read_stream, self.write_stream)
-            await self.session.__aenter__()
-            
-            # Initialize the session
-            await self.session.initialize()
-            
-            self._connected = True
-            logger.info("Successfully connected to Kali MCP Server")
-            
-            # List available tools
-            tools = await self.session.list_tools()
-            logger.info(f"Available tools: {[tool.name for tool in tools.tools]}")
-            
-        except Exception as e:
-            logger.error(f"Failed to connect to Kali MCP Server: {e}")
-            self._connected = False
-            raise
+        logger.info("Connecting to Kali MCP Server at %s", self.kali_server_url)
+        
+        # Drop any placeholder slots left by an earlier failed attempt
+        while not self._pool.empty():
+            session = self._pool.get_nowait()
+            if session is not None:
+                await self._close_session(session)
+        
+        results = await asyncio.gather(
+            *(self._open_session() for _ in range(self.pool_size)),
+            return_exceptions=True
+        )
+        sessions = [r for r in results if isinstance(r, ClientSession)]
+        
+        # Failed slots stay in the pool as None and reconnect on first use
+        for session in sessions:
+            self._pool.put_nowait(session)
+        for _ in range(self.pool_size - len(sessions)):
+            self._pool.put_nowait(None)
+        
+        if not sessions:
+            error = next(r for r in results if isinstance(r, BaseException))
+            logger.error("Failed to connect to Kali MCP Server: %s", error)
+            raise error
+        
+        self._connected = True
+        logger.info("Successfully connected to Kali MCP Server (%s/%s sessions)", len(sessions), self.pool_size)
+        
+        # List available tools
+        tools = await sessions[0].list_tools()
+        logger.info("Available tools: %s", [tool.name for tool in tools.tools])
     
     async def disconnect(self):
-        """Disconnect from Kali MCP server"""
+        """Disconnect every pooled session from the Kali MCP server"""
         if not self._connected:
             return
         
+        self._connected = False
         try:
-            if self.session:
-                await self.session.__aexit__(None, None, None)
-            self._connected = False
+            while not self._pool.empty():
+                session = self._pool.get_nowait()
+                if session is not None:
+                    await self._close_session(session)
+            # Sessions still checked out by in-flight calls
+            for session in list(self._owners):
+                await self._close_session(session)
             logger.info("Disconnected from Kali MCP Server")
         except Exception as e:
-            logger.error(f"Error during disconnect: {e}")
+            logger.error("Error during disconnect: %s", e)
     
     async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> str:
         """
         Call a tool on the Kali MCP server
         
+        Concurrent calls each take their own session from the pool; a slot
+        whose session failed is reconnected by the next caller that gets it.
+        
         Args:
             tool_name: Name of the tool to invoke
             arguments: Dictionary of arguments for the tool
@@ -141,27 +227,38 @@ class MCPClientManager:
         Returns:
             String result from the tool execution
         """
-        if not self._connected or not self.session:
+        if not self._connected:
             raise RuntimeError("Not connected to MCP server. Call connect() first.")
         
+        session = await self._pool.get()
         try:
-            logger.info(f"Calling tool '{tool_name}' with arguments: {arguments}")
+            if session is None:
+                session = await self._open_session()
+            
+            logger.info("Calling tool '%s' with arguments: %s", tool_name, arguments)
             
-            result = await self.session.call_tool(tool_name, arguments)
+            result = await session.call_tool(tool_name, arguments)
             
             # Extract text content from result
             if result.content and len(result.content) > 0:
                 text_result = result.content[0].text
-                logger.info(f"Tool '{tool_name}' completed successfully")
+                logger.info("Tool '%s' completed successfully", tool_name)
                 return text_result
             else:
-                logger.warning(f"Tool '{tool_name}' returned no content")
+                logger.warning("Tool '%s' returned no content", tool_name)
                 return "No output from tool"
         
         except Exception as e:
+            # Assume the session is broken; the slot reconnects on next use
+            if session is not None:
+                await self._close_session(session)
+                session = None
             error_msg = f"Error calling tool '{tool_name}': {str(e)}"
             logger.error(error_msg)
             raise RuntimeError(error_msg)
+        
+        finally:
+            self._pool.put_nowait(session)
     
     async def nmap_quick_scan(self, target_ip: str) -> str:
         """Perform Nmap quick scan on target IP"""
@@ -181,6 +278,28 @@ class MCPClientManager:
 KALI_SERVER_URL = "http://192.168.1.100:8001/sse"  # Change to your Kali VM IP
 mcp_client = MCPClientManager(KALI_SERVER_URL)
 
+# (monotonic time, payload) of the latest Kali health sample
+_LATEST_HEALTH: Optional[Tuple[float, str]] = None
+
+
+async def _refresh_health_periodically(client: MCPClientManager, interval: float):
+    """Keep _LATEST_HEALTH fresh so requests never call Kali for health themselves"""
+    global _LATEST_HEALTH
+    while True:
+        if client._connected:
+            try:
+                _LATEST_HEALTH = (time.monotonic(), await client.get_system_health())
+            except Exception as e:
+                logger.warning("Kali health refresh failed: %s", e)
+        await asyncio.sleep(interval)
+
+
+async def latest_kali_health() -> str:
+    """Latest background health sample; fetched inline only until the first one lands"""
+    if _LATEST_HEALTH is None:
+        return await mcp_client.get_system_health()
+    return _LATEST_HEALTH[1]
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -194,13 +313,18 @@ async def lifespan(app: FastAPI):
         await mcp_client.connect()
         logger.info("AI Brain is ready to process security events")
     except Exception as e:
-        logger.error(f"Failed to connect to Kali server on startup: {e}")
+        logger.error("Failed to connect to Kali server on startup: %s", e)
         logger.warning("AI Brain will attempt to reconnect on first request")
     
+    health_refresher = asyncio.create_task(
+        _refresh_health_periodically(mcp_client, HEALTH_REFRESH_S)
+    )
+    
     yield
     
-    # Shutdown: Disconnect from MCP server
+    # Shutdown: Stop the health refresher and disconnect from MCP server
     logger.info("Shutting down AI Brain Controller")
+    health_refresher.cancel()
     await mcp_client.disconnect()
 
 
@@ -209,7 +333,8 @@ app = FastAPI(
     title="AutoShield AI Brain",
     description="Intelligent security decision-making API for AutoShield",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 
@@ -227,7 +352,7 @@ class AIDecisionEngine:
         Returns:
             SecurityResponse with the result of the action
         """
-        logger.info(f"Processing event: {event.event_type} from {event.source_ip}")
+        logger.info("Processing event: %s from %s", event.event_type, event.source_ip)
         
         try:
             # Ensure we're connected to MCP server
@@ -255,8 +380,8 @@ class AIDecisionEngine:
             else:
                 # Default action for unknown event types
                 action = "health_check"
-                result = await mcp_client.get_system_health()
-                logger.warning(f"Unknown event type '{event.event_type}', performed health check")
+                result = await latest_kali_health()
+                logger.warning("Unknown event type '%s', performed health check", event.event_type)
             
             return SecurityResponse(
                 success=True,
@@ -268,7 +393,7 @@ class AIDecisionEngine:
         
         except Exception as e:
             error_msg = str(e)
-            logger.error(f"Error processing event: {error_msg}")
+            logger.error("Error processing event: %s", error_msg)
             
             return SecurityResponse(
                 success=False,
@@ -284,15 +409,15 @@ class AIDecisionEngine:
         Handle suspicious login event
         Strategy: Scan the source IP to gather intelligence
         """
-        logger.info(f"Suspicious login detected from {event.source_ip} - initiating Nmap scan")
+        logger.info("Suspicious login detected from %s - initiating Nmap scan", event.source_ip)
         scan_result = await mcp_client.nmap_quick_scan(event.source_ip)
         
         # AI Decision: Analyze scan results (simplified)
-        if "open" in scan_result.lower():
-            logger.warning(f"Open ports detected on {event.source_ip}")
+        if _OPEN_RE.search(scan_result):
+            logger.warning("Open ports detected on %s", event.source_ip)
             return f"ALERT: Open ports found on suspicious IP\n\n{scan_result}"
         else:
-            logger.info(f"No obvious threats detected on {event.source_ip}")
+            logger.info("No obvious threats detected on %s", event.source_ip)
             return f"Scan completed, no immediate threats detected\n\n{scan_result}"
     
     @staticmethod
@@ -301,11 +426,16 @@ class AIDecisionEngine:
         Handle confirmed attack event
         Strategy: Immediately block the attacking IP
         """
-        logger.warning(f"CONFIRMED ATTACK from {event.source_ip} - blocking IP immediately")
+        logger.warning("CONFIRMED ATTACK from %s - blocking IP immediately", event.source_ip)
         block_result = await mcp_client.block_ip(event.source_ip)
         
-        # Also perform a scan to gather intelligence
-        scan_result = await mcp_client.nmap_quick_scan(event.source_ip)
+        # Also perform a scan to gather intelligence; containment comes first,
+        # so the scan runs after the block and its failure doesn't fail the event
+        try:
+            scan_result = await mcp_client.nmap_quick_scan(event.source_ip)
+        except Exception as e:
+            logger.warning("Post-block scan of %s failed: %s", event.source_ip, e)
+            scan_result = f"Scan failed: {e}"
         
         combined_result = f"IP BLOCKED:\n{block_result}\n\nThreat Intelligence:\n{scan_result}"
         return combined_result
@@ -316,13 +446,13 @@ class AIDecisionEngine:
         Handle port scan detection event
         Strategy: Counter-scan to gather information about the attacker
         """
-        logger.warning(f"Port scan detected from {event.source_ip} - performing counter-scan")
+        logger.warning("Port scan detected from %s - performing counter-scan", event.source_ip)
         scan_result = await mcp_client.nmap_quick_scan(event.source_ip)
         
         # AI Decision: If multiple open ports or suspicious services, consider blocking
-        open_port_count = scan_result.lower().count("open")
+        open_port_count = sum(1 for _ in _OPEN_RE.finditer(scan_result))
         if open_port_count > 5:
-            logger.warning(f"High number of open ports ({open_port_count}) on scanner {event.source_ip}")
+            logger.warning("High number of open ports (%s) on scanner %s", open_port_count, event.source_ip)
             return f"WARNING: Attacker has {open_port_count} open ports - potential bot\n\n{scan_result}"
         
         return scan_result
@@ -333,7 +463,7 @@ class AIDecisionEngine:
         Handle brute force attempt event
         Strategy: Block the IP immediately to prevent account compromise
         """
-        logger.warning(f"Brute force attempt from {event.source_ip} - blocking IP")
+        logger.warning("Brute force attempt from %s - blocking IP", event.source_ip)
         block_result = await mcp_client.block_ip(event.source_ip)
         return block_result
 
@@ -358,14 +488,14 @@ async def health_check():
     """
     try:
         if mcp_client._connected:
-            kali_health = await mcp_client.get_system_health()
+            kali_health = await latest_kali_health()
             return {
                 "ai_brain_status": "healthy",
                 "mcp_connection": "connected",
                 "kali_server_health": kali_health
             }
         else:
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=503,
                 content={
                     "ai_brain_status": "degraded",
@@ -374,8 +504,8 @@ async def health_check():
                 }
             )
     except Exception as e:
-        logger.error(f"Health check failed: {e}")
-        return JSONResponse(
+        logger.error("Health check failed: %s", e)
+        return ORJSONResponse(
             status_code=503,
             content={
                 "ai_brain_status": "unhealthy",
@@ -398,21 +528,21 @@ async def process_security_event(event: SecurityEvent):
     Returns:
         SecurityResponse with the result of the action taken
     """
-    logger.info(f"Received security event: {event.event_type} from {event.source_ip}")
+    logger.info("Received security event: %s from %s", event.event_type, event.source_ip)
     
     try:
         # Process the event through the AI Decision Engine
         response = await AIDecisionEngine.process_event(event)
         
         if response.success:
-            logger.info(f"Successfully processed {event.event_type} - Action: {response.action_taken}")
+            logger.info("Successfully processed %s - Action: %s", event.event_type, response.action_taken)
         else:
-            logger.error(f"Failed to process {event.event_type}: {response.error}")
+            logger.error("Failed to process %s: %s", event.event_type, response.error)
         
         return response
     
     except Exception as e:
-        logger.error(f"Unexpected error processing security event: {e}")
+        logger.error("Unexpected error processing security event: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Internal error processing security event: {str(e)}"
@@ -430,7 +560,7 @@ async def manual_scan(target_ip: str):
     Returns:
         Scan results
     """
-    logger.info(f"Manual scan requested for {target_ip}")
+    logger.info("Manual scan requested for %s", target_ip)
     
     try:
         if not mcp_client._connected:
@@ -443,7 +573,7 @@ async def manual_scan(target_ip: str):
             "scan_result": result
         }
     except Exception as e:
-        logger.error(f"Manual scan failed: {e}")
+        logger.error("Manual scan failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -458,7 +588,7 @@ async def manual_block(ip_address: str):
     Returns:
         Block operation result
     """
-    logger.warning(f"Manual IP block requested for {ip_address}")
+    logger.warning("Manual IP block requested for %s", ip_address)
     
     try:
         if not mcp_client._connected:
@@ -471,7 +601,7 @@ async def manual_block(ip_address: str):
             "block_result": result
         }
     except Exception as e:
-        logger.error(f"Manual block failed: {e}")
+        logger.error("Manual block failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -480,8 +610,8 @@ async def manual_block(ip_address: str):
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     """Handle HTTP exceptions"""
-    logger.error(f"HTTP exception: {exc.status_code} - {exc.detail}")
-    return JSONResponse(
+    logger.error("HTTP exception: %s - %s", exc.status_code, exc.detail)
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={"error": exc.detail}
     )
@@ -490,8 +620,8 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     """Handle general exceptions"""
-    logger.error(f"Unhandled exception: {exc}", exc_info=True)
-    return JSONResponse(
+    logger.error("Unhandled exception: %s", exc, exc_info=True)
+    return ORJSONResponse(
         status_code=500,
         content={"error": "Internal server error", "detail": str(exc)}
     )
@@ -502,8 +632,12 @@ if __name__ == "__main__":
     
     logger.info("Starting AI Brain API server...")
     uvicorn.run(
-        app,
+        "ai_brain_old:app",  # import string, so each worker builds its own app
         host="0.0.0.0",
         port=8000,
-        log_level="info"
+        log_level="info",
+        loop="uvloop",
+        http="httptools",
+        workers=API_WORKERS,
+        access_log=False
     )
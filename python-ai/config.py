@@ -1,7 +1,9 @@
 """Configuration management for Python AI Controller"""
 
+import ipaddress
 import os
-from typing import Optional
+from typing import Any, Optional
+from pydantic import PrivateAttr
 from pydantic_settings import BaseSettings
 
 
@@ -12,6 +14,13 @@ class Settings(BaseSettings):
     HOST: str = "0.0.0.0"
     PORT: int = 8000
     LOG_LEVEL: str = "INFO"
+    # uvicorn worker processes. Each worker has its own MCP connection and its
+    # own in-memory threat history, so per-IP scoring only sees the events that
+    # worker handled; raise this only with REDIS_URL set, so that state is shared.
+    WEB_CONCURRENCY: int = 1
+    # Browser origins allowed by CORS (comma-separated)
+    ALLOWED_ORIGINS: str = "http://localhost:3000,http://127.0.0.1:3000"
+    SYSTEM_CACHE_TTL: float = 3.0  # seconds /api/v1/system/{load,connections} are cached
     
     # MCP Server connection
     MCP_SERVER_URL: str = "http://localhost:8001/sse"
@@ -19,16 +28,29 @@ class Settings(BaseSettings):
     MCP_CONNECTION_TIMEOUT: int = 30
     MCP_CONNECTION_RETRIES: int = 3
     MCP_RETRY_DELAY: int = 5  # seconds
+    MCP_RECONNECT_MAX_DELAY: float = 30.0  # background connect backoff cap
+    MCP_READY_TIMEOUT: float = 2.0  # how long a request waits for the first connect
     
     # Java Backend integration
     JAVA_BACKEND_URL: str = "http://localhost:8080"
     JAVA_WEBHOOK_PATH: str = "/api/v1/webhook/python"
+    JAVA_WEBHOOK_RETRIES: int = 3
+    JAVA_WEBHOOK_RETRY_BACKOFF: float = 0.5  # seconds, doubled per retry
+    NOTIFY_QUEUE_SIZE: int = 10000
+    NOTIFY_BATCH_SIZE: int = 64
+    NOTIFY_SHUTDOWN_TIMEOUT: float = 10.0  # seconds to flush queued notifications
     
     # Threat analysis configuration
     THREAT_SCORE_THRESHOLD: int = 70  # 0-100
     FAILED_LOGIN_THRESHOLD: int = 5
     SCAN_COOLDOWN_SECONDS: int = 300  # 5 minutes
     BLOCK_IP_COOLDOWN_SECONDS: int = 3600  # 1 hour
+    SECURITY_EVENT_DEDUP_SECONDS: float = 5.0  # identical events reuse the last result
+    MAX_EVENTS_PER_IP: int = 1000  # per-IP history kept for scoring
+    HISTORY_JANITOR_INTERVAL: float = 60.0  # seconds between sweeps of idle IPs
+    # Optional Redis (e.g. redis://redis:6379/0) for threat state shared by
+    # all workers and kept across restarts; unset keeps it in memory only
+    REDIS_URL: Optional[str] = None
     
     # IP whitelist (never block these)
     WHITELISTED_IPS: str = "127.0.0.1,::1"
@@ -38,6 +60,25 @@ class Settings(BaseSettings):
     ENABLE_VULNERABILITY_SCAN: bool = True
     DRY_RUN_MODE: bool = False  # If True, log actions but don't execute
     
+    # Pre-parsed form of WHITELISTED_IPS (built once in model_post_init)
+    _whitelisted_networks: tuple = PrivateAttr(default=())
+    
+    def model_post_init(self, __context: Any) -> None:
+        self._whitelisted_networks = tuple(
+            ipaddress.ip_network(ip.strip(), strict=False)
+            for ip in self.WHITELISTED_IPS.split(',') if ip.strip()
+        )
+    
+    @property
+    def allowed_origins_list(self) -> list[str]:
+        """ALLOWED_ORIGINS split into a list for CORSMiddleware"""
+        return [o.strip() for o in self.ALLOWED_ORIGINS.split(',') if o.strip()]
+    
+    @property
+    def whitelisted_networks(self) -> tuple:
+        """WHITELISTED_IPS parsed into ip_network objects (plain IPs become /32 or /128)"""
+        return self._whitelisted_networks
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -4,25 +4,31 @@ Production-ready intelligent security controller
 """
 
 import asyncio
+import contextvars
+import inspect
+import itertools
 import logging
-import json
+import random
+import time
+from dataclasses import dataclass
 from contextlib import asynccontextmanager
-from typing import Optional
-from uuid import uuid4
+from typing import Any, Dict, List, Optional
 
-from fastapi import FastAPI, HTTPException, Request, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import TypeAdapter
 import httpx
+import orjson
 
 from models import (
     SecurityEvent, SecurityResponse, ScanRequest, BlockIPRequest,
     MCPStatus, ActionResponse
 )
 from mcp_client import MCPClientManager
-from threat_analyzer import ThreatAnalyzer
+from threat_analyzer import AnalyzeResult, ThreatAnalyzer
 from config import settings
-from ssh_executor import get_defensive_actions, SSHExecutor
+from ssh_executor import DefensiveActions, SSHExecutor, get_defensive_actions
 
 # Configure logging
 logging.basicConfig(
@@ -31,26 +37,51 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
-# Add correlation ID to logs
+# Correlation ID of the request being handled in the current context
+CORRELATION_ID: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "correlation_id", default="N/A"
+)
+
+
+# Correlation ID sequence (random start so IDs differ across restarts)
+_CORRELATION_IDS = itertools.count(random.getrandbits(32))
+
+
 class CorrelationIdFilter(logging.Filter):
+    """Populate record.correlation_id from the current request context"""
+    
     def filter(self, record):
-        if not hasattr(record, 'correlation_id'):
-            record.correlation_id = 'N/A'
+        record.correlation_id = CORRELATION_ID.get()
         return True
 
-logging.getLogger().addFilter(CorrelationIdFilter())
+
+# Attach to handlers (not the root logger) so records from child loggers get it too
+for _handler in logging.getLogger().handlers:
+    _handler.addFilter(CorrelationIdFilter())
+
 logger = logging.getLogger(__name__)
 
+_SECURITY_RESPONSE_ADAPTER = TypeAdapter(SecurityResponse)
+_SECURITY_RESPONSES_ADAPTER = TypeAdapter(List[SecurityResponse])
+
+# Tool results at least this long are JSON-decoded in a worker thread
+_INLINE_PARSE_LIMIT = 64 * 1024
+
+# Expired entries in app.state.recent_events are swept once it reaches this size
+_RECENT_EVENTS_PRUNE_AT = 1024
+
+# Liveness probe body (/livez, /health)
+_LIVEZ_BYTES = orjson.dumps({"ok": True})
+
 # Global instances
 mcp_client: Optional[MCPClientManager] = None
 threat_analyzer: Optional[ThreatAnalyzer] = None
-http_client: Optional[httpx.AsyncClient] = None
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager - startup and shutdown"""
-    global mcp_client, threat_analyzer, http_client
+    global mcp_client, threat_analyzer
     
     logger.info("=" * 80)
     logger.info("🧠 AutoShield AI Brain Controller Starting")
@@ -66,22 +97,51 @@ async def lifespan(app: FastAPI):
     # Initialize MCP client
     mcp_client = MCPClientManager()
     
-    # Connect to Kali MCP server
-    try:
-        await mcp_client.connect()
-        logger.info("✅ Connected to Kali MCP Server")
-    except Exception as e:
-        logger.error(f"⚠️  Failed to connect to MCP server on startup: {e}")
-        logger.warning("Will retry on first request...")
+    # Connect to Kali MCP server in the background so a slow or absent Kali
+    # host does not hold up startup; the supervisor also reconnects after
+    # drops, and endpoints wait briefly on mcp_client.ready
+    mcp_client.start_supervisor()
     
     # Initialize threat analyzer
     threat_analyzer = ThreatAnalyzer(mcp_client)
+    threat_analyzer.start_janitor()
     logger.info("✅ Threat Analyzer initialized")
     
-    # Initialize HTTP client for Java backend communication
-    http_client = httpx.AsyncClient(timeout=30.0)
+    # Pooled HTTP client for Java backend communication; keep-alive connections
+    # are reused across webhook calls and a busy pool fails fast. HTTP/2 is
+    # negotiated via TLS ALPN, so plain-http backends stay on HTTP/1.1 and get
+    # more keep-alive sockets instead (one in-flight request per connection).
+    java_h2 = settings.JAVA_BACKEND_URL.startswith("https://")
+    app.state.http_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=1000,
+            max_keepalive_connections=100 if java_h2 else 500,
+            keepalive_expiry=60.0
+        ),
+        timeout=httpx.Timeout(10.0, connect=1.0, pool=1.0)
+    )
     logger.info("✅ HTTP client initialized")
     
+    # One DefensiveActions (and SSH connection) shared by all defense
+    # endpoints and the threat analyzer. Like MCP, it connects in the
+    # background so the first defense action skips the handshake; if that
+    # fails, the first command retries.
+    app.state.defensive_actions = get_defensive_actions()
+    app.state.ssh_warmup = asyncio.create_task(
+        app.state.defensive_actions.executor.ensure_connected()
+    )
+    # Short-lived results of read-only SSH queries (/api/v1/system/*)
+    app.state.system_cache = {}
+    
+    # Single-flight state for duplicate security events
+    app.state.inflight_events = {}
+    app.state.recent_events = {}
+    
+    # Webhook notifications are queued and posted in batches by one worker
+    app.state.notify_queue = asyncio.Queue(maxsize=settings.NOTIFY_QUEUE_SIZE)
+    app.state.notify_worker = asyncio.create_task(_notify_worker(app.state.notify_queue))
+    
     logger.info("🚀 AI Brain is ready to process security events")
     logger.info("=" * 80)
     
@@ -91,10 +151,23 @@ async def lifespan(app: FastAPI):
     logger.info("🛑 Shutting down AI Brain Controller...")
     
     if mcp_client:
+        await mcp_client.stop_supervisor()
         await mcp_client.disconnect()
     
-    if http_client:
-        await http_client.aclose()
+    await threat_analyzer.stop_janitor()
+    await threat_analyzer.close()
+    
+    # Let the notifier post everything queued (including an in-flight batch)
+    # before the HTTP client goes away; None tells it to stop
+    await app.state.notify_queue.put(None)
+    try:
+        await asyncio.wait_for(app.state.notify_worker, settings.NOTIFY_SHUTDOWN_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("⚠️  Dropped %d queued notifications on shutdown", app.state.notify_queue.qsize())
+    
+    await app.state.http_client.aclose()
+    app.state.ssh_warmup.cancel()
+    await app.state.defensive_actions.executor.disconnect()
     
     logger.info("👋 AI Brain shutdown complete")
 
@@ -104,16 +177,18 @@ app = FastAPI(
     title="AutoShield AI Brain",
     description="Intelligent security analysis and automated response system",
     version="2.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # In production, specify exact origins
+    allow_origins=settings.allowed_origins_list,
     allow_credentials=True,
-    allow_methods=["*"],
+    allow_methods=["GET", "POST"],
     allow_headers=["*"],
+    expose_headers=["X-Correlation-ID"],
 )
 
 
@@ -121,44 +196,142 @@ app.add_middleware(
 @app.middleware("http")
 async def add_correlation_id(request: Request, call_next):
     """Add correlation ID to request for tracing"""
-    correlation_id = request.headers.get("X-Correlation-ID", str(uuid4())[:8])
+    correlation_id = (
+        request.headers.get("X-Correlation-ID")
+        or f"{next(_CORRELATION_IDS) & 0xFFFFFFFF:08x}"
+    )
     request.state.correlation_id = correlation_id
     
     # Store in context for logging
-    import contextvars
-    correlation_id_var = contextvars.ContextVar('correlation_id', default=correlation_id)
-    correlation_id_var.set(correlation_id)
-    
-    response = await call_next(request)
+    token = CORRELATION_ID.set(correlation_id)
+    try:
+        response = await call_next(request)
+    finally:
+        CORRELATION_ID.reset(token)
     response.headers["X-Correlation-ID"] = correlation_id
     return response
 
 
-async def notify_java_backend(event_type: str, data: dict):
-    """Send notification to Java backend"""
+_JSON_HEADERS = {"content-type": "application/json"}
+
+# Settings read on every webhook / security event, resolved once
+_JAVA_WEBHOOK_URL = f"{settings.JAVA_BACKEND_URL}{settings.JAVA_WEBHOOK_PATH}"
+_WEBHOOK_RETRIES = settings.JAVA_WEBHOOK_RETRIES
+_WEBHOOK_RETRY_BACKOFF = settings.JAVA_WEBHOOK_RETRY_BACKOFF
+_EVENT_DEDUP_SECONDS = settings.SECURITY_EVENT_DEDUP_SECONDS
+_SYSTEM_CACHE_TTL = settings.SYSTEM_CACHE_TTL
+
+
+async def _post_to_java_backend(url: str, payload: dict):
+    """POST a webhook payload to the Java backend, retrying transient connection errors"""
+    http_client = getattr(app.state, "http_client", None)
     if not http_client:
         logger.warning("HTTP client not initialized")
         return
     
-    try:
-        url = f"{settings.JAVA_BACKEND_URL}{settings.JAVA_WEBHOOK_PATH}"
-        logger.info(f"📤 Notifying Java backend: {url}")
+    logger.info("📤 Notifying Java backend: %s", url)
+    
+    for attempt in range(_WEBHOOK_RETRIES + 1):
+        try:
+            response = await http_client.post(
+                url,
+                content=orjson.dumps(payload),
+                headers=_JSON_HEADERS
+            )
+            
+            if response.status_code == 200:
+                logger.info("✅ Java backend notified successfully")
+            else:
+                logger.warning("⚠️  Java backend returned status %s", response.status_code)
+            return
         
-        response = await http_client.post(
-            url,
-            json={"event_type": event_type, "data": data},
-            timeout=10.0
+        except httpx.RequestError as e:
+            if attempt == _WEBHOOK_RETRIES:
+                logger.error("❌ Failed to notify Java backend: %s", e)
+                return
+            delay = _WEBHOOK_RETRY_BACKOFF * (2 ** attempt)
+            logger.warning("⚠️  Java backend unreachable (%s), retrying in %.1fs", e, delay)
+            await asyncio.sleep(delay)
+        except Exception as e:
+            logger.error("❌ Unexpected error notifying Java backend: %s", e)
+            return
+
+
+async def notify_java_backend(event_type: str, data: dict):
+    """Send a single notification to Java backend"""
+    await _post_to_java_backend(
+        _JAVA_WEBHOOK_URL,
+        {"event_type": event_type, "data": data}
+    )
+
+
+def enqueue_notification(event_type: str, data: dict):
+    """Queue a notification for the notification worker; dropped if the queue is full"""
+    try:
+        app.state.notify_queue.put_nowait((event_type, data))
+    except asyncio.QueueFull:
+        logger.warning("⚠️  Notification queue full, dropping %s", event_type)
+
+
+def _drain(queue: asyncio.Queue, limit: int) -> list:
+    """Take up to limit items that are already queued, without waiting"""
+    items = []
+    while len(items) < limit:
+        try:
+            items.append(queue.get_nowait())
+        except asyncio.QueueEmpty:
+            break
+    return items
+
+
+async def _send_notifications(batch: list):
+    """Post queued notifications one event each; the backend has no batch webhook"""
+    await asyncio.gather(*(notify_java_backend(t, d) for t, d in batch))
+
+
+async def _notify_worker(queue: asyncio.Queue):
+    """Post notifications as they arrive, sending whatever piled up meanwhile together"""
+    while True:
+        batch = [await queue.get()] + _drain(queue, settings.NOTIFY_BATCH_SIZE - 1)
+        # A None item is the shutdown sentinel, queued after everything else
+        stop = None in batch
+        batch = [item for item in batch if item is not None]
+        if batch:
+            await _send_notifications(batch)
+        if stop:
+            return
+
+
+async def _parse_tool_result(result: str):
+    """Decode an MCP tool's JSON text; large payloads (full nmap scans) parse off the loop"""
+    if not result:
+        return None
+    if len(result) < _INLINE_PARSE_LIMIT:
+        return orjson.loads(result)
+    return await asyncio.to_thread(orjson.loads, result)
+
+
+async def require_mcp_connection():
+    """Dependency: wait briefly for the startup connect, then fail fast with 503
+    while the MCP session is down (the supervisor reconnects in the background)"""
+    if not mcp_client:
+        raise HTTPException(
+            status_code=503,
+            detail="Cannot connect to security tools server"
+        )
+    if not mcp_client.ready.is_set():
+        try:
+            await asyncio.wait_for(mcp_client.ready.wait(), settings.MCP_READY_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=503,
+                detail="Security tools server is still connecting"
+            )
+    if not await mcp_client.ensure_connected():
+        raise HTTPException(
+            status_code=503,
+            detail="Cannot connect to security tools server"
         )
-        
-        if response.status_code == 200:
-            logger.info("✅ Java backend notified successfully")
-        else:
-            logger.warning(f"⚠️  Java backend returned status {response.status_code}")
-    
-    except httpx.RequestError as e:
-        logger.error(f"❌ Failed to notify Java backend: {e}")
-    except Exception as e:
-        logger.error(f"❌ Unexpected error notifying Java backend: {e}")
 
 
 # Health check endpoints
@@ -173,11 +346,18 @@ async def root():
     }
 
 
+@app.get("/livez")
 @app.get("/health")
-async def health_check():
-    """Health check endpoint"""
+async def liveness_check():
+    """Liveness probe: constant body, never touches MCP state"""
+    return Response(_LIVEZ_BYTES, media_type="application/json")
+
+
+@app.get("/readyz")
+async def readiness_check():
+    """Readiness probe: reports MCP connection status"""
     if not mcp_client:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=503,
             content={"status": "initializing", "message": "MCP client not initialized"}
         )
@@ -196,88 +376,164 @@ async def health_check():
 
 
 # Main security event processing endpoint
-@app.post("/api/v1/security-event", response_model=SecurityResponse)
-async def process_security_event(
-    event: SecurityEvent,
-    request: Request,
-    background_tasks: BackgroundTasks
-):
+@app.post(
+    "/api/v1/security-event",
+    response_model=SecurityResponse,
+    dependencies=[Depends(require_mcp_connection)]
+)
+async def process_security_event(event: SecurityEvent):
     """
     Process security event from Java backend
     
     This is the main endpoint that receives security events and triggers
     intelligent threat analysis and automated response actions.
     """
-    correlation_id = request.state.correlation_id
-    logger.info(f"📨 Received security event: {event.event_type} from {event.source_ip}",
-               extra={'correlation_id': correlation_id})
-    
-    # Ensure MCP client is connected
-    if not mcp_client.is_connected():
-        logger.warning("MCP client not connected, attempting to connect...",
-                      extra={'correlation_id': correlation_id})
-        try:
-            await mcp_client.connect()
-        except Exception as e:
-            logger.error(f"Failed to connect to MCP server: {e}",
-                        extra={'correlation_id': correlation_id})
-            raise HTTPException(
-                status_code=503,
-                detail="Cannot connect to security tools server"
-            )
+    correlation_id = CORRELATION_ID.get()
+    logger.info("📨 Received security event: %s from %s", event.event_type, event.source_ip)
     
     try:
-        # Analyze threat and execute actions
-        actions = await threat_analyzer.analyze_and_respond(event)
-        
-        # Calculate overall success
-        success = any(action.success for action in actions) if actions else False
+        response, shared = await _single_flight_event(event, correlation_id)
         
-        # Get threat assessment
-        assessment = threat_analyzer._assess_threat(event)
+        if shared:
+            # Reuse the actions of an identical in-flight/just-finished event, but
+            # still count this one toward the IP's history (failed-login thresholds)
+            await threat_analyzer.record_event(event)
+            response = response.model_copy(update={"correlation_id": correlation_id})
+            logger.info("♻️  Duplicate %s from %s, reusing result", event.event_type.value, event.source_ip)
         
-        response = SecurityResponse(
-            success=success,
-            event_type=event.event_type.value,
-            source_ip=event.source_ip,
-            threat_score=assessment.threat_score,
-            actions_taken=actions,
-            correlation_id=correlation_id
+        # Already a validated SecurityResponse: serialize it directly with the
+        # model's compiled serializer instead of FastAPI's jsonable_encoder pass
+        return Response(
+            content=_SECURITY_RESPONSE_ADAPTER.dump_json(response),
+            media_type="application/json"
         )
+    
+    except Exception as e:
+        logger.error("❌ Error processing security event: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _single_flight_event(event: SecurityEvent, correlation_id: str):
+    """
+    Run the analysis pipeline once per (source_ip, event_type) at a time
+    
+    Duplicates arriving while an event is being handled, or within
+    SECURITY_EVENT_DEDUP_SECONDS after it finished, get that event's response.
+    
+    Returns:
+        (response, shared) where shared is True if the response was reused
+    """
+    key = (event.source_ip, event.event_type)
+    loop = asyncio.get_running_loop()
+    inflight = app.state.inflight_events
+    recent = app.state.recent_events
+    
+    cached = recent.get(key)
+    if cached and cached[0] > loop.time():
+        return cached[1], True
+    
+    pending = inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending), True
+    
+    future = loop.create_future()
+    inflight[key] = future
+    try:
+        response = await _analyze_event(event, correlation_id)
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved in case nobody was waiting
+        raise
+    finally:
+        del inflight[key]
+        if not future.done():
+            future.cancel()
+    
+    future.set_result(response)
+    now = loop.time()
+    if len(recent) >= _RECENT_EVENTS_PRUNE_AT:
+        for k in [k for k, (expires, _) in recent.items() if expires <= now]:
+            del recent[k]
+    recent[key] = (now + _EVENT_DEDUP_SECONDS, response)
+    return response, False
+
+
+async def _analyze_event(event: SecurityEvent, correlation_id: str) -> SecurityResponse:
+    """Analyze the threat, execute actions and queue the Java notification"""
+    # Analyze threat and execute actions
+    analysis = await threat_analyzer.analyze_and_respond(event)
+    response = _security_response(event, analysis, correlation_id)
+    logger.info("✅ Security event processed: %s actions taken", len(response.actions_taken))
+    return response
+
+
+def _security_response(event: SecurityEvent, analysis: AnalyzeResult, correlation_id: str) -> SecurityResponse:
+    """Build the response for an analyzed event and queue the Java notification"""
+    actions = analysis.actions
+    
+    # Calculate overall success
+    success = any(action.success for action in actions) if actions else False
+    
+    response = SecurityResponse(
+        success=success,
+        event_type=event.event_type.value,
+        source_ip=event.source_ip,
+        threat_score=analysis.assessment.threat_score,
+        actions_taken=actions,
+        correlation_id=correlation_id
+    )
+    
+    # Notify Java backend via the notification worker
+    enqueue_notification("security_event_processed", response.model_dump(mode="json"))
+    return response
+
+
+# Batch security event endpoint
+@app.post(
+    "/api/v1/security-events/batch",
+    response_model=List[SecurityResponse],
+    dependencies=[Depends(require_mcp_connection)]
+)
+async def process_security_events(events: List[SecurityEvent]):
+    """
+    Process a burst of security events from Java backend
+    
+    Events are grouped by source IP and each IP is assessed and acted on
+    once, so the response holds one entry per source IP rather than one
+    per event.
+    """
+    correlation_id = CORRELATION_ID.get()
+    logger.info("📨 Received %d security events", len(events))
+    
+    try:
+        results = await threat_analyzer.analyze_batch(events)
+        responses = [
+            _security_response(event, analysis, correlation_id)
+            for event, analysis in results
+        ]
+        logger.info("✅ Security event batch processed: %d IPs", len(responses))
         
-        # Notify Java backend in background
-        background_tasks.add_task(
-            notify_java_backend,
-            "security_event_processed",
-            response.dict()
+        return Response(
+            content=_SECURITY_RESPONSES_ADAPTER.dump_json(responses),
+            media_type="application/json"
         )
-        
-        logger.info(f"✅ Security event processed: {len(actions)} actions taken",
-                   extra={'correlation_id': correlation_id})
-        
-        return response
     
     except Exception as e:
-        logger.error(f"❌ Error processing security event: {e}", exc_info=True,
-                    extra={'correlation_id': correlation_id})
+        logger.error("❌ Error processing security event batch: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # Manual scan endpoint
-@app.post("/api/v1/scan/execute")
-async def execute_scan(scan_request: ScanRequest, request: Request):
+@app.post("/api/v1/scan/execute", dependencies=[Depends(require_mcp_connection)])
+async def execute_scan(scan_request: ScanRequest):
     """
     Manually trigger a security scan
     
     Args:
         scan_request: Scan parameters (target_ip, scan_type)
     """
-    correlation_id = request.state.correlation_id
-    logger.info(f"🔍 Manual scan requested: {scan_request.scan_type} on {scan_request.target_ip}",
-               extra={'correlation_id': correlation_id})
-    
-    if not mcp_client.is_connected():
-        await mcp_client.connect()
+    correlation_id = CORRELATION_ID.get()
+    logger.info("🔍 Manual scan requested: %s on %s", scan_request.scan_type, scan_request.target_ip)
     
     try:
         if scan_request.scan_type == "quick":
@@ -289,30 +545,26 @@ async def execute_scan(scan_request: ScanRequest, request: Request):
             "success": True,
             "scan_type": scan_request.scan_type,
             "target_ip": scan_request.target_ip,
-            "result": json.loads(result) if result else None,
+            "result": await _parse_tool_result(result),
             "correlation_id": correlation_id
         }
     
     except Exception as e:
-        logger.error(f"❌ Scan failed: {e}", extra={'correlation_id': correlation_id})
+        logger.error("❌ Scan failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # Manual IP block endpoint
-@app.post("/api/v1/block-ip")
-async def block_ip_address(block_request: BlockIPRequest, request: Request):
+@app.post("/api/v1/block-ip", dependencies=[Depends(require_mcp_connection)])
+async def block_ip_address(block_request: BlockIPRequest):
     """
     Manually block an IP address
     
     Args:
         block_request: IP address and reason
     """
-    correlation_id = request.state.correlation_id
-    logger.warning(f"🚫 Manual IP block requested: {block_request.ip_address}",
-                  extra={'correlation_id': correlation_id})
-    
-    if not mcp_client.is_connected():
-        await mcp_client.connect()
+    correlation_id = CORRELATION_ID.get()
+    logger.warning("🚫 Manual IP block requested: %s", block_request.ip_address)
     
     try:
         result = await mcp_client.block_ip(
@@ -323,12 +575,12 @@ async def block_ip_address(block_request: BlockIPRequest, request: Request):
         return {
             "success": True,
             "ip_address": block_request.ip_address,
-            "result": json.loads(result) if result else None,
+            "result": await _parse_tool_result(result),
             "correlation_id": correlation_id
         }
     
     except Exception as e:
-        logger.error(f"❌ Block failed: {e}", extra={'correlation_id': correlation_id})
+        logger.error("❌ Block failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -359,34 +611,27 @@ async def get_ip_reputation(ip_address: str):
     if not threat_analyzer:
         raise HTTPException(status_code=503, detail="Threat analyzer not initialized")
     
-    reputation = threat_analyzer.get_ip_reputation(ip_address)
-    return reputation
+    return await threat_analyzer.get_ip_reputation(ip_address)
 
 
 # System health endpoint
-@app.get("/api/v1/system/health")
+@app.get("/api/v1/system/health", dependencies=[Depends(require_mcp_connection)])
 async def get_system_health():
     """Get Kali server system health"""
-    if not mcp_client.is_connected():
-        raise HTTPException(status_code=503, detail="MCP client not connected")
-    
     try:
         result = await mcp_client.get_system_health()
-        return json.loads(result)
+        return await _parse_tool_result(result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # Failed logins endpoint
-@app.get("/api/v1/logs/failed-logins")
+@app.get("/api/v1/logs/failed-logins", dependencies=[Depends(require_mcp_connection)])
 async def get_failed_logins(hours: int = 24):
     """Get failed login attempts from Kali server"""
-    if not mcp_client.is_connected():
-        raise HTTPException(status_code=503, detail="MCP client not connected")
-    
     try:
         result = await mcp_client.get_failed_logins(hours)
-        return json.loads(result)
+        return await _parse_tool_result(result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -395,244 +640,217 @@ async def get_failed_logins(hours: int = 24):
 # SSH DEFENSIVE ACTIONS ENDPOINTS
 # ============================================
 
-@app.post("/api/v1/defense/shutdown")
-async def emergency_shutdown(request: Request, delay: int = 1):
-    """
-    Emergency system shutdown (nuclear option)
-    Use when critical threat detected and system compromise suspected
-    """
-    correlation_id = request.state.correlation_id
-    logger.critical(f"🚨 EMERGENCY SHUTDOWN REQUESTED - Delay: {delay} minutes",
-                   extra={'correlation_id': correlation_id})
-    
-    try:
-        actions = get_defensive_actions()
-        result = actions.shutdown_system(delay=delay)
-        
-        logger.critical(f"Shutdown initiated: {result}",
-                       extra={'correlation_id': correlation_id})
-        
-        return {
-            "success": result["success"],
-            "message": f"System shutdown scheduled in {delay} minute(s)",
-            "result": result,
-            "correlation_id": correlation_id
-        }
-    except Exception as e:
-        logger.error(f"Failed to shutdown system: {e}",
-                    extra={'correlation_id': correlation_id})
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@app.post("/api/v1/defense/cancel-shutdown")
-async def cancel_emergency_shutdown(request: Request):
-    """Cancel pending shutdown"""
-    correlation_id = request.state.correlation_id
-    logger.info("Cancelling system shutdown", extra={'correlation_id': correlation_id})
-    
-    try:
-        actions = get_defensive_actions()
-        result = actions.cancel_shutdown()
-        
-        return {
-            "success": result["success"],
-            "message": "Shutdown cancelled",
-            "result": result,
-            "correlation_id": correlation_id
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+async def app_defensive_actions(request: Request) -> DefensiveActions:
+    """Dependency: the DefensiveActions instance created at startup"""
+    return request.app.state.defensive_actions
 
 
-@app.post("/api/v1/defense/reboot")
-async def emergency_reboot(request: Request, delay: int = 1):
-    """Emergency system reboot"""
-    correlation_id = request.state.correlation_id
-    logger.critical(f"🔄 EMERGENCY REBOOT REQUESTED - Delay: {delay} minutes",
-                   extra={'correlation_id': correlation_id})
-    
-    try:
-        actions = get_defensive_actions()
-        result = actions.reboot_system(delay=delay)
-        
-        return {
-            "success": result["success"],
-            "message": f"System reboot scheduled in {delay} minute(s)",
-            "result": result,
-            "correlation_id": correlation_id
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+async def invalidates_system_cache(request: Request):
+    """Dependency: drop cached system queries once a state-changing action is done"""
+    yield
+    request.app.state.system_cache.clear()
 
 
-@app.post("/api/v1/defense/block-ip-ssh")
-async def block_ip_via_ssh(request: BlockIPRequest):
-    """Block IP address via SSH/iptables (alternative to MCP)"""
-    logger.warning(f"🚫 SSH IP Block requested: {request.ip_address}")
+async def _cached_system_query(request: Request, key: str, query) -> Dict[str, Any]:
+    """
+    Run a read-only SSH query, reusing a successful result for SYSTEM_CACHE_TTL
     
-    try:
-        actions = get_defensive_actions()
-        result = actions.block_ip(request.ip_address)
+    Args:
+        request: Current request (the cache lives on app.state)
+        key: Cache key for this query
+        query: Zero-argument coroutine function performing the query
         
-        return {
-            "success": result["success"],
-            "message": f"IP {request.ip_address} blocked via iptables",
-            "result": result
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@app.post("/api/v1/defense/unblock-ip-ssh")
-async def unblock_ip_via_ssh(ip_address: str):
-    """Unblock IP address via SSH/iptables"""
-    logger.info(f"✅ SSH IP Unblock requested: {ip_address}")
+    Returns:
+        The query result dict
+    """
+    cache = request.app.state.system_cache
+    now = time.monotonic()
+    hit = cache.get(key)
+    if hit and hit[0] > now:
+        return hit[1]
     
-    try:
-        actions = get_defensive_actions()
-        result = actions.unblock_ip(ip_address)
-        
-        return {
-            "success": result["success"],
-            "message": f"IP {ip_address} unblocked",
-            "result": result
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    result = await query()
+    if result["success"]:
+        cache[key] = (now + _SYSTEM_CACHE_TTL, result)
+    return result
 
 
-@app.post("/api/v1/defense/kill-user-sessions")
-async def kill_user_sessions(username: str, request: Request):
-    """Kill all sessions for a suspicious user"""
-    correlation_id = request.state.correlation_id
-    logger.warning(f"⚡ KILL USER SESSIONS: {username}",
-                  extra={'correlation_id': correlation_id})
-    
-    try:
-        actions = get_defensive_actions()
-        result = actions.kill_user_sessions(username)
-        
-        return {
-            "success": result["success"],
-            "message": f"All sessions for user '{username}' terminated",
-            "result": result,
-            "correlation_id": correlation_id
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+def _ok(message: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Response body shared by the defense endpoints (same keys, same order)"""
+    return {
+        "success": result["success"],
+        "message": message,
+        "result": result,
+        "correlation_id": CORRELATION_ID.get()
+    }
 
 
-@app.post("/api/v1/defense/disable-user")
-async def disable_user_account(username: str, request: Request):
-    """Disable a compromised user account"""
-    correlation_id = request.state.correlation_id
-    logger.warning(f"🔒 DISABLE USER ACCOUNT: {username}",
-                  extra={'correlation_id': correlation_id})
-    
-    try:
-        actions = get_defensive_actions()
-        result = actions.disable_user_account(username)
-        
-        return {
-            "success": result["success"],
-            "message": f"User account '{username}' disabled",
-            "result": result,
-            "correlation_id": correlation_id
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+@dataclass(frozen=True)
+class _DefenseRoute:
+    """One single-argument (or argument-less) DefensiveActions endpoint"""
+    path: str
+    name: str
+    doc: str
+    action: str  # DefensiveActions method, called with the route argument
+    log_level: int
+    log_msg: str  # %-style, formatted with the route argument
+    message: str  # str.format template, formatted with the route argument
+    param: Optional[inspect.Parameter] = None  # query parameter passed to action
+    changes_state: bool = True  # drop cached system queries afterwards
+    no_content: bool = False  # fire-and-forget: 204 on success, JSON only on failure
+
+
+def _query(name: str, annotation: type, default: Any = inspect.Parameter.empty) -> inspect.Parameter:
+    return inspect.Parameter(name, inspect.Parameter.KEYWORD_ONLY, default=default, annotation=annotation)
+
+
+_DEFENSE_ROUTES = (
+    _DefenseRoute(
+        "/api/v1/defense/shutdown", "emergency_shutdown",
+        "Emergency system shutdown (nuclear option). Use when critical threat "
+        "detected and system compromise suspected",
+        "shutdown_system", logging.CRITICAL,
+        "🚨 EMERGENCY SHUTDOWN REQUESTED - Delay: %s minutes",
+        "System shutdown scheduled in {} minute(s)",
+        _query("delay", int, 1), changes_state=False
+    ),
+    _DefenseRoute(
+        "/api/v1/defense/cancel-shutdown", "cancel_emergency_shutdown",
+        "Cancel pending shutdown",
+        "cancel_shutdown", logging.INFO,
+        "Cancelling system shutdown",
+        "Shutdown cancelled",
+        changes_state=False, no_content=True
+    ),
+    _DefenseRoute(
+        "/api/v1/defense/reboot", "emergency_reboot",
+        "Emergency system reboot",
+        "reboot_system", logging.CRITICAL,
+        "🔄 EMERGENCY REBOOT REQUESTED - Delay: %s minutes",
+        "System reboot scheduled in {} minute(s)",
+        _query("delay", int, 1), changes_state=False
+    ),
+    _DefenseRoute(
+        "/api/v1/defense/unblock-ip-ssh", "unblock_ip_via_ssh",
+        "Unblock IP address via SSH/iptables",
+        "unblock_ip", logging.INFO,
+        "✅ SSH IP Unblock requested: %s",
+        "IP {} unblocked",
+        _query("ip_address", str), no_content=True
+    ),
+    _DefenseRoute(
+        "/api/v1/defense/kill-user-sessions", "kill_user_sessions",
+        "Kill all sessions for a suspicious user",
+        "kill_user_sessions", logging.WARNING,
+        "⚡ KILL USER SESSIONS: %s",
+        "All sessions for user '{}' terminated",
+        _query("username", str)
+    ),
+    _DefenseRoute(
+        "/api/v1/defense/disable-user", "disable_user_account",
+        "Disable a compromised user account",
+        "disable_user_account", logging.WARNING,
+        "🔒 DISABLE USER ACCOUNT: %s",
+        "User account '{}' disabled",
+        _query("username", str)
+    ),
+    _DefenseRoute(
+        "/api/v1/defense/enable-user", "enable_user_account",
+        "Re-enable a user account",
+        "enable_user_account", logging.INFO,
+        "🔓 ENABLE USER ACCOUNT: %s",
+        "User account '{}' enabled",
+        _query("username", str), changes_state=False
+    ),
+    _DefenseRoute(
+        "/api/v1/defense/restart-service", "restart_service",
+        "Restart a system service",
+        "restart_service", logging.WARNING,
+        "🔄 RESTART SERVICE: %s",
+        "Service '{}' restarted",
+        _query("service_name", str)
+    ),
+    _DefenseRoute(
+        "/api/v1/defense/stop-service", "stop_service",
+        "Stop a system service",
+        "stop_service", logging.WARNING,
+        "⏹️  STOP SERVICE: %s",
+        "Service '{}' stopped",
+        _query("service_name", str)
+    ),
+    _DefenseRoute(
+        "/api/v1/defense/flush-firewall", "flush_firewall_rules",
+        "Flush all firewall rules (emergency unlock)",
+        "flush_all_firewall_rules", logging.CRITICAL,
+        "🚨 FLUSH ALL FIREWALL RULES",
+        "All firewall rules flushed"
+    ),
+)
 
 
-@app.post("/api/v1/defense/enable-user")
-async def enable_user_account(username: str, request: Request):
-    """Re-enable a user account"""
-    correlation_id = request.state.correlation_id
-    logger.info(f"🔓 ENABLE USER ACCOUNT: {username}",
-               extra={'correlation_id': correlation_id})
-    
-    try:
-        actions = get_defensive_actions()
-        result = actions.enable_user_account(username)
+def _make_defense_handler(route: _DefenseRoute):
+    """Build the endpoint coroutine for a _DefenseRoute"""
+    async def handler(actions: DefensiveActions, **params):
+        args = tuple(params.values())
+        logger.log(route.log_level, route.log_msg, *args)
         
-        return {
-            "success": result["success"],
-            "message": f"User account '{username}' enabled",
-            "result": result,
-            "correlation_id": correlation_id
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@app.post("/api/v1/defense/restart-service")
-async def restart_service(service_name: str, request: Request):
-    """Restart a system service"""
-    correlation_id = request.state.correlation_id
-    logger.warning(f"🔄 RESTART SERVICE: {service_name}",
-                  extra={'correlation_id': correlation_id})
-    
-    try:
-        actions = get_defensive_actions()
-        result = actions.restart_service(service_name)
+        try:
+            result = await getattr(actions, route.action)(*args)
+        except Exception as e:
+            logger.error("❌ %s failed: %s", route.name, e)
+            raise HTTPException(status_code=500, detail=str(e))
         
-        return {
-            "success": result["success"],
-            "message": f"Service '{service_name}' restarted",
-            "result": result,
-            "correlation_id": correlation_id
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@app.post("/api/v1/defense/stop-service")
-async def stop_service(service_name: str, request: Request):
-    """Stop a system service"""
-    correlation_id = request.state.correlation_id
-    logger.warning(f"⏹️  STOP SERVICE: {service_name}",
-                  extra={'correlation_id': correlation_id})
-    
-    try:
-        actions = get_defensive_actions()
-        result = actions.stop_service(service_name)
+        if route.no_content and result["success"]:
+            return Response(status_code=204)
         
-        return {
-            "success": result["success"],
-            "message": f"Service '{service_name}' stopped",
-            "result": result,
-            "correlation_id": correlation_id
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@app.post("/api/v1/defense/flush-firewall")
-async def flush_firewall_rules(request: Request):
-    """Flush all firewall rules (emergency unlock)"""
-    correlation_id = request.state.correlation_id
-    logger.critical("🚨 FLUSH ALL FIREWALL RULES",
-                   extra={'correlation_id': correlation_id})
+        body = _ok(route.message.format(*args), result)
+        if route.no_content:
+            return ORJSONResponse(body, status_code=500)
+        return body
+    
+    # FastAPI reads parameters from the signature, so publish the real one
+    handler.__signature__ = inspect.Signature([
+        *([route.param] if route.param else []),
+        _query("actions", DefensiveActions, Depends(app_defensive_actions)),
+    ])
+    handler.__name__ = route.name
+    handler.__doc__ = route.doc
+    return handler
+
+
+for _route in _DEFENSE_ROUTES:
+    app.post(
+        _route.path,
+        status_code=204 if _route.no_content else 200,
+        response_class=Response if _route.no_content else ORJSONResponse,
+        dependencies=[Depends(invalidates_system_cache)] if _route.changes_state else None
+    )(_make_defense_handler(_route))
+
+
+@app.post("/api/v1/defense/block-ip-ssh", dependencies=[Depends(invalidates_system_cache)])
+async def block_ip_via_ssh(
+    request: BlockIPRequest,
+    actions: DefensiveActions = Depends(app_defensive_actions)
+):
+    """Block IP address via SSH/iptables (alternative to MCP)"""
+    logger.warning("🚫 SSH IP Block requested: %s", request.ip_address)
     
     try:
-        actions = get_defensive_actions()
-        result = actions.flush_all_firewall_rules()
+        result = await actions.block_ip(request.ip_address)
         
-        return {
-            "success": result["success"],
-            "message": "All firewall rules flushed",
-            "result": result,
-            "correlation_id": correlation_id
-        }
+        return _ok(f"IP {request.ip_address} blocked via iptables", result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/v1/system/connections")
-async def get_active_connections():
+async def get_active_connections(
+    request: Request,
+    actions: DefensiveActions = Depends(app_defensive_actions)
+):
     """Get active network connections"""
     try:
-        actions = get_defensive_actions()
-        result = actions.get_active_connections()
+        result = await _cached_system_query(request, "get_active_connections", actions.get_active_connections)
         
         return {
             "success": result["success"],
@@ -644,11 +862,13 @@ async def get_active_connections():
 
 
 @app.get("/api/v1/system/load")
-async def get_system_load():
+async def get_system_load(
+    request: Request,
+    actions: DefensiveActions = Depends(app_defensive_actions)
+):
     """Get current system load and resource usage"""
     try:
-        actions = get_defensive_actions()
-        result = actions.get_system_load()
+        result = await _cached_system_query(request, "get_system_load", actions.get_system_load)
         
         return {
             "success": result["success"],
@@ -659,24 +879,21 @@ async def get_system_load():
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/v1/ssh/execute")
+@app.post("/api/v1/ssh/execute", dependencies=[Depends(invalidates_system_cache)])
 async def execute_custom_command(
     command: str,
     use_sudo: bool = False,
-    request: Request = None
+    actions: DefensiveActions = Depends(app_defensive_actions)
 ):
     """
     Execute custom SSH command (USE WITH CAUTION!)
     Requires admin privileges
     """
-    correlation_id = request.state.correlation_id if request else 'N/A'
-    logger.warning(f"⚠️  CUSTOM SSH COMMAND: {command} (sudo={use_sudo})",
-                  extra={'correlation_id': correlation_id})
+    correlation_id = CORRELATION_ID.get()
+    logger.warning("⚠️  CUSTOM SSH COMMAND: %s (sudo=%s)", command, use_sudo)
     
     try:
-        from ssh_executor import get_executor
-        executor = get_executor()
-        result = executor.execute_command(command, sudo=use_sudo)
+        result = await actions.executor.execute_command(command, sudo=use_sudo)
         
         return {
             "success": result["success"],
@@ -695,9 +912,8 @@ async def execute_custom_command(
 async def http_exception_handler(request: Request, exc: HTTPException):
     """Handle HTTP exceptions"""
     correlation_id = getattr(request.state, 'correlation_id', 'N/A')
-    logger.error(f"HTTP exception: {exc.status_code} - {exc.detail}",
-                extra={'correlation_id': correlation_id})
-    return JSONResponse(
+    logger.error("HTTP exception: %s - %s", exc.status_code, exc.detail)
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={
             "error": exc.detail,
@@ -710,9 +926,10 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 async def general_exception_handler(request: Request, exc: Exception):
     """Handle general exceptions"""
     correlation_id = getattr(request.state, 'correlation_id', 'N/A')
-    logger.error(f"Unhandled exception: {exc}", exc_info=True,
-                extra={'correlation_id': correlation_id})
-    return JSONResponse(
+    # Runs in ServerErrorMiddleware, after add_correlation_id has reset the var
+    CORRELATION_ID.set(correlation_id)
+    logger.error("Unhandled exception: %s", exc, exc_info=True)
+    return ORJSONResponse(
         status_code=500,
         content={
             "error": "Internal server error",
@@ -727,8 +944,12 @@ if __name__ == "__main__":
     
     logger.info("🚀 Starting AI Brain API server...")
     uvicorn.run(
-        app,
+        "main:app",  # import string, so each worker builds its own app
         host=settings.HOST,
         port=settings.PORT,
+        workers=settings.WEB_CONCURRENCY,
+        loop="uvloop",
+        http="httptools",
+        lifespan="on",  # fail startup if lifespan fails rather than serve without app.state
         log_level=settings.LOG_LEVEL.lower()
     )
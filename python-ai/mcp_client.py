@@ -2,8 +2,10 @@
 
 import asyncio
 import logging
-from typing import Optional, List, Dict, Any
+import random
+from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime
+import orjson
 from mcp import ClientSession
 from mcp.client.sse import sse_client
 from config import settings
@@ -26,10 +28,23 @@ class MCPClientManager:
         self.write_stream = None
         self._connected = False
         self._available_tools: List[str] = []
+        # Same names as a frozenset for the per-call membership check
+        self._available_tools_set: frozenset = frozenset()
         self._connection_attempts = 0
         self._last_connection_attempt: Optional[datetime] = None
+        # Serializes (re)connects so concurrent callers share one handshake
+        self._connect_lock = asyncio.Lock()
+        # Serializes tool-list refreshes triggered by unknown tool names
+        self._discover_lock = asyncio.Lock()
+        # Background reconnect supervisor (see start_supervisor); ready is set
+        # on the first successful connect, _lost whenever the session drops
+        self._supervisor_task: Optional[asyncio.Task] = None
+        self.ready = asyncio.Event()
+        self._lost = asyncio.Event()
+        # In-flight tool calls keyed by (tool name, canonical JSON arguments)
+        self._inflight: Dict[Tuple[str, bytes], asyncio.Future] = {}
         
-        logger.info(f"MCP Client Manager initialized for {server_url}")
+        logger.info("MCP Client Manager initialized for %s", server_url)
     
     async def connect(self, retry: bool = True) -> bool:
         """
@@ -52,7 +67,7 @@ class MCPClientManager:
                 self._connection_attempts = attempt
                 self._last_connection_attempt = datetime.utcnow()
                 
-                logger.info(f"🔌 Connecting to Kali MCP Server at {self.server_url} (attempt {attempt}/{max_retries})")
+                logger.info("🔌 Connecting to Kali MCP Server at %s (attempt %s/%s)", self.server_url, attempt, max_retries)
                 
                 # Create SSE client connection with auth headers
                 headers = {}
@@ -83,22 +98,87 @@ class MCPClientManager:
                 return True
             
             except asyncio.TimeoutError:
-                logger.error(f"⏱️  Connection timeout (attempt {attempt}/{max_retries})")
+                logger.error("⏱️  Connection timeout (attempt %s/%s)", attempt, max_retries)
             except ConnectionRefusedError:
-                logger.error(f"🚫 Connection refused - is Kali server running? (attempt {attempt}/{max_retries})")
+                logger.error("🚫 Connection refused - is Kali server running? (attempt %s/%s)", attempt, max_retries)
             except Exception as e:
-                logger.error(f"❌ Connection failed: {e} (attempt {attempt}/{max_retries})")
+                logger.error("❌ Connection failed: %s (attempt %s/%s)", e, attempt, max_retries)
             
             # Exponential backoff before retry
             if attempt < max_retries:
                 delay = settings.MCP_RETRY_DELAY * (2 ** (attempt - 1))
-                logger.info(f"⏳ Retrying in {delay} seconds...")
+                logger.info("⏳ Retrying in %s seconds...", delay)
                 await asyncio.sleep(delay)
         
         self._connected = False
-        logger.error(f"❌ Failed to connect after {max_retries} attempts")
+        logger.error("❌ Failed to connect after %s attempts", max_retries)
         return False
     
+    async def ensure_connected(self) -> bool:
+        """
+        Connect if needed; concurrent callers wait for the same attempt
+        
+        While the reconnect supervisor is running it owns the retry ladder,
+        so this fails fast instead of making the caller wait through it.
+        
+        Returns:
+            True if connected, False if the connection attempt failed
+        """
+        if self._connected:
+            return True
+        if self._supervisor_task and not self._supervisor_task.done():
+            return False
+        async with self._connect_lock:
+            if self._connected:
+                return True
+            return await self.connect()
+    
+    def start_supervisor(self):
+        """Start the background task that (re)connects whenever the session is down"""
+        if self._supervisor_task is None or self._supervisor_task.done():
+            self._supervisor_task = asyncio.create_task(self._supervise())
+    
+    async def stop_supervisor(self):
+        """Stop the reconnect supervisor"""
+        if self._supervisor_task:
+            self._supervisor_task.cancel()
+            try:
+                await self._supervisor_task
+            except asyncio.CancelledError:
+                pass
+            self._supervisor_task = None
+    
+    async def _supervise(self):
+        """Reconnect with capped, jittered exponential backoff; idle while connected"""
+        failures = 0
+        while True:
+            if self._connected:
+                self.ready.set()
+                self._lost.clear()
+                await self._lost.wait()
+                failures = 0
+                continue
+            
+            async with self._connect_lock:
+                connected = self._connected or await self.connect(retry=False)
+            if connected:
+                failures = 0
+                continue
+            
+            # Jitter keeps a fleet of controllers from reconnecting in lockstep
+            delay = min(
+                settings.MCP_RECONNECT_MAX_DELAY,
+                settings.MCP_RETRY_DELAY * (2 ** failures)
+            ) * random.uniform(0.5, 1.5)
+            failures += 1
+            logger.warning("⚠️  Kali MCP Server unavailable, retrying in %.1fs", delay)
+            await asyncio.sleep(delay)
+    
+    def _mark_disconnected(self):
+        """Flag the session as dead and wake the supervisor"""
+        self._connected = False
+        self._lost.set()
+    
     async def disconnect(self):
         """Disconnect from Kali MCP server"""
         if not self._connected:
@@ -109,9 +189,10 @@ class MCPClientManager:
                 await self.session.__aexit__(None, None, None)
             self._connected = False
             self._available_tools = []
+            self._available_tools_set = frozenset()
             logger.info("👋 Disconnected from Kali MCP Server")
         except Exception as e:
-            logger.error(f"Error during disconnect: {e}")
+            logger.error("Error during disconnect: %s", e)
     
     async def reconnect(self) -> bool:
         """Disconnect and reconnect"""
@@ -126,16 +207,21 @@ class MCPClientManager:
             
             tools_response = await self.session.list_tools()
             self._available_tools = [tool.name for tool in tools_response.tools]
+            self._available_tools_set = frozenset(self._available_tools)
             
-            logger.info(f"📋 Available tools: {', '.join(self._available_tools)}")
+            logger.info("📋 Available tools: %s", ', '.join(self._available_tools))
         except Exception as e:
-            logger.error(f"Error discovering tools: {e}")
+            logger.error("Error discovering tools: %s", e)
             self._available_tools = []
+            self._available_tools_set = frozenset()
     
     async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> str:
         """
         Call a tool on the Kali MCP server
         
+        Identical calls (same tool and arguments) made while one is already
+        in flight share its result instead of sending another request.
+        
         Args:
             tool_name: Name of the tool to invoke
             arguments: Dictionary of arguments for the tool
@@ -143,22 +229,45 @@ class MCPClientManager:
         Returns:
             String result from the tool execution
         """
+        key = (tool_name, orjson.dumps(arguments, option=orjson.OPT_SORT_KEYS))
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._call_tool(tool_name, arguments))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._call_done(key, t))
+        # Shielded so one caller being cancelled does not cancel the others
+        return await asyncio.shield(task)
+    
+    def _call_done(self, key: Tuple[str, bytes], task: asyncio.Future):
+        """Forget a finished in-flight call"""
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # mark retrieved in case every caller went away
+    
+    async def _call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> str:
+        """Send one tool call over the session (see call_tool)"""
         # Ensure connected
         if not self._connected:
             logger.warning("Not connected, attempting to connect...")
-            if not await self.connect():
+            if not await self.ensure_connected():
                 raise RuntimeError("Failed to connect to MCP server")
         
         # Validate tool exists
-        if tool_name not in self._available_tools:
-            logger.warning(f"Tool '{tool_name}' not in cached tools, refreshing...")
-            await self._discover_tools()
-            if tool_name not in self._available_tools:
+        if tool_name not in self._available_tools_set:
+            logger.warning("Tool '%s' not in cached tools, refreshing...", tool_name)
+            # Concurrent misses share one list_tools() round-trip
+            async with self._discover_lock:
+                if tool_name not in self._available_tools_set:
+                    await self._discover_tools()
+            if tool_name not in self._available_tools_set:
                 raise ValueError(f"Tool '{tool_name}' not available on MCP server")
         
         try:
-            logger.info(f"🔧 Calling tool '{tool_name}' with arguments: {arguments}")
+            logger.info("🔧 Calling tool '%s' with arguments: %s", tool_name, arguments)
             
+            # No send lock needed: ClientSession queues each JSON-RPC message
+            # whole onto its write stream and matches replies by request id,
+            # so concurrent calls cannot interleave on the wire
             result = await asyncio.wait_for(
                 self.session.call_tool(tool_name, arguments),
                 timeout=settings.MCP_CONNECTION_TIMEOUT
@@ -167,26 +276,48 @@ class MCPClientManager:
             # Extract text content from result
             if result.content and len(result.content) > 0:
                 text_result = result.content[0].text
-                logger.info(f"✅ Tool '{tool_name}' completed successfully")
+                logger.info("✅ Tool '%s' completed successfully", tool_name)
                 return text_result
             else:
-                logger.warning(f"Tool '{tool_name}' returned no content")
+                logger.warning("Tool '%s' returned no content", tool_name)
                 return '{"error": "No output from tool"}'
         
         except asyncio.TimeoutError:
             error_msg = f"Tool '{tool_name}' timed out after {settings.MCP_CONNECTION_TIMEOUT}s"
-            logger.error(f"⏱️  {error_msg}")
+            logger.error("⏱️  %s", error_msg)
             raise RuntimeError(error_msg)
         
         except Exception as e:
             error_msg = f"Error calling tool '{tool_name}': {str(e)}"
-            logger.error(f"❌ {error_msg}")
+            logger.error("❌ %s", error_msg)
             # Attempt reconnect on certain errors
             if "connection" in str(e).lower() or "stream" in str(e).lower():
                 logger.info("🔄 Connection error detected, will reconnect on next call")
-                self._connected = False
+                self._mark_disconnected()
             raise RuntimeError(error_msg)
     
+    async def call_many(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[Any]:
+        """
+        Call several tools concurrently over the shared session
+    
+        Requests are multiplexed by JSON-RPC id, so N independent calls cost
+        about one round-trip instead of N.
+    
+        Args:
+            calls: (tool_name, arguments) pairs
+    
+        Returns:
+            Results in the same order as calls; a failed call yields its
+            exception instead of a string
+        """
+        if not await self.ensure_connected():
+            raise RuntimeError("Failed to connect to MCP server")
+    
+        return await asyncio.gather(
+            *(self.call_tool(name, args) for name, args in calls),
+            return_exceptions=True
+        )
+    
     # Convenience methods for specific tools
     
     async def nmap_quick_scan(self, target_ip: str) -> str:
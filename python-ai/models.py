@@ -1,11 +1,42 @@
 """Pydantic models for request/response validation"""
 
+import socket
+import time
 from typing import Dict, Any, Optional, List
 from datetime import datetime
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from enum import Enum
 
 
+# Models are built once per request and never mutated afterwards
+_MODEL_CONFIG = ConfigDict(extra="ignore", frozen=True, str_strip_whitespace=True)
+
+
+_now_cache = {"second": None, "iso": ""}
+
+
+def _utc_now_iso() -> str:
+    """Default timestamp for models: UTC ISO string at second resolution,
+    formatted once per second rather than once per instance"""
+    second = int(time.time())
+    if second != _now_cache["second"]:
+        _now_cache["iso"] = datetime.utcfromtimestamp(second).isoformat()
+        _now_cache["second"] = second
+    return _now_cache["iso"]
+
+
+def _validate_ipv4(v: str) -> str:
+    """Shared IP field check: a dotted-quad IPv4 address, returned unchanged"""
+    # inet_aton alone also takes "1.2.3.4 junk", "010.1.1.1" and hex parts;
+    # requiring the canonical round-trip keeps only plain dotted quads
+    try:
+        if socket.inet_ntoa(socket.inet_aton(v)) == v:
+            return v
+    except (OSError, TypeError, ValueError):
+        pass
+    raise ValueError('Invalid IP address format')
+
+
 class EventType(str, Enum):
     """Security event types"""
     FAILED_LOGIN_ATTEMPT = "failed_login_attempt"
@@ -28,31 +59,26 @@ class SeverityLevel(str, Enum):
 
 class SecurityEvent(BaseModel):
     """Incoming security event from Java backend"""
+    model_config = _MODEL_CONFIG
+    
     event_type: EventType = Field(..., description="Type of security event")
     source_ip: str = Field(..., description="Source IP address of the event")
-    timestamp: Optional[str] = Field(default_factory=lambda: datetime.utcnow().isoformat())
+    timestamp: Optional[str] = Field(default_factory=_utc_now_iso)
     severity: SeverityLevel = Field(default=SeverityLevel.MEDIUM)
     details: Dict[str, Any] = Field(default_factory=dict)
     metadata: Optional[Dict[str, Any]] = Field(default_factory=dict)
     
-    @validator('source_ip')
-    def validate_ip(cls, v):
+    @field_validator('source_ip')
+    @classmethod
+    def validate_ip(cls, v: str) -> str:
         """Validate IP address format"""
-        if not v:
-            raise ValueError('source_ip is required')
-        parts = v.split('.')
-        if len(parts) != 4:
-            raise ValueError('Invalid IP address format')
-        try:
-            if not all(0 <= int(part) <= 255 for part in parts):
-                raise ValueError('Invalid IP address range')
-        except (ValueError, TypeError):
-            raise ValueError('Invalid IP address')
-        return v
+        return _validate_ipv4(v)
 
 
 class ThreatAssessment(BaseModel):
     """Threat assessment result"""
+    model_config = _MODEL_CONFIG
+    
     threat_score: int = Field(..., ge=0, le=100, description="Threat score (0-100)")
     threat_level: SeverityLevel
     recommended_action: str
@@ -63,67 +89,63 @@ class ThreatAssessment(BaseModel):
 
 class ActionResponse(BaseModel):
     """Response from taking security action"""
+    model_config = _MODEL_CONFIG
+    
     success: bool
     action_taken: str
     tool_used: Optional[str] = None
     result: Optional[str] = None
     error: Optional[str] = None
-    timestamp: str = Field(default_factory=lambda: datetime.utcnow().isoformat())
+    timestamp: str = Field(default_factory=_utc_now_iso)
 
 
 class SecurityResponse(BaseModel):
     """Final response to Java backend"""
+    model_config = _MODEL_CONFIG
+    
     success: bool
     event_type: str
     source_ip: str
     threat_score: int
     actions_taken: List[ActionResponse]
-    timestamp: str = Field(default_factory=lambda: datetime.utcnow().isoformat())
+    timestamp: str = Field(default_factory=_utc_now_iso)
     correlation_id: Optional[str] = None
 
 
 class ScanRequest(BaseModel):
     """Manual scan request"""
+    model_config = _MODEL_CONFIG
+    
     target_ip: str
     scan_type: str = Field(default="quick", pattern="^(quick|vulnerability)$")
     
-    @validator('target_ip')
-    def validate_ip(cls, v):
+    @field_validator('target_ip')
+    @classmethod
+    def validate_ip(cls, v: str) -> str:
         """Validate IP address format"""
-        parts = v.split('.')
-        if len(parts) != 4:
-            raise ValueError('Invalid IP address format')
-        try:
-            if not all(0 <= int(part) <= 255 for part in parts):
-                raise ValueError('Invalid IP address range')
-        except (ValueError, TypeError):
-            raise ValueError('Invalid IP address')
-        return v
+        return _validate_ipv4(v)
 
 
 class BlockIPRequest(BaseModel):
     """Manual IP block request"""
+    model_config = _MODEL_CONFIG
+    
     ip_address: str
     reason: str = "Manual block via AI Controller"
     
-    @validator('ip_address')
-    def validate_ip(cls, v):
+    @field_validator('ip_address')
+    @classmethod
+    def validate_ip(cls, v: str) -> str:
         """Validate IP address format"""
-        parts = v.split('.')
-        if len(parts) != 4:
-            raise ValueError('Invalid IP address format')
-        try:
-            if not all(0 <= int(part) <= 255 for part in parts):
-                raise ValueError('Invalid IP address range')
-        except (ValueError, TypeError):
-            raise ValueError('Invalid IP address')
-        return v
+        return _validate_ipv4(v)
 
 
 class MCPStatus(BaseModel):
     """MCP server connection status"""
+    model_config = _MODEL_CONFIG
+    
     connected: bool
     server_url: str
     available_tools: List[str] = []
-    last_check: str = Field(default_factory=lambda: datetime.utcnow().isoformat())
+    last_check: str = Field(default_factory=_utc_now_iso)
     error: Optional[str] = None
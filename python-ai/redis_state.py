@@ -0,0 +1,116 @@
+"""
+Redis-backed threat state for AutoShield
+Shares per-IP event windows, cooldowns and blocked IPs between analyzer
+processes, and keeps them across restarts
+"""
+
+import logging
+import secrets
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+import orjson
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+# Events are scored over the last 24 hours; older entries are trimmed on
+# write and idle keys expire on their own
+WINDOW_SECONDS = 24 * 3600
+
+
+@dataclass
+class IPSnapshot:
+    """An IP's shared state, read back in the same round trip that records its events"""
+    recent_events: int  # events of any type in the window
+    recent_of_type: int  # events of the type being assessed
+    scan_cooling: bool
+    block_cooling: bool
+    blocked: bool  # in the blocked set
+
+
+class RedisThreatState:
+    """
+    Threat state kept in Redis
+    
+    Keys (all under the prefix):
+    - ev:<ip> and ev:<ip>:<event_type>: sorted sets of events scored by time
+    - scan:<ip> and block:<ip>: cooldown markers that expire with the cooldown
+    - blocked: set of blocked IPs
+    """
+    
+    def __init__(self, url: str, prefix: str = "autoshield"):
+        self.redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+    
+    def _key(self, *parts: str) -> str:
+        return ":".join((self.prefix, *parts))
+    
+    async def record_events(self, ip: str, events: List[Tuple[str, Dict]], lead_type: str,
+                            now: datetime) -> IPSnapshot:
+        """
+        Add events for ip and read back its state, pipelined into one round trip
+        
+        Args:
+            ip: Source IP of the events
+            events: (event_type, payload) pairs
+            lead_type: Event type whose window count is returned
+            now: Event time (naive UTC)
+        
+        Returns:
+            IPSnapshot of the IP after the events were added
+        """
+        score = now.replace(tzinfo=timezone.utc).timestamp()
+        by_type: Dict[str, Dict[bytes, float]] = defaultdict(dict)
+        for event_type, payload in events:
+            # The random id keeps identical events from collapsing into one member
+            member = orjson.dumps({**payload, "id": secrets.token_hex(8)}, default=str)
+            by_type[event_type][member] = score
+        
+        all_key = self._key("ev", ip)
+        all_members: Dict[bytes, float] = {}
+        for members in by_type.values():
+            all_members.update(members)
+        writes = [(all_key, all_members)]
+        writes += [(self._key("ev", ip, event_type), members) for event_type, members in by_type.items()]
+        
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, members in writes:
+                pipe.zremrangebyscore(key, "-inf", score - WINDOW_SECONDS)
+                pipe.zadd(key, members)
+                pipe.expire(key, WINDOW_SECONDS)
+            pipe.zcard(all_key)
+            pipe.zcard(self._key("ev", ip, lead_type))
+            pipe.exists(self._key("scan", ip))
+            pipe.exists(self._key("block", ip))
+            pipe.sismember(self._key("blocked"), ip)
+            *_, recent, recent_of_type, scan, block, blocked = await pipe.execute()
+        
+        return IPSnapshot(
+            recent_events=recent,
+            recent_of_type=recent_of_type,
+            scan_cooling=bool(scan),
+            block_cooling=bool(block),
+            blocked=bool(blocked)
+        )
+    
+    async def start_scan_cooldown(self, ip: str, seconds: int):
+        """Mark ip as recently scanned for seconds"""
+        await self.redis.set(self._key("scan", ip), 1, ex=seconds)
+    
+    async def mark_blocked(self, ip: str, cooldown_seconds: int):
+        """Add ip to the blocked set and start its block cooldown"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.sadd(self._key("blocked"), ip)
+            pipe.set(self._key("block", ip), 1, ex=cooldown_seconds)
+            await pipe.execute()
+    
+    async def is_blocked(self, ip: str) -> bool:
+        """Whether ip is in the blocked set"""
+        return bool(await self.redis.sismember(self._key("blocked"), ip))
+    
+    async def close(self):
+        """Close the Redis connection pool"""
+        await self.redis.aclose()
@@ -3,14 +3,78 @@ SSH Command Executor for AutoShield
 Allows AI to execute defensive commands on remote/local servers via SSH
 """
 
-import paramiko
+import asyncio
+import asyncssh
+import ipaddress
 import logging
-from typing import Optional, Dict, Any, List
+from contextlib import asynccontextmanager
+from functools import lru_cache, partial
+from typing import Optional, Dict, Any, List, Tuple
 from dataclasses import dataclass
 import os
+import re
+import secrets
+import shlex
+import weakref
 
 logger = logging.getLogger(__name__)
 
+_WHITESPACE = b" \t\r\n"
+
+# AEAD ciphers first: OpenSSL encrypts and authenticates each packet in one
+# call, with no separate MAC pass. CTR modes remain for servers without them.
+_ENCRYPTION_ALGS = [
+    "aes128-gcm@openssh.com",
+    "aes256-gcm@openssh.com",
+    "chacha20-poly1305@openssh.com",
+    "aes128-ctr",
+    "aes256-ctr",
+]
+
+# Modern key exchange only, so negotiation settles on a fast curve at once
+_KEX_ALGS = [
+    "curve25519-sha256",
+    "curve25519-sha256@libssh.org",
+    "ecdh-sha2-nistp256",
+]
+
+# Non-interactive sudo: fail at once instead of waiting for a password prompt
+_SUDO = "sudo -n "
+
+# Single-command DefensiveActions, with the sudo prefix baked in
+_KILL_SESSIONS = _SUDO + "pkill -KILL -u {}"
+_UNLOCK_USER = _SUDO + "usermod -U {}"
+_SHUTDOWN = _SUDO + "shutdown -h +{}"
+_CANCEL_SHUTDOWN = _SUDO + "shutdown -c"
+_REBOOT = _SUDO + "shutdown -r +{}"
+_SYSTEMCTL = _SUDO + "systemctl {} {}"
+_LIST_CONNECTIONS = _SUDO + "ss -tunap"
+
+# Batch step persisting IPv4 rules; execute_batch(sudo=True) prefixes the
+# iptables-save, and the file is written by a sudo'd tee, not a shell redirect
+_PERSIST_RULES = "iptables-save | " + _SUDO + "tee /etc/iptables/rules.v4 >/dev/null"
+_PERSIST_RULES_V6 = "ip6tables-save | " + _SUDO + "tee /etc/iptables/rules.v6 >/dev/null"
+
+
+def _firewall_for(ip: str) -> Tuple[str, str]:
+    """(iptables binary, persist step) for ip's address family; ValueError if ip is invalid"""
+    if ipaddress.ip_address(ip).version == 6:
+        return "ip6tables", _PERSIST_RULES_V6
+    return "iptables", _PERSIST_RULES
+
+
+def _decode_output(data: Optional[bytes]) -> str:
+    """Decode command output once, trimming surrounding whitespace in place"""
+    if not data:
+        return ""
+    start, end = 0, len(data)
+    while end and data[end - 1] in _WHITESPACE:
+        end -= 1
+    while start < end and data[start] in _WHITESPACE:
+        start += 1
+    # Slicing a memoryview doesn't copy, so the only copy is the decode itself
+    return str(memoryview(data)[start:end], "utf-8", "replace")
+
 
 @dataclass
 class SSHConfig:
@@ -21,6 +85,75 @@ class SSHConfig:
     password: Optional[str] = None
     key_file: Optional[str] = None
     timeout: int = 10
+    keepalive: int = 30  # seconds between SSH keepalives on an idle connection
+    max_connections: int = 4  # pooled connections, i.e. concurrent commands
+    reuse_shell: bool = False  # run commands in one long-lived shell per connection
+    known_hosts: Optional[str] = None  # host keys to verify against
+    fleet_hosts: Tuple[str, ...] = ()  # hosts a fleet action covers (default: just host)
+
+
+class SSHConnectionPool:
+    """
+    Pool of authenticated SSH connections to one host
+    
+    Each command borrows a connection for its duration, so at most
+    max_connections commands run at once and no connection exceeds the
+    server's per-connection session limit. Connections are opened on demand,
+    reused LIFO, and dropped once the server closes them.
+    """
+    
+    def __init__(self, connect, max_connections: int):
+        """
+        Args:
+            connect: Coroutine function opening a new connection (None on failure)
+            max_connections: Upper bound on open connections
+        """
+        self._connect = connect
+        self._slots = asyncio.Semaphore(max_connections)
+        self._idle: asyncio.LifoQueue = asyncio.LifoQueue()
+        self._open: set = set()
+    
+    def _track(self, conn: asyncssh.SSHClientConnection):
+        """Remember conn until it closes, from either side"""
+        self._open.add(conn)
+        closed = asyncio.ensure_future(conn.wait_closed())
+        closed.add_done_callback(lambda _: self._open.discard(conn))
+    
+    async def _checkout(self) -> Optional[asyncssh.SSHClientConnection]:
+        while not self._idle.empty():
+            conn = self._idle.get_nowait()
+            if conn in self._open:
+                return conn
+        conn = await self._connect()
+        if conn is not None:
+            self._track(conn)
+        return conn
+    
+    @asynccontextmanager
+    async def connection(self):
+        """Borrow a live connection (None if one cannot be opened)"""
+        async with self._slots:
+            conn = await self._checkout()
+            try:
+                yield conn
+            except BaseException:
+                # Broken, or left mid-command by an error or cancellation:
+                # close it rather than hand it out again or leak it
+                if conn is not None:
+                    self._open.discard(conn)
+                    conn.close()
+                raise
+            if conn is not None and conn in self._open:
+                self._idle.put_nowait(conn)
+    
+    async def close(self):
+        """Close every pooled connection"""
+        conns, self._open = list(self._open), set()
+        for conn in conns:
+            conn.close()
+        for conn in conns:
+            await conn.wait_closed()
+        self._idle = asyncio.LifoQueue()
 
 
 class SSHExecutor:
@@ -28,7 +161,12 @@ class SSHExecutor:
     
     def __init__(self):
         self.ssh_config = self._load_config()
-        self.client: Optional[paramiko.SSHClient] = None
+        self.pools: Dict[str, SSHConnectionPool] = {}
+        # Long-lived shell per pooled connection (SSH_REUSE_SHELL). A pool hands
+        # a connection to one command at a time, so its shell is never shared.
+        self._shells = weakref.WeakKeyDictionary()
+        # Parsed once here rather than re-read on every new connection
+        self._known_hosts = self._load_known_hosts()
         
     def _load_config(self) -> SSHConfig:
         """Load SSH configuration from environment"""
@@ -38,104 +176,138 @@ class SSHExecutor:
             username=os.getenv("SSH_USERNAME", "root"),
             password=os.getenv("SSH_PASSWORD"),
             key_file=os.getenv("SSH_KEY_FILE", "/root/.ssh/id_rsa"),
-            timeout=int(os.getenv("SSH_TIMEOUT", "10"))
+            timeout=int(os.getenv("SSH_TIMEOUT", "10")),
+            keepalive=int(os.getenv("SSH_KEEPALIVE", "30")),
+            max_connections=int(os.getenv("SSH_POOL_SIZE", "4")),
+            reuse_shell=os.getenv("SSH_REUSE_SHELL", "false").lower() == "true",
+            known_hosts=os.getenv("SSH_KNOWN_HOSTS", "/root/.ssh/known_hosts"),
+            fleet_hosts=tuple(h.strip() for h in os.getenv("SSH_FLEET_HOSTS", "").split(",") if h.strip())
         )
     
-    def connect(self) -> bool:
-        """Establish SSH connection"""
+    def _load_known_hosts(self) -> Optional[asyncssh.SSHKnownHosts]:
+        """Load the known_hosts file (None, i.e. no host key checking, if there isn't one)"""
+        path = self.ssh_config.known_hosts
+        if path and os.path.exists(path):
+            return asyncssh.read_known_hosts(path)
+        logger.warning("No known_hosts file at %s: SSH host keys will NOT be verified", path)
+        return None
+    
+    def _pool(self, host: Optional[str] = None) -> SSHConnectionPool:
+        """Connection pool for host (the configured SSH_HOST by default)"""
+        host = host or self.ssh_config.host
+        pool = self.pools.get(host)
+        if pool is None:
+            pool = self.pools[host] = SSHConnectionPool(
+                partial(self.connect, host), self.ssh_config.max_connections
+            )
+        return pool
+    
+    async def connect(self, host: Optional[str] = None) -> Optional[asyncssh.SSHClientConnection]:
+        """Open a new authenticated SSH connection to host (None on failure)"""
+        host = host or self.ssh_config.host
+        options = {
+            "host": host,
+            "port": self.ssh_config.port,
+            "username": self.ssh_config.username,
+            "connect_timeout": self.ssh_config.timeout,
+            # Connections are long-lived and mostly idle: keepalives stop
+            # NAT/firewalls from silently dropping them. (asyncio already sets
+            # TCP_NODELAY on the socket.)
+            "keepalive_interval": self.ssh_config.keepalive,
+            "tcp_keepalive": True,
+            # Unknown or changed host keys are rejected when a known_hosts
+            # file is present (otherwise any key is accepted)
+            "known_hosts": self._known_hosts,
+            "kex_algs": _KEX_ALGS,
+            "encryption_algs": _ENCRYPTION_ALGS,
+            # Command output is small; zlib would only add per-packet work
+            "compression_algs": None,
+        }
+        
+        # Try key-based auth first, then password
+        if self.ssh_config.key_file and os.path.exists(self.ssh_config.key_file):
+            logger.info("Connecting to %s with key authentication", host)
+            options["client_keys"] = [self.ssh_config.key_file]
+        elif self.ssh_config.password:
+            logger.info("Connecting to %s with password authentication", host)
+            options["password"] = self.ssh_config.password
+        else:
+            logger.error("No authentication method available (no key file or password)")
+            return None
+        
         try:
-            self.client = paramiko.SSHClient()
-            self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            # Try key-based auth first, then password
-            if self.ssh_config.key_file and os.path.exists(self.ssh_config.key_file):
-                logger.info(f"Connecting to {self.ssh_config.host} with key authentication")
-                self.client.connect(
-                    hostname=self.ssh_config.host,
-                    port=self.ssh_config.port,
-                    username=self.ssh_config.username,
-                    key_filename=self.ssh_config.key_file,
-                    timeout=self.ssh_config.timeout,
-                    look_for_keys=True,
-                    allow_agent=True
-                )
-            elif self.ssh_config.password:
-                logger.info(f"Connecting to {self.ssh_config.host} with password authentication")
-                self.client.connect(
-                    hostname=self.ssh_config.host,
-                    port=self.ssh_config.port,
-                    username=self.ssh_config.username,
-                    password=self.ssh_config.password,
-                    timeout=self.ssh_config.timeout
-                )
-            else:
-                logger.error("No authentication method available (no key file or password)")
-                return False
-            
-            logger.info(f"Successfully connected to {self.ssh_config.host}")
-            return True
+            conn = await asyncssh.connect(**options)
+            logger.info("Successfully connected to %s", host)
+            return conn
             
         except Exception as e:
-            logger.error(f"SSH connection failed: {e}")
-            return False
+            logger.error("SSH connection failed: %s", e)
+            return None
+    
+    async def ensure_connected(self, host: Optional[str] = None) -> bool:
+        """Make sure host's pool holds at least one live connection"""
+        async with self._pool(host).connection() as conn:
+            return conn is not None
     
-    def disconnect(self):
-        """Close SSH connection"""
-        if self.client:
-            self.client.close()
-            self.client = None
-            logger.info("SSH connection closed")
+    async def disconnect(self):
+        """Close all SSH connections, to every host"""
+        await asyncio.gather(*(pool.close() for pool in self.pools.values()))
+        logger.info("SSH connections closed")
     
-    def execute_command(self, command: str, sudo: bool = False) -> Dict[str, Any]:
+    async def execute_command(self, command: str, sudo: bool = False,
+                              host: Optional[str] = None) -> Dict[str, Any]:
         """
         Execute a command via SSH
         
         Args:
             command: Command to execute
             sudo: Whether to use sudo
+            host: Target host (defaults to SSH_HOST)
             
         Returns:
             Dict with stdout, stderr, exit_code
         """
-        if not self.client:
-            if not self.connect():
-                return {
-                    "success": False,
-                    "stdout": "",
-                    "stderr": "SSH connection failed",
-                    "exit_code": -1
-                }
+        # Add sudo if requested (DefensiveActions bake it into their templates)
+        if sudo:
+            command = _SUDO + command
         
         try:
-            # Add sudo if requested
-            if sudo and not command.startswith("sudo "):
-                command = f"sudo {command}"
-            
-            logger.info(f"Executing command: {command}")
-            
-            stdin, stdout, stderr = self.client.exec_command(command, timeout=30)
-            exit_code = stdout.channel.recv_exit_status()
-            
-            stdout_text = stdout.read().decode('utf-8').strip()
-            stderr_text = stderr.read().decode('utf-8').strip()
+            async with self._pool(host).connection() as conn:
+                if conn is None:
+                    return {
+                        "success": False,
+                        "stdout": "",
+                        "stderr": "SSH connection failed",
+                        "exit_code": -1,
+                        "command": command
+                    }
+                
+                logger.info("Executing command: %s", command)
+                if self.ssh_config.reuse_shell:
+                    exit_code, stdout, stderr = await self._run_in_shell(conn, command)
+                else:
+                    # Raw bytes: decoded once below instead of chunk by chunk
+                    completed = await conn.run(command, check=False, timeout=30, encoding=None)
+                    exit_code = completed.exit_status if completed.exit_status is not None else -1
+                    stdout, stderr = completed.stdout, completed.stderr
             
             result = {
                 "success": exit_code == 0,
-                "stdout": stdout_text,
-                "stderr": stderr_text,
+                "stdout": _decode_output(stdout),
+                "stderr": _decode_output(stderr),
                 "exit_code": exit_code,
                 "command": command
             }
             
             if exit_code == 0:
-                logger.info(f"Command succeeded: {command}")
+                logger.info("Command succeeded: %s", command)
             else:
-                logger.warning(f"Command failed with code {exit_code}: {command}")
+                logger.warning("Command failed with code %s: %s", exit_code, command)
             
             return result
             
         except Exception as e:
-            logger.error(f"Command execution failed: {e}")
+            logger.error("Command execution failed: %s", e)
             return {
                 "success": False,
                 "stdout": "",
@@ -144,17 +316,134 @@ class SSHExecutor:
                 "command": command
             }
     
-    def execute_multiple(self, commands: List[str], sudo: bool = False) -> List[Dict[str, Any]]:
-        """Execute multiple commands sequentially"""
-        results = []
-        for cmd in commands:
-            result = self.execute_command(cmd, sudo=sudo)
-            results.append(result)
-            # Stop on first failure
+    async def _run_in_shell(self, conn: asyncssh.SSHClientConnection, command: str):
+        """
+        Run command in conn's long-lived shell instead of opening a channel for it
+        
+        The command's exit status is printed behind a one-off marker on
+        stdout (and the bare marker on stderr); both streams are read up to
+        it. stdin is /dev/null so a command can't swallow the ones after it.
+        Any failure or timeout discards the shell; the next command starts
+        a fresh one.
+        
+        Returns:
+            (exit_code, stdout bytes, stderr bytes)
+        """
+        shell = self._shells.get(conn)
+        if shell is None or shell.exit_status is not None:
+            shell = await conn.create_process("bash --noprofile --norc", encoding=None)
+            self._shells[conn] = shell
+        
+        marker = f"__END{secrets.token_hex(4)}__".encode()
+        try:
+            shell.stdin.write(
+                b"{ " + command.encode() + b"\n} </dev/null; __rc=$?; "
+                b"printf '\\n" + marker + b":%d\\n' $__rc; printf '\\n" + marker + b"\\n' >&2\n"
+            )
+            stdout, stderr = await asyncio.wait_for(
+                asyncio.gather(
+                    shell.stdout.readuntil(b"\n" + marker + b":"),
+                    shell.stderr.readuntil(b"\n" + marker + b"\n"),
+                ),
+                timeout=30
+            )
+            exit_code = int(await shell.stdout.readline())
+        except BaseException:
+            self._shells.pop(conn, None)
+            shell.close()
+            raise
+        
+        return exit_code, stdout[:-len(marker) - 2], stderr[:-len(marker) - 2]
+    
+    async def execute_multiple(self, commands: List[str], sudo: bool = False,
+                               host: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Execute multiple commands sequentially, stopping at the first failure
+        
+        The whole sequence goes out as one fail-fast batch, so stopping early
+        costs no extra round trips.
+        
+        Returns:
+            Results of the commands that ran, the failed one last
+        """
+        results = await self.execute_batch(commands, sudo=sudo, host=host, stop_on_error=True)
+        for i, result in enumerate(results):
             if not result["success"]:
-                logger.warning(f"Stopping execution after failure: {cmd}")
-                break
+                logger.warning("Stopping execution after failure: %s", result["command"])
+                return results[:i + 1]
+        return results
+    
+    async def execute_batch(self, commands: List[str], sudo: bool = False,
+                            host: Optional[str] = None,
+                            stop_on_error: bool = False) -> List[Dict[str, Any]]:
+        """
+        Execute several commands in a single SSH exec
+        
+        Commands run one after another in one remote shell, by default
+        whether or not earlier ones failed. After each command its exit
+        status is echoed behind a marker on stdout and stderr, which is how
+        the combined output is split back into per-command results.
+        
+        Args:
+            commands: Commands to execute
+            sudo: Whether to run each command under sudo (the shell
+                running the batch itself stays unprivileged)
+            host: Target host (defaults to SSH_HOST)
+            stop_on_error: Exit the remote shell at the first failing command;
+                the commands it skipped report exit_code -1
+            
+        Returns:
+            One result dict per command, shaped like execute_command's
+        """
+        marker = f"__RC{secrets.token_hex(4)}_"
+        # Checked by hand rather than with `set -e`, which would exit before
+        # the failing command's marker is printed
+        abort = "[ $__rc -eq 0 ] || exit $__rc\n" if stop_on_error else ""
+        prefix = _SUDO if sudo else ""
+        # pipefail: a piped step (e.g. _PERSIST_RULES) fails if any part does
+        script = "set -o pipefail\n" + "".join(
+            f"{prefix}{cmd}\n"
+            f"__rc=$?; printf '\\n{marker}%d:%d\\n' {i} $__rc; "
+            f"printf '\\n{marker}%d:%d\\n' {i} $__rc >&2\n"
+            f"{abort}"
+            for i, cmd in enumerate(commands)
+        )
+        batch = await self.execute_command(f"bash -c {shlex.quote(script)}", host=host)
+        
+        pattern = re.compile(rf"\n?{marker}\d+:(\d+)\n?")
+        stdouts, codes, _ = self._split_batch(batch["stdout"], pattern)
+        stderrs, _, stderr_tail = self._split_batch(batch["stderr"], pattern)
+        
+        results = []
+        for i, cmd in enumerate(commands):
+            if i < len(codes):
+                results.append({
+                    "success": codes[i] == 0,
+                    "stdout": stdouts[i],
+                    "stderr": stderrs[i] if i < len(stderrs) else "",
+                    "exit_code": codes[i],
+                    "command": cmd
+                })
+            else:
+                # The batch died before reaching this command
+                results.append({
+                    "success": False,
+                    "stdout": "",
+                    "stderr": stderr_tail,
+                    "exit_code": -1,
+                    "command": cmd
+                })
         return results
+    
+    @staticmethod
+    def _split_batch(text: str, pattern: re.Pattern):
+        """Split batch output on exit-status markers into (chunks, exit codes, tail)"""
+        chunks, codes, pos = [], [], 0
+        for match in pattern.finditer(text):
+            chunks.append(text[pos:match.start()].strip())
+            codes.append(int(match.group(1)))
+            pos = match.end()
+        return chunks, codes, text[pos:].strip()
 
 
 class DefensiveActions:
@@ -162,16 +451,23 @@ class DefensiveActions:
     
     def __init__(self, executor: SSHExecutor):
         self.executor = executor
+        # Caps simultaneous hosts in a fleet action, to stay under sshd's
+        # MaxStartups when every connection is opened at once
+        self._fanout = asyncio.Semaphore(int(os.getenv("SSH_MAX_PARALLEL", "64")))
     
-    def block_ip(self, ip: str) -> Dict[str, Any]:
-        """Block an IP address using iptables"""
+    async def block_ip(self, ip: str, host: Optional[str] = None) -> Dict[str, Any]:
+        """Block an IP address using iptables (on host, default SSH_HOST)"""
+        try:
+            iptables, persist = _firewall_for(ip)
+        except ValueError:
+            return {"action": "block_ip", "ip": ip, "success": False, "error": "Invalid IP address"}
+        # Rules are only persisted once the DROP rule is in
         commands = [
-            f"iptables -A INPUT -s {ip} -j DROP",
-            f"ip6tables -A INPUT -s {ip} -j DROP",  # IPv6
-            "iptables-save > /etc/iptables/rules.v4",  # Persist rules
+            f"{iptables} -A INPUT -s {ip} -j DROP",
+            persist,
         ]
-        logger.warning(f"BLOCKING IP: {ip}")
-        results = self.executor.execute_multiple(commands, sudo=True)
+        logger.warning("BLOCKING IP: %s", ip)
+        results = await self.executor.execute_batch(commands, sudo=True, host=host, stop_on_error=True)
         return {
             "action": "block_ip",
             "ip": ip,
@@ -179,15 +475,54 @@ class DefensiveActions:
             "results": results
         }
     
-    def unblock_ip(self, ip: str) -> Dict[str, Any]:
+    async def block_ip_fleet(self, ip: str, hosts: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Block an IP address on several hosts in parallel
+        
+        Args:
+            ip: IP address to block
+            hosts: Hosts to apply the block on (defaults to SSH_FLEET_HOSTS,
+                or just SSH_HOST when that is unset)
+            
+        Returns:
+            Aggregate success plus each host's block_ip result
+        """
+        config = self.executor.ssh_config
+        hosts = list(dict.fromkeys(hosts or config.fleet_hosts or [config.host]))
+        
+        async def block_on(host: str) -> Dict[str, Any]:
+            async with self._fanout:
+                return await self.block_ip(ip, host=host)
+        
+        logger.warning("BLOCKING IP %s on %d hosts", ip, len(hosts))
+        outcomes = await asyncio.gather(*(block_on(host) for host in hosts), return_exceptions=True)
+        
+        per_host = {}
+        for host, outcome in zip(hosts, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error("Fleet block of %s failed on %s: %s", ip, host, outcome)
+                outcome = {"action": "block_ip", "ip": ip, "success": False, "error": str(outcome)}
+            per_host[host] = outcome
+        
+        return {
+            "action": "block_ip_fleet",
+            "ip": ip,
+            "success": all(r["success"] for r in per_host.values()),
+            "per_host": per_host
+        }
+    
+    async def unblock_ip(self, ip: str) -> Dict[str, Any]:
         """Unblock an IP address"""
+        try:
+            iptables, persist = _firewall_for(ip)
+        except ValueError:
+            return {"action": "unblock_ip", "ip": ip, "success": False, "error": "Invalid IP address"}
         commands = [
-            f"iptables -D INPUT -s {ip} -j DROP",
-            f"ip6tables -D INPUT -s {ip} -j DROP",
-            "iptables-save > /etc/iptables/rules.v4",
+            f"{iptables} -D INPUT -s {ip} -j DROP",
+            persist,
         ]
-        logger.info(f"UNBLOCKING IP: {ip}")
-        results = self.executor.execute_multiple(commands, sudo=True)
+        logger.info("UNBLOCKING IP: %s", ip)
+        results = await self.executor.execute_batch(commands, sudo=True, stop_on_error=True)
         return {
             "action": "unblock_ip",
             "ip": ip,
@@ -195,10 +530,10 @@ class DefensiveActions:
             "results": results
         }
     
-    def kill_user_sessions(self, username: str) -> Dict[str, Any]:
+    async def kill_user_sessions(self, username: str) -> Dict[str, Any]:
         """Kill all sessions of a specific user"""
-        logger.warning(f"KILLING SESSIONS for user: {username}")
-        result = self.executor.execute_command(f"pkill -KILL -u {username}", sudo=True)
+        logger.warning("KILLING SESSIONS for user: %s", username)
+        result = await self.executor.execute_command(_KILL_SESSIONS.format(username))
         return {
             "action": "kill_user_sessions",
             "username": username,
@@ -206,14 +541,14 @@ class DefensiveActions:
             "result": result
         }
     
-    def disable_user_account(self, username: str) -> Dict[str, Any]:
+    async def disable_user_account(self, username: str) -> Dict[str, Any]:
         """Disable a user account"""
-        logger.warning(f"DISABLING USER ACCOUNT: {username}")
+        logger.warning("DISABLING USER ACCOUNT: %s", username)
         commands = [
             f"usermod -L {username}",  # Lock account
             f"pkill -KILL -u {username}",  # Kill sessions
         ]
-        results = self.executor.execute_multiple(commands, sudo=True)
+        results = await self.executor.execute_batch(commands, sudo=True, stop_on_error=True)
         return {
             "action": "disable_user_account",
             "username": username,
@@ -221,10 +556,10 @@ class DefensiveActions:
             "results": results
         }
     
-    def enable_user_account(self, username: str) -> Dict[str, Any]:
+    async def enable_user_account(self, username: str) -> Dict[str, Any]:
         """Re-enable a user account"""
-        logger.info(f"RE-ENABLING USER ACCOUNT: {username}")
-        result = self.executor.execute_command(f"usermod -U {username}", sudo=True)
+        logger.info("RE-ENABLING USER ACCOUNT: %s", username)
+        result = await self.executor.execute_command(_UNLOCK_USER.format(username))
         return {
             "action": "enable_user_account",
             "username": username,
@@ -232,10 +567,10 @@ class DefensiveActions:
             "result": result
         }
     
-    def shutdown_system(self, delay: int = 1) -> Dict[str, Any]:
+    async def shutdown_system(self, delay: int = 1) -> Dict[str, Any]:
         """Shutdown the system (nuclear option)"""
-        logger.critical(f"INITIATING SYSTEM SHUTDOWN in {delay} minutes")
-        result = self.executor.execute_command(f"shutdown -h +{delay}", sudo=True)
+        logger.critical("INITIATING SYSTEM SHUTDOWN in %s minutes", delay)
+        result = await self.executor.execute_command(_SHUTDOWN.format(delay))
         return {
             "action": "shutdown_system",
             "delay_minutes": delay,
@@ -243,20 +578,20 @@ class DefensiveActions:
             "result": result
         }
     
-    def cancel_shutdown(self) -> Dict[str, Any]:
+    async def cancel_shutdown(self) -> Dict[str, Any]:
         """Cancel pending shutdown"""
         logger.info("CANCELLING SYSTEM SHUTDOWN")
-        result = self.executor.execute_command("shutdown -c", sudo=True)
+        result = await self.executor.execute_command(_CANCEL_SHUTDOWN)
         return {
             "action": "cancel_shutdown",
             "success": result["success"],
             "result": result
         }
     
-    def reboot_system(self, delay: int = 1) -> Dict[str, Any]:
+    async def reboot_system(self, delay: int = 1) -> Dict[str, Any]:
         """Reboot the system"""
-        logger.critical(f"INITIATING SYSTEM REBOOT in {delay} minutes")
-        result = self.executor.execute_command(f"shutdown -r +{delay}", sudo=True)
+        logger.critical("INITIATING SYSTEM REBOOT in %s minutes", delay)
+        result = await self.executor.execute_command(_REBOOT.format(delay))
         return {
             "action": "reboot_system",
             "delay_minutes": delay,
@@ -264,10 +599,10 @@ class DefensiveActions:
             "result": result
         }
     
-    def restart_service(self, service_name: str) -> Dict[str, Any]:
+    async def restart_service(self, service_name: str) -> Dict[str, Any]:
         """Restart a systemd service"""
-        logger.warning(f"RESTARTING SERVICE: {service_name}")
-        result = self.executor.execute_command(f"systemctl restart {service_name}", sudo=True)
+        logger.warning("RESTARTING SERVICE: %s", service_name)
+        result = await self.executor.execute_command(_SYSTEMCTL.format("restart", service_name))
         return {
             "action": "restart_service",
             "service": service_name,
@@ -275,10 +610,10 @@ class DefensiveActions:
             "result": result
         }
     
-    def stop_service(self, service_name: str) -> Dict[str, Any]:
+    async def stop_service(self, service_name: str) -> Dict[str, Any]:
         """Stop a systemd service"""
-        logger.warning(f"STOPPING SERVICE: {service_name}")
-        result = self.executor.execute_command(f"systemctl stop {service_name}", sudo=True)
+        logger.warning("STOPPING SERVICE: %s", service_name)
+        result = await self.executor.execute_command(_SYSTEMCTL.format("stop", service_name))
         return {
             "action": "stop_service",
             "service": service_name,
@@ -286,10 +621,10 @@ class DefensiveActions:
             "result": result
         }
     
-    def start_service(self, service_name: str) -> Dict[str, Any]:
+    async def start_service(self, service_name: str) -> Dict[str, Any]:
         """Start a systemd service"""
-        logger.info(f"STARTING SERVICE: {service_name}")
-        result = self.executor.execute_command(f"systemctl start {service_name}", sudo=True)
+        logger.info("STARTING SERVICE: %s", service_name)
+        result = await self.executor.execute_command(_SYSTEMCTL.format("start", service_name))
         return {
             "action": "start_service",
             "service": service_name,
@@ -297,25 +632,25 @@ class DefensiveActions:
             "result": result
         }
     
-    def flush_all_firewall_rules(self) -> Dict[str, Any]:
+    async def flush_all_firewall_rules(self) -> Dict[str, Any]:
         """Flush all firewall rules (emergency unlock)"""
         logger.critical("FLUSHING ALL FIREWALL RULES")
-        commands = [
-            "iptables -F",
-            "iptables -X",
-            "ip6tables -F",
-            "ip6tables -X",
-        ]
-        results = self.executor.execute_multiple(commands, sudo=True)
+        # IPv4 and IPv6 are flushed independently; within each, chains are
+        # only deleted once they have been flushed
+        v4, v6 = await asyncio.gather(
+            self.executor.execute_batch(["iptables -F", "iptables -X"], sudo=True, stop_on_error=True),
+            self.executor.execute_batch(["ip6tables -F", "ip6tables -X"], sudo=True, stop_on_error=True),
+        )
+        results = v4 + v6
         return {
             "action": "flush_firewall_rules",
             "success": all(r["success"] for r in results),
             "results": results
         }
     
-    def get_active_connections(self) -> Dict[str, Any]:
+    async def get_active_connections(self) -> Dict[str, Any]:
         """Get list of active network connections"""
-        result = self.executor.execute_command("ss -tunap", sudo=True)
+        result = await self.executor.execute_command(_LIST_CONNECTIONS)
         return {
             "action": "get_active_connections",
             "success": result["success"],
@@ -323,14 +658,14 @@ class DefensiveActions:
             "result": result
         }
     
-    def get_system_load(self) -> Dict[str, Any]:
+    async def get_system_load(self) -> Dict[str, Any]:
         """Get current system load"""
         commands = [
             "uptime",
             "free -h",
             "df -h /",
         ]
-        results = self.executor.execute_multiple(commands, sudo=False)
+        results = await self.executor.execute_batch(commands, sudo=False)
         return {
             "action": "get_system_load",
             "success": all(r["success"] for r in results),
@@ -338,22 +673,14 @@ class DefensiveActions:
         }
 
 
-# Global executor instance
-_executor: Optional[SSHExecutor] = None
-_actions: Optional[DefensiveActions] = None
-
-
+# Global executor instance (cache_clear() both to rebuild from the environment)
+@lru_cache(maxsize=1)
 def get_executor() -> SSHExecutor:
     """Get global SSH executor instance"""
-    global _executor
-    if _executor is None:
-        _executor = SSHExecutor()
-    return _executor
+    return SSHExecutor()
 
 
+@lru_cache(maxsize=1)
 def get_defensive_actions() -> DefensiveActions:
     """Get global defensive actions instance"""
-    global _actions
-    if _actions is None:
-        _actions = DefensiveActions(get_executor())
-    return _actions
+    return DefensiveActions(get_executor())
@@ -3,21 +3,154 @@ Threat Analysis and Response Engine
 The "AI" logic for intelligent security decision-making
 """
 
-import json
+import asyncio
+import ipaddress
 import logging
-from typing import List, Dict, Any
+import time
+from bisect import bisect_right
+from dataclasses import dataclass
+from itertools import islice
+from operator import itemgetter
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import Counter, defaultdict, deque
+
+import orjson
 
 from models import (
     SecurityEvent, ThreatAssessment, ActionResponse, 
-    SeverityLevel, EventType
+    SeverityLevel, EventType, _utc_now_iso
 )
 from mcp_client import MCPClientManager
+from ssh_executor import get_defensive_actions
 from config import settings
 
+if TYPE_CHECKING:
+    from redis_state import IPSnapshot
+
 logger = logging.getLogger(__name__)
 
+# Base threat score by event type
+_BASE_SCORES: Dict[EventType, int] = {
+    EventType.FAILED_LOGIN_ATTEMPT: 10,
+    EventType.SUSPICIOUS_PORT_SCAN: 40,
+    EventType.CONFIRMED_BRUTE_FORCE: 90,
+    EventType.CONFIRMED_ATTACK: 95,
+    EventType.HIGH_CPU_USAGE: 20,
+    EventType.HIGH_MEMORY_USAGE: 20,
+    EventType.UNUSUAL_NETWORK_ACTIVITY: 50,
+    EventType.MALWARE_DETECTED: 100
+}
+
+# Threat level by score: below 30 is LOW, then MEDIUM from 30, HIGH from 60
+# and CRITICAL from 80
+_LEVEL_THRESHOLDS = (30, 60, 80)
+_LEVELS = (SeverityLevel.LOW, SeverityLevel.MEDIUM, SeverityLevel.HIGH, SeverityLevel.CRITICAL)
+
+
+def _ip_to_int(ip: str) -> Optional[int]:
+    """IPv4 address as an int (None if ip isn't a valid IPv4 address)"""
+    try:
+        return int(ipaddress.IPv4Address(ip))
+    except ValueError:
+        return None
+
+
+class IPv4NetworkSet:
+    """
+    CIDR membership test for IPv4 addresses given as ints
+    
+    Networks are grouped by prefix length: a lookup masks the address once
+    per distinct length and probes a set, so its cost depends on how many
+    prefix lengths are in use (typically one or two), not on how many
+    networks there are.
+    """
+    
+    def __init__(self, networks):
+        by_prefix: Dict[int, set] = defaultdict(set)
+        for net in networks:
+            if net.version == 4:
+                by_prefix[net.prefixlen].add(int(net.network_address))
+        self._buckets = tuple(
+            (0xFFFFFFFF ^ ((1 << (32 - prefix)) - 1), frozenset(addrs))
+            for prefix, addrs in sorted(by_prefix.items(), reverse=True)
+        )
+    
+    def __contains__(self, ip: Optional[int]) -> bool:
+        if ip is None:
+            return False
+        return any((ip & mask) in addrs for mask, addrs in self._buckets)
+
+
+def _hour_index(now: datetime) -> int:
+    """Absolute hour number of now, the bucket key for HourlyEventCounts"""
+    return now.toordinal() * 24 + now.hour
+
+
+class HourlyEventCounts:
+    """
+    Per-type event counts over the last 24 hourly buckets
+    
+    Running totals are updated as events are added and buckets expire, so
+    reading a count doesn't rescan the history. Only add() mutates; reads
+    just discount buckets that have aged out since the last add(), which
+    keeps them safe to call from the scoring thread.
+    """
+    __slots__ = ("buckets", "totals")
+    
+    WINDOW_HOURS = 24
+    
+    def __init__(self):
+        self.buckets: deque = deque()  # (hour, Counter) oldest first
+        self.totals: Counter = Counter()
+    
+    def add(self, event_type: str, hour: int):
+        while self.buckets and self.buckets[0][0] <= hour - self.WINDOW_HOURS:
+            _, expired = self.buckets.popleft()
+            self.totals.subtract(expired)
+        if not self.buckets or self.buckets[-1][0] != hour:
+            self.buckets.append((hour, Counter()))
+        self.buckets[-1][1][event_type] += 1
+        self.totals[event_type] += 1
+    
+    def _expired(self, hour: int):
+        cutoff = hour - self.WINDOW_HOURS
+        return [counts for bucket_hour, counts in list(self.buckets) if bucket_hour <= cutoff]
+    
+    def count(self, event_type: str, hour: int) -> int:
+        """Events of event_type in the window ending at hour"""
+        return self.totals[event_type] - sum(c[event_type] for c in self._expired(hour))
+    
+    def total(self, hour: int) -> int:
+        """Events of any type in the window ending at hour"""
+        return self.totals.total() - sum(c.total() for c in self._expired(hour))
+
+
+_fixed_responses: Dict[Tuple[bool, str, Optional[str]], ActionResponse] = {}
+
+
+def _fixed_response(success: bool, action_taken: str, error: Optional[str] = None) -> ActionResponse:
+    """
+    Shared instance of a response whose content never varies (e.g. cooldowns)
+    
+    ActionResponse is frozen, so one instance can go out in many results;
+    it is only rebuilt when its second-resolution timestamp goes stale.
+    """
+    key = (success, action_taken, error)
+    response = _fixed_responses.get(key)
+    if response is None or response.timestamp != _utc_now_iso():
+        response = _fixed_responses[key] = ActionResponse(
+            success=success, action_taken=action_taken, error=error
+        )
+    return response
+
+
+@dataclass
+class AnalyzeResult:
+    """Outcome of analyze_and_respond: actions taken and the assessment behind them"""
+    actions: List[ActionResponse]
+    assessment: ThreatAssessment
+
 
 class ThreatAnalyzer:
     """
@@ -34,22 +167,79 @@ class ThreatAnalyzer:
     def __init__(self, mcp_client: MCPClientManager):
         self.mcp_client = mcp_client
         
-        # In-memory tracking (in production, use Redis or database)
-        self.ip_history: Dict[str, List[Dict]] = defaultdict(list)
-        self.scan_cooldowns: Dict[str, datetime] = {}
-        self.block_cooldowns: Dict[str, datetime] = {}
-        self.blocked_ips: set = set()
-        
-        # Parse whitelist
-        self.whitelisted_ips = set(
-            ip.strip() for ip in settings.WHITELISTED_IPS.split(',') if ip.strip()
+        # In-memory tracking. Each IP keeps its newest MAX_EVENTS_PER_IP
+        # events in timestamp order.
+        self.ip_history: Dict[str, deque] = defaultdict(
+            lambda: deque(maxlen=settings.MAX_EVENTS_PER_IP)
         )
+        # Running 24h counts per IP, so scoring needn't scan ip_history
+        self.ip_counters: Dict[str, HourlyEventCounts] = defaultdict(HourlyEventCounts)
+        # Last scan/block per IP, in time.monotonic() seconds
+        self.scan_cooldowns: Dict[str, float] = {}
+        self.block_cooldowns: Dict[str, float] = {}
+        self.blocked_ips: set[int] = set()  # as ints, see _ip_to_int
+        
+        # With REDIS_URL set, scoring counts, cooldowns and blocked IPs come
+        # from Redis instead, shared by every worker and kept across restarts.
+        # The in-memory state above is still kept as this process's view.
+        self.shared_state = None
+        if settings.REDIS_URL:
+            from redis_state import RedisThreatState
+            self.shared_state = RedisThreatState(settings.REDIS_URL)
+        
+        # Whitelist entries may be single IPs or CIDR networks
+        self.whitelisted_ips = IPv4NetworkSet(settings.whitelisted_networks)
+        
+        self._janitor_task: Optional[asyncio.Task] = None
         
         logger.info("🧠 Threat Analyzer initialized")
-        logger.info(f"📋 Whitelisted IPs: {self.whitelisted_ips}")
-        logger.info(f"🎯 Threat score threshold: {settings.THREAT_SCORE_THRESHOLD}")
+        logger.info("📋 Whitelisted IPs: %s", ', '.join(map(str, settings.whitelisted_networks)))
+        logger.info("🎯 Threat score threshold: %s", settings.THREAT_SCORE_THRESHOLD)
+    
+    def start_janitor(self):
+        """Start the background task that purges history older than 24h"""
+        if self._janitor_task is None or self._janitor_task.done():
+            self._janitor_task = asyncio.create_task(self._janitor())
+    
+    async def stop_janitor(self):
+        """Stop the history janitor"""
+        if self._janitor_task:
+            self._janitor_task.cancel()
+            try:
+                await self._janitor_task
+            except asyncio.CancelledError:
+                pass
+            self._janitor_task = None
+    
+    async def close(self):
+        """Release the shared state connection, if any"""
+        if self.shared_state:
+            await self.shared_state.close()
+    
+    async def _janitor(self):
+        while True:
+            await asyncio.sleep(settings.HISTORY_JANITOR_INTERVAL)
+            self._purge_history(datetime.utcnow() - timedelta(hours=24))
+    
+    def _purge_history(self, threshold: datetime):
+        """Drop events at or before threshold, and IPs left with none"""
+        stale, purged = [], 0
+        for ip, events in list(self.ip_history.items()):
+            # Events are in timestamp order: find the cut, then trim the front
+            cut = bisect_right(events, threshold, key=itemgetter('timestamp'))
+            if cut == len(events):
+                stale.append(ip)
+                continue
+            for _ in range(cut):
+                events.popleft()
+            purged += cut
+        for ip in stale:
+            self.ip_history.pop(ip, None)
+            self.ip_counters.pop(ip, None)
+        if stale or purged:
+            logger.debug("🧹 Purged %d expired events, dropped %d idle IPs", purged, len(stale))
     
-    async def analyze_and_respond(self, event: SecurityEvent) -> List[ActionResponse]:
+    async def analyze_and_respond(self, event: SecurityEvent) -> AnalyzeResult:
         """
         Main entry point: Analyze threat and execute appropriate responses
         
@@ -57,27 +247,159 @@ class ThreatAnalyzer:
             event: Security event to analyze
             
         Returns:
-            List of actions taken
+            AnalyzeResult with the actions taken and the threat assessment
         """
-        logger.info(f"🔍 Analyzing event: {event.event_type} from {event.source_ip}")
+        logger.info("🔍 Analyzing event: %s from %s", event.event_type, event.source_ip)
+        
+        # One timestamp for the whole event, so every step agrees on "now"
+        now = datetime.utcnow()
+        
+        # Whitelisted IPs need no scoring, or even recording
+        result = self._whitelisted_result(event)
+        if result is not None:
+            return result
         
         # Track event in history
-        self._record_event(event)
+        self._record_event(event, now)
+        shared = await self._record_shared([event], event, now)
+        
+        # Neither do freshly blocked ones
+        if self._skip_blocked(event.source_ip, [event], shared):
+            return self._blocked_result(event)
         
         # Assess threat level
-        assessment = self._assess_threat(event)
+        assessment = self._assess_threat(event, now, shared)
         
-        logger.info(f"📊 Threat assessment: Score={assessment.threat_score}, "
-                   f"Level={assessment.threat_level}, "
-                   f"Action={assessment.recommended_action}")
-        logger.info(f"💭 Reasoning: {', '.join(assessment.reasoning)}")
+        logger.info("📊 Threat assessment: Score=%s, Level=%s, Action=%s",
+                    assessment.threat_score, assessment.threat_level,
+                    assessment.recommended_action)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("💭 Reasoning: %s", ', '.join(assessment.reasoning))
         
         # Execute recommended actions
-        actions = await self._execute_actions(event, assessment)
+        actions = await self._execute_actions(event, assessment, time.monotonic(), shared)
         
-        return actions
+        return AnalyzeResult(actions=actions, assessment=assessment)
     
-    def _assess_threat(self, event: SecurityEvent) -> ThreatAssessment:
+    async def analyze_batch(self, events: List[SecurityEvent]) -> List[Tuple[SecurityEvent, AnalyzeResult]]:
+        """
+        Analyze a burst of events, assessing and responding once per source IP
+        
+        Every event is recorded in its IP's history first, so the IP's event
+        count already includes the whole burst. Each IP is then assessed once,
+        on its highest-scoring event, and actions for all IPs run concurrently.
+        Whitelisted and freshly blocked IPs are settled without assessment.
+        
+        Args:
+            events: Security events to analyze
+            
+        Returns:
+            (event the IP was assessed on, AnalyzeResult) for each source IP
+        """
+        now = datetime.utcnow()
+        groups: Dict[str, List[SecurityEvent]] = defaultdict(list)
+        settled: List[Tuple[SecurityEvent, AnalyzeResult]] = []
+        whitelisted = set()
+        for event in events:
+            ip = event.source_ip
+            if ip in whitelisted:
+                continue
+            if ip not in groups:
+                result = self._whitelisted_result(event)
+                if result is not None:
+                    whitelisted.add(ip)
+                    settled.append((event, result))
+                    continue
+            groups[ip].append(event)
+            self._record_event(event, now)
+        
+        leads = [max(group, key=lambda e: _BASE_SCORES.get(e.event_type, 50)) for group in groups.values()]
+        shared = await asyncio.gather(*(
+            self._record_shared(group, lead, now) for group, lead in zip(groups.values(), leads)
+        ))
+        
+        # Freshly blocked IPs are settled too; the rest get assessed
+        pending = []
+        for group, lead, snapshot in zip(groups.values(), leads, shared):
+            if self._skip_blocked(lead.source_ip, group, snapshot):
+                settled.append((lead, self._blocked_result(lead)))
+            else:
+                pending.append((lead, snapshot))
+        leads = [lead for lead, _ in pending]
+        shared = [snapshot for _, snapshot in pending]
+        logger.info("🔍 Analyzing batch: %d events from %d IPs (%d skipped)",
+                    len(events), len(leads), len(settled))
+        
+        assessments = self._assess_all(leads, now, shared)
+        
+        clock = time.monotonic()
+        actions = await asyncio.gather(*(
+            self._execute_actions(event, assessment, clock, snapshot)
+            for event, assessment, snapshot in zip(leads, assessments, shared)
+        ))
+        return settled + [
+            (event, AnalyzeResult(actions=event_actions, assessment=assessment))
+            for event, assessment, event_actions in zip(leads, assessments, actions)
+        ]
+    
+    def _whitelisted_result(self, event: SecurityEvent) -> Optional[AnalyzeResult]:
+        """Result for an event from a whitelisted IP (nothing recorded, no action), else None"""
+        ip = event.source_ip
+        if _ip_to_int(ip) not in self.whitelisted_ips:
+            return None
+        logger.info("✅ %s is whitelisted - skipping analysis", ip)
+        return AnalyzeResult(
+            actions=[_fixed_response(True, "whitelisted")],
+            assessment=ThreatAssessment(
+                threat_score=0,
+                threat_level=SeverityLevel.LOW,
+                recommended_action="log_only",
+                reasoning=[f"IP {ip} is whitelisted - threat score set to 0"],
+                should_block=False,
+                should_scan=False
+            )
+        )
+    
+    def _skip_blocked(self, ip: str, events: List[SecurityEvent], shared: Optional["IPSnapshot"]) -> bool:
+        """
+        Whether ip's (already recorded) events can go unassessed because it is blocked
+        
+        Only blocks still within the block cooldown count, so an IP that was
+        unblocked by hand is assessed normally again once it runs out, and
+        malware detections are always assessed. The shared snapshot decides
+        if there is one, else the local state.
+        """
+        if any(e.event_type == EventType.MALWARE_DETECTED for e in events):
+            return False
+        if shared is not None:
+            return shared.blocked and shared.block_cooling
+        return _ip_to_int(ip) in self.blocked_ips and not self._check_block_cooldown(ip)
+    
+    @staticmethod
+    def _blocked_result(event: SecurityEvent) -> AnalyzeResult:
+        """Result for an event from an IP that is already blocked (base score only, no action)"""
+        logger.info("🚫 %s is already blocked - skipping analysis", event.source_ip)
+        threat_score = _BASE_SCORES.get(event.event_type, 50)
+        return AnalyzeResult(
+            actions=[],
+            assessment=ThreatAssessment(
+                threat_score=threat_score,
+                threat_level=_LEVELS[bisect_right(_LEVEL_THRESHOLDS, threat_score)],
+                recommended_action="already_blocked",
+                reasoning=[f"IP {event.source_ip} is already blocked - base score only"],
+                should_block=False,
+                should_scan=False
+            )
+        )
+    
+    def _assess_all(self, events: List[SecurityEvent], now: Optional[datetime] = None,
+                    shared: Optional[List[Optional["IPSnapshot"]]] = None) -> List[ThreatAssessment]:
+        """Assess several events, each with its own snapshot"""
+        shared = shared or [None] * len(events)
+        return [self._assess_threat(event, now, snapshot) for event, snapshot in zip(events, shared)]
+    
+    def _assess_threat(self, event: SecurityEvent, now: Optional[datetime] = None,
+                       shared: Optional["IPSnapshot"] = None) -> ThreatAssessment:
         """
         Assess threat level and determine recommended action
         
@@ -91,46 +413,28 @@ class ThreatAnalyzer:
         event_type = event.event_type
         
         # Base score by event type
-        base_scores = {
-            EventType.FAILED_LOGIN_ATTEMPT: 10,
-            EventType.SUSPICIOUS_PORT_SCAN: 40,
-            EventType.CONFIRMED_BRUTE_FORCE: 90,
-            EventType.CONFIRMED_ATTACK: 95,
-            EventType.HIGH_CPU_USAGE: 20,
-            EventType.HIGH_MEMORY_USAGE: 20,
-            EventType.UNUSUAL_NETWORK_ACTIVITY: 50,
-            EventType.MALWARE_DETECTED: 100
-        }
-        
-        threat_score = base_scores.get(event_type, 50)
+        threat_score = _BASE_SCORES.get(event_type, 50)
         reasoning = [f"Base score for {event_type.value}: {threat_score}"]
         
-        # Check if IP is whitelisted
-        if source_ip in self.whitelisted_ips:
-            threat_score = 0
-            reasoning.append(f"IP {source_ip} is whitelisted - threat score set to 0")
-            return ThreatAssessment(
-                threat_score=0,
-                threat_level=SeverityLevel.LOW,
-                recommended_action="log_only",
-                reasoning=reasoning,
-                should_block=False,
-                should_scan=False
-            )
-        
         # Check history for this IP
-        ip_events = self.ip_history.get(source_ip, [])
-        recent_events = self._get_recent_events(ip_events, hours=24)
+        counts = self.ip_counters.get(source_ip)
+        hour = _hour_index(now or datetime.utcnow())
+        if shared is not None:
+            recent_count = shared.recent_events
+        else:
+            recent_count = counts.total(hour) if counts else 0
         
-        if len(recent_events) > 1:
-            multiplier = min(len(recent_events) * 0.2, 2.0)  # Max 2x multiplier
+        if recent_count > 1:
+            multiplier = min(recent_count * 0.2, 2.0)  # Max 2x multiplier
             threat_score *= multiplier
-            reasoning.append(f"{len(recent_events)} events in 24h: score multiplied by {multiplier:.1f}x")
+            reasoning.append(f"{recent_count} events in 24h: score multiplied by {multiplier:.1f}x")
         
         # Pattern analysis
         if event_type == EventType.FAILED_LOGIN_ATTEMPT:
-            failed_count = len([e for e in recent_events 
-                              if e['event_type'] == EventType.FAILED_LOGIN_ATTEMPT.value])
+            if shared is not None:
+                failed_count = shared.recent_of_type
+            else:
+                failed_count = counts.count(EventType.FAILED_LOGIN_ATTEMPT.value, hour) if counts else 0
             if failed_count >= settings.FAILED_LOGIN_THRESHOLD:
                 threat_score += 30
                 reasoning.append(f"{failed_count} failed logins (threshold: {settings.FAILED_LOGIN_THRESHOLD}): +30 points")
@@ -139,14 +443,7 @@ class ThreatAnalyzer:
         threat_score = min(int(threat_score), 100)
         
         # Determine threat level
-        if threat_score >= 80:
-            threat_level = SeverityLevel.CRITICAL
-        elif threat_score >= 60:
-            threat_level = SeverityLevel.HIGH
-        elif threat_score >= 30:
-            threat_level = SeverityLevel.MEDIUM
-        else:
-            threat_level = SeverityLevel.LOW
+        threat_level = _LEVELS[bisect_right(_LEVEL_THRESHOLDS, threat_score)]
         
         # Determine recommended action
         should_block = False
@@ -177,18 +474,39 @@ class ThreatAnalyzer:
             should_scan=should_scan
         )
     
-    async def _execute_actions(self, event: SecurityEvent, assessment: ThreatAssessment) -> List[ActionResponse]:
-        """Execute recommended security actions"""
-        actions = []
-        source_ip = event.source_ip
+    async def _execute_actions(self, event: SecurityEvent, assessment: ThreatAssessment,
+                               clock: Optional[float] = None,
+                               shared: Optional["IPSnapshot"] = None) -> List[ActionResponse]:
+        """
+        Execute recommended security actions
+        
+        Scanning and blocking don't depend on each other, so both branches
+        run concurrently rather than one after the other. clock is the
+        time.monotonic() reading that cooldowns are checked against; with
+        shared state, its snapshot decides cooldowns instead.
+        """
+        if clock is None:
+            clock = time.monotonic()
         
         # Check dry run mode
         if settings.DRY_RUN_MODE:
             logger.warning("🧪 DRY RUN MODE: Actions will be logged but not executed")
         
+        scan_actions, block_actions = await asyncio.gather(
+            self._execute_scans(event, assessment, clock, shared),
+            self._execute_block(event, assessment, clock, shared),
+        )
+        return scan_actions + block_actions
+    
+    async def _execute_scans(self, event: SecurityEvent, assessment: ThreatAssessment,
+                             clock: float, shared: Optional["IPSnapshot"] = None) -> List[ActionResponse]:
+        """Run the recommended nmap scan, if any"""
+        actions = []
+        source_ip = event.source_ip
+        
         # Action: Quick scan
         if assessment.should_scan and "quick" in assessment.recommended_action:
-            if self._check_scan_cooldown(source_ip):
+            if self._scan_allowed(source_ip, clock, shared):
                 try:
                     if settings.DRY_RUN_MODE:
                         result = '{"dry_run": true, "action": "quick_scan"}'
@@ -201,26 +519,22 @@ class ThreatAnalyzer:
                         tool_used="nmap_quick_scan",
                         result=result
                     ))
-                    self.scan_cooldowns[source_ip] = datetime.utcnow()
-                    logger.info(f"✅ Quick scan completed for {source_ip}")
+                    await self._start_scan_cooldown(source_ip)
+                    logger.info("✅ Quick scan completed for %s", source_ip)
                 except Exception as e:
-                    logger.error(f"❌ Quick scan failed: {e}")
+                    logger.error("❌ Quick scan failed: %s", e)
                     actions.append(ActionResponse(
                         success=False,
                         action_taken="nmap_quick_scan",
                         error=str(e)
                     ))
             else:
-                logger.info(f"⏱️  Scan cooldown active for {source_ip}, skipping")
-                actions.append(ActionResponse(
-                    success=False,
-                    action_taken="nmap_quick_scan",
-                    error="Cooldown period active"
-                ))
+                logger.info("⏱️  Scan cooldown active for %s, skipping", source_ip)
+                actions.append(_fixed_response(False, "nmap_quick_scan", "Cooldown period active"))
         
         # Action: Vulnerability scan
         if assessment.should_scan and "vulnerability" in assessment.recommended_action:
-            if self._check_scan_cooldown(source_ip):
+            if self._scan_allowed(source_ip, clock, shared):
                 try:
                     if settings.DRY_RUN_MODE:
                         result = '{"dry_run": true, "action": "vulnerability_scan"}'
@@ -233,25 +547,33 @@ class ThreatAnalyzer:
                         tool_used="nmap_vulnerability_scan",
                         result=result
                     ))
-                    self.scan_cooldowns[source_ip] = datetime.utcnow()
-                    logger.info(f"✅ Vulnerability scan completed for {source_ip}")
+                    await self._start_scan_cooldown(source_ip)
+                    logger.info("✅ Vulnerability scan completed for %s", source_ip)
                 except Exception as e:
-                    logger.error(f"❌ Vulnerability scan failed: {e}")
+                    logger.error("❌ Vulnerability scan failed: %s", e)
                     actions.append(ActionResponse(
                         success=False,
                         action_taken="nmap_vulnerability_scan",
                         error=str(e)
                     ))
         
+        return actions
+    
+    async def _execute_block(self, event: SecurityEvent, assessment: ThreatAssessment,
+                             clock: float, shared: Optional["IPSnapshot"] = None) -> List[ActionResponse]:
+        """Block the source IP (plus SSH follow-ups for critical threats)"""
+        actions = []
+        source_ip = event.source_ip
+        
         # Action: Block IP
         if assessment.should_block and settings.ENABLE_AUTO_BLOCK:
-            if source_ip not in self.whitelisted_ips:
-                if self._check_block_cooldown(source_ip):
+            if _ip_to_int(source_ip) not in self.whitelisted_ips:
+                if self._block_allowed(source_ip, clock, shared):
                     try:
                         reason = f"Threat score: {assessment.threat_score}, Event: {event.event_type.value}"
                         
                         if settings.DRY_RUN_MODE:
-                            result = json.dumps({"dry_run": True, "action": "block_ip", "ip": source_ip})
+                            result = orjson.dumps({"dry_run": True, "action": "block_ip", "ip": source_ip}).decode()
                         else:
                             result = await self.mcp_client.block_ip(source_ip, reason)
                         
@@ -261,76 +583,149 @@ class ThreatAnalyzer:
                             tool_used="block_ip_firewall",
                             result=result
                         ))
-                        self.block_cooldowns[source_ip] = datetime.utcnow()
-                        self.blocked_ips.add(source_ip)
-                        logger.warning(f"🚫 IP {source_ip} blocked: {reason}")
+                        await self._mark_blocked(source_ip)
+                        logger.warning("🚫 IP %s blocked: %s", source_ip, reason)
                         
                         # CRITICAL THREAT: Execute additional SSH defensive actions
                         if assessment.threat_score >= 90:
-                            logger.critical(f"⚠️  CRITICAL THREAT DETECTED (score: {assessment.threat_score})")
+                            logger.critical("⚠️  CRITICAL THREAT DETECTED (score: %s)", assessment.threat_score)
                             ssh_actions = await self._execute_ssh_defensive_actions(event, assessment)
                             actions.extend(ssh_actions)
                             
                     except Exception as e:
-                        logger.error(f"❌ IP block failed: {e}")
+                        logger.error("❌ IP block failed: %s", e)
                         actions.append(ActionResponse(
                             success=False,
                             action_taken="block_ip_firewall",
                             error=str(e)
                         ))
                 else:
-                    logger.info(f"⏱️  Block cooldown active for {source_ip}, skipping")
+                    logger.info("⏱️  Block cooldown active for %s, skipping", source_ip)
             else:
-                logger.warning(f"⚠️  Cannot block whitelisted IP: {source_ip}")
+                logger.warning("⚠️  Cannot block whitelisted IP: %s", source_ip)
         elif assessment.should_block and not settings.ENABLE_AUTO_BLOCK:
-            logger.info(f"ℹ️  Auto-block disabled, would have blocked {source_ip}")
+            logger.info("ℹ️  Auto-block disabled, would have blocked %s", source_ip)
         
         return actions
     
-    def _record_event(self, event: SecurityEvent):
-        """Record event in IP history"""
+    async def record_event(self, event: SecurityEvent):
+        """Record an event without analyzing it (e.g. a deduplicated repeat)"""
+        now = datetime.utcnow()
+        self._record_event(event, now)
+        await self._record_shared([event], event, now)
+    
+    async def _record_shared(self, events: List[SecurityEvent], lead: SecurityEvent,
+                             now: datetime) -> Optional["IPSnapshot"]:
+        """
+        Record events from one IP in the shared state and read back its snapshot
+        
+        Returns None (so the in-memory state is used) when there is no shared
+        state or it can't be reached.
+        """
+        if not self.shared_state:
+            return None
+        try:
+            return await self.shared_state.record_events(
+                lead.source_ip,
+                [(e.event_type.value, {'severity': e.severity.value, 'details': e.details}) for e in events],
+                lead.event_type.value,
+                now
+            )
+        except Exception as e:
+            logger.warning("⚠️  Shared state unavailable, using local history: %s", e)
+            return None
+    
+    async def _start_scan_cooldown(self, ip: str):
+        """Start ip's scan cooldown locally and in the shared state"""
+        self.scan_cooldowns[ip] = time.monotonic()
+        if self.shared_state:
+            try:
+                await self.shared_state.start_scan_cooldown(ip, settings.SCAN_COOLDOWN_SECONDS)
+            except Exception as e:
+                logger.warning("⚠️  Could not share scan cooldown for %s: %s", ip, e)
+    
+    async def _mark_blocked(self, ip: str):
+        """Record ip as blocked (starting its block cooldown) locally and in the shared state"""
+        self.block_cooldowns[ip] = time.monotonic()
+        self.blocked_ips.add(_ip_to_int(ip))
+        if self.shared_state:
+            try:
+                await self.shared_state.mark_blocked(ip, settings.BLOCK_IP_COOLDOWN_SECONDS)
+            except Exception as e:
+                logger.warning("⚠️  Could not share block of %s: %s", ip, e)
+    
+    def _record_event(self, event: SecurityEvent, now: Optional[datetime] = None):
+        """Record event in IP history and the IP's hourly counts"""
+        now = now or datetime.utcnow()
         self.ip_history[event.source_ip].append({
             'event_type': event.event_type.value,
-            'timestamp': datetime.utcnow(),
+            'timestamp': now,
             'severity': event.severity.value,
             'details': event.details
         })
+        self.ip_counters[event.source_ip].add(event.event_type.value, _hour_index(now))
     
-    def _get_recent_events(self, events: List[Dict], hours: int = 24) -> List[Dict]:
-        """Get events within the specified time window"""
-        threshold = datetime.utcnow() - timedelta(hours=hours)
-        return [e for e in events if e['timestamp'] > threshold]
+    def _get_recent_events(self, events, hours: int = 24, now: Optional[datetime] = None) -> List[Dict]:
+        """Get events within the specified time window (events are in timestamp order)"""
+        threshold = (now or datetime.utcnow()) - timedelta(hours=hours)
+        start = bisect_right(events, threshold, key=itemgetter('timestamp'))
+        return list(islice(events, start, None))
     
-    def _check_scan_cooldown(self, ip: str) -> bool:
-        """Check if scan cooldown has expired"""
-        if ip not in self.scan_cooldowns:
+    def _check_scan_cooldown(self, ip: str, clock: Optional[float] = None) -> bool:
+        """Check if scan cooldown has expired (clock: time.monotonic() reading)"""
+        last_scan = self.scan_cooldowns.get(ip)
+        if last_scan is None:
             return True
         
-        last_scan = self.scan_cooldowns[ip]
-        cooldown_end = last_scan + timedelta(seconds=settings.SCAN_COOLDOWN_SECONDS)
-        return datetime.utcnow() > cooldown_end
+        if clock is None:
+            clock = time.monotonic()
+        return clock - last_scan > settings.SCAN_COOLDOWN_SECONDS
     
-    def _check_block_cooldown(self, ip: str) -> bool:
-        """Check if block cooldown has expired"""
-        if ip not in self.block_cooldowns:
+    def _check_block_cooldown(self, ip: str, clock: Optional[float] = None) -> bool:
+        """Check if block cooldown has expired (clock: time.monotonic() reading)"""
+        last_block = self.block_cooldowns.get(ip)
+        if last_block is None:
             return True
         
-        last_block = self.block_cooldowns[ip]
-        cooldown_end = last_block + timedelta(seconds=settings.BLOCK_IP_COOLDOWN_SECONDS)
-        return datetime.utcnow() > cooldown_end
+        if clock is None:
+            clock = time.monotonic()
+        return clock - last_block > settings.BLOCK_IP_COOLDOWN_SECONDS
+    
+    def _scan_allowed(self, ip: str, clock: float, shared: Optional["IPSnapshot"]) -> bool:
+        """Scan cooldown check against the shared snapshot if there is one, else locally"""
+        if shared is not None:
+            return not shared.scan_cooling
+        return self._check_scan_cooldown(ip, clock)
+    
+    def _block_allowed(self, ip: str, clock: float, shared: Optional["IPSnapshot"]) -> bool:
+        """Block cooldown check against the shared snapshot if there is one, else locally"""
+        if shared is not None:
+            return not shared.block_cooling
+        return self._check_block_cooldown(ip, clock)
+    
+    async def get_ip_reputation(self, ip: str) -> Dict[str, Any]:
+        """Get reputation info for an IP (blocked status from the shared state if there is one)"""
+        reputation = self._local_reputation(ip)
+        if self.shared_state:
+            try:
+                reputation["is_blocked"] = await self.shared_state.is_blocked(ip)
+            except Exception as e:
+                logger.warning("⚠️  Shared state unavailable, using local block list: %s", e)
+        return reputation
     
-    def get_ip_reputation(self, ip: str) -> Dict[str, Any]:
-        """Get reputation info for an IP"""
-        events = self.ip_history.get(ip, [])
+    def _local_reputation(self, ip: str) -> Dict[str, Any]:
+        """Reputation info for an IP from this process's state"""
+        events = self.ip_history.get(ip, ())
         recent = self._get_recent_events(events, hours=24)
+        ip_int = _ip_to_int(ip)
         
         return {
             "ip": ip,
             "total_events": len(events),
             "recent_events_24h": len(recent),
-            "is_blocked": ip in self.blocked_ips,
-            "is_whitelisted": ip in self.whitelisted_ips,
-            "last_seen": max([e['timestamp'] for e in events]).isoformat() if events else None
+            "is_blocked": ip_int is not None and ip_int in self.blocked_ips,
+            "is_whitelisted": ip_int in self.whitelisted_ips,
+            "last_seen": events[-1]['timestamp'].isoformat() if events else None
         }
     
     async def _execute_ssh_defensive_actions(self, event: SecurityEvent, assessment: ThreatAssessment) -> List[ActionResponse]:
@@ -341,7 +736,6 @@ class ThreatAnalyzer:
         actions = []
         
         try:
-            from ssh_executor import get_defensive_actions
             ssh_actions = get_defensive_actions()
             
             # For CONFIRMED attacks with very high score
@@ -354,17 +748,17 @@ class ThreatAnalyzer:
                         if settings.DRY_RUN_MODE:
                             result = {"dry_run": True, "action": "kill_user_sessions"}
                         else:
-                            result = ssh_actions.kill_user_sessions(event.username)
+                            result = await ssh_actions.kill_user_sessions(event.username)
                         
                         actions.append(ActionResponse(
                             success=result.get("success", False),
                             action_taken="ssh_kill_user_sessions",
-                            tool_used="ssh_paramiko",
-                            result=json.dumps(result)
+                            tool_used="ssh_asyncssh",
+                            result=orjson.dumps(result).decode()
                         ))
-                        logger.critical(f"Killed sessions for compromised user: {event.username}")
+                        logger.critical("Killed sessions for compromised user: %s", event.username)
                     except Exception as e:
-                        logger.error(f"Failed to kill user sessions: {e}")
+                        logger.error("Failed to kill user sessions: %s", e)
                 
                 # Option 2: For extreme cases, prepare for shutdown
                 if assessment.threat_score >= 98:
@@ -375,12 +769,12 @@ class ThreatAnalyzer:
                         success=True,
                         action_taken="critical_alert_raised",
                         tool_used="alert_system",
-                        result=json.dumps({
+                        result=orjson.dumps({
                             "alert": "EXTREME_THREAT_DETECTED",
                             "threat_score": assessment.threat_score,
                             "recommendation": "Consider emergency shutdown",
                             "endpoint": "/api/v1/defense/shutdown"
-                        })
+                        }).decode()
                     ))
             
             # For high-score brute force attacks
@@ -391,21 +785,22 @@ class ThreatAnalyzer:
                     if settings.DRY_RUN_MODE:
                         result = {"dry_run": True, "action": "ssh_block_ip"}
                     else:
-                        # Double-block via SSH/iptables (backup to MCP firewall)
-                        result = ssh_actions.block_ip(event.source_ip)
+                        # Double-block via SSH/iptables (backup to MCP firewall),
+                        # on every host in SSH_FLEET_HOSTS at once
+                        result = await ssh_actions.block_ip_fleet(event.source_ip)
                     
                     actions.append(ActionResponse(
                         success=result.get("success", False),
                         action_taken="ssh_block_ip_iptables",
                         tool_used="ssh_iptables",
-                        result=json.dumps(result)
+                        result=orjson.dumps(result).decode()
                     ))
-                    logger.warning(f"Additional iptables block applied via SSH for {event.source_ip}")
+                    logger.warning("Additional iptables block applied via SSH for %s", event.source_ip)
                 except Exception as e:
-                    logger.error(f"SSH IP block failed: {e}")
+                    logger.error("SSH IP block failed: %s", e)
             
         except Exception as e:
-            logger.error(f"SSH defensive actions failed: {e}")
+            logger.error("SSH defensive actions failed: %s", e)
             actions.append(ActionResponse(
                 success=False,
                 action_taken="ssh_defensive_actions",